@@ -2,4 +2,6 @@
 
 alembic upgrade head
 
-gunicorn src.main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-4}
+
+gunicorn src.main:app --workers $WEB_CONCURRENCY --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
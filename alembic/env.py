@@ -3,9 +3,11 @@ import sys
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config, pool
+from sqlalchemy.engine import make_url
 
 from alembic import context
 from src.apps.models import Base
+from src.db import SHARD_COUNT, shard_database
 
 sys.path.append(os.path.join(sys.path[0], "src"))
 
@@ -18,6 +20,14 @@ if config.config_file_name is not None:
 target_metadata = Base.metadata
 
 
+def include_name(name, type_, parent_names):
+    # Служебные таблицы (например, users_fts и её теневые таблицы) создаются
+    # миграциями вручную и не описаны в моделях: autogenerate их не трогает.
+    if type_ == "table":
+        return name in target_metadata.tables
+    return True
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -35,6 +45,7 @@ def run_migrations_offline() -> None:
         url=url,
         target_metadata=target_metadata,
         literal_binds=True,
+        include_name=include_name,
         dialect_opts={"paramstyle": "named"},
     )
 
@@ -42,6 +53,20 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
+def shard_urls() -> list:
+    """URL всех шардов базы из sqlalchemy.url.
+
+    Число шардов берётся из SHARD_COUNT или из -x shards=N (например, чтобы
+    подготовить файлы под новое число шардов перед src/data/reshard.py).
+    """
+    url = make_url(config.get_main_option("sqlalchemy.url"))
+    count = int(context.get_x_argument(as_dictionary=True).get("shards", SHARD_COUNT))
+    return [
+        url.set(database=shard_database(index, count, url.database))
+        for index in range(count)
+    ]
+
+
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode.
 
@@ -49,17 +74,24 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
-
-        with context.begin_transaction():
-            context.run_migrations()
+    # Каждый шард мигрируется отдельно, по очереди.
+    for url in shard_urls():
+        connectable = engine_from_config(
+            config.get_section(config.config_ini_section, {}),
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
+            url=url,
+        )
+
+        with connectable.connect() as connection:
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                include_name=include_name,
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
 
 
 if context.is_offline_mode():
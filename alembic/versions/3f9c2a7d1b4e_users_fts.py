@@ -0,0 +1,66 @@
+"""users-fts
+
+Revision ID: 3f9c2a7d1b4e
+Revises: 6e60b5ec6dd9
+Create Date: 2026-10-17 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f9c2a7d1b4e"
+down_revision: Union[str, None] = "6e60b5ec6dd9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Внешний FTS5-индекс (trigram) по username и email. Содержимое хранится
+    # только в users, индекс синхронизируется триггерами.
+    op.execute(
+        """
+        CREATE VIRTUAL TABLE users_fts USING fts5(
+            username,
+            email,
+            content='users',
+            content_rowid='id',
+            tokenize='trigram'
+        )
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_fts_ai AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts(rowid, username, email)
+            VALUES (new.id, new.username, new.email);
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_fts_ad AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts(users_fts, rowid, username, email)
+            VALUES ('delete', old.id, old.username, old.email);
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_fts_au AFTER UPDATE OF username, email ON users BEGIN
+            INSERT INTO users_fts(users_fts, rowid, username, email)
+            VALUES ('delete', old.id, old.username, old.email);
+            INSERT INTO users_fts(rowid, username, email)
+            VALUES (new.id, new.username, new.email);
+        END
+        """
+    )
+    op.execute("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS users_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS users_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS users_fts_ai")
+    op.execute("DROP TABLE IF EXISTS users_fts")
@@ -0,0 +1,51 @@
+"""users-indexes
+
+Revision ID: 8b41d6e2c9a5
+Revises: 3f9c2a7d1b4e
+Create Date: 2026-10-17 11:40:08.716254
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8b41d6e2c9a5"
+down_revision: Union[str, None] = "3f9c2a7d1b4e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Каждый индекс SQLite неявно заканчивается rowid (= users.id), поэтому
+# индекс по (col) отдаёт строки в порядке ORDER BY col, id, который
+# строит sorted_query, а (is_active, col) — тот же порядок под фильтром
+# filter_active.
+SORT_INDEXES = {
+    "ix_users_username": ["username"],
+    "ix_users_email": ["email"],
+    "ix_users_is_active": ["is_active"],
+    "ix_users_is_superuser": ["is_superuser"],
+    "ix_users_is_verified": ["is_verified"],
+    "ix_users_is_active_username": ["is_active", "username"],
+    "ix_users_is_active_email": ["is_active", "email"],
+    "ix_users_is_active_is_superuser": ["is_active", "is_superuser"],
+    "ix_users_is_active_is_verified": ["is_active", "is_verified"],
+}
+
+
+def upgrade() -> None:
+    # ix_users_id дублирует первичный ключ (rowid) и только замедляет запись.
+    op.drop_index("ix_users_id", table_name="users")
+    for name, columns in SORT_INDEXES.items():
+        op.create_index(name, "users", columns, unique=False)
+    op.create_index(
+        "ix_users_lower_username", "users", [sa.text("lower(username)")], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_lower_username", table_name="users")
+    for name in reversed(list(SORT_INDEXES)):
+        op.drop_index(name, table_name="users")
+    op.create_index("ix_users_id", "users", ["id"], unique=False)
@@ -0,0 +1,39 @@
+"""users-flag-indexes
+
+Revision ID: a4f7c2e9d3b1
+Revises: e8c3b5a1f0d4
+Create Date: 2026-10-17 21:05:31.584120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a4f7c2e9d3b1"
+down_revision: Union[str, None] = "e8c3b5a1f0d4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Те же индексы (флаг, поле сортировки), что и для filter_active в
+# 8b41d6e2c9a5, для фильтров filter_superuser и filter_verified.
+FLAG_INDEXES = {
+    "ix_users_is_superuser_username": ["is_superuser", "username"],
+    "ix_users_is_superuser_email": ["is_superuser", "email"],
+    "ix_users_is_superuser_is_active": ["is_superuser", "is_active"],
+    "ix_users_is_superuser_is_verified": ["is_superuser", "is_verified"],
+    "ix_users_is_verified_username": ["is_verified", "username"],
+    "ix_users_is_verified_email": ["is_verified", "email"],
+    "ix_users_is_verified_is_active": ["is_verified", "is_active"],
+    "ix_users_is_verified_is_superuser": ["is_verified", "is_superuser"],
+}
+
+
+def upgrade() -> None:
+    for name, columns in FLAG_INDEXES.items():
+        op.create_index(name, "users", columns, unique=False)
+
+
+def downgrade() -> None:
+    for name in reversed(list(FLAG_INDEXES)):
+        op.drop_index(name, table_name="users")
@@ -0,0 +1,88 @@
+"""users-version
+
+Revision ID: c5d1e8f3a7b2
+Revises: 8b41d6e2c9a5
+Create Date: 2026-10-17 14:02:51.380417
+
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c5d1e8f3a7b2"
+down_revision: Union[str, None] = "8b41d6e2c9a5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Версия таблицы растёт на каждой вставке, изменении и удалении, а строка
+# при вставке и изменении получает текущую версию таблицы. Поэтому версии
+# строк монотонны и уникальны, а версия таблицы — это max(version) с учётом
+# удалений, которая читается одной строкой.
+BUMP_TABLE = """
+    UPDATE users_version
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP;
+"""
+BUMP_ROW = BUMP_TABLE + """
+    UPDATE users
+    SET version = (SELECT version FROM users_version),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = new.id;
+"""
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.add_column("users", sa.Column("updated_at", sa.DateTime(), nullable=True))
+    op.execute("UPDATE users SET version = id, updated_at = CURRENT_TIMESTAMP")
+    op.execute(
+        """
+        CREATE TABLE users_version (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL,
+            updated_at DATETIME NOT NULL
+        )
+        """
+    )
+    op.execute(
+        "INSERT INTO users_version (id, version, updated_at) "
+        "SELECT 0, COALESCE(MAX(version), 0), CURRENT_TIMESTAMP FROM users"
+    )
+    op.execute(
+        f"""
+        CREATE TRIGGER users_version_ai AFTER INSERT ON users BEGIN
+            {BUMP_ROW}
+        END
+        """
+    )
+    # Условие пропускает вложенный UPDATE самого триггера и явную запись version.
+    op.execute(
+        f"""
+        CREATE TRIGGER users_version_au AFTER UPDATE ON users
+        WHEN new.version = old.version BEGIN
+            {BUMP_ROW}
+        END
+        """
+    )
+    op.execute(
+        f"""
+        CREATE TRIGGER users_version_ad AFTER DELETE ON users BEGIN
+            {BUMP_TABLE}
+        END
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS users_version_ad")
+    op.execute("DROP TRIGGER IF EXISTS users_version_au")
+    op.execute("DROP TRIGGER IF EXISTS users_version_ai")
+    op.execute("DROP TABLE IF EXISTS users_version")
+    # batch_alter_table пересоздал бы users и потерял триггеры FTS.
+    op.execute("ALTER TABLE users DROP COLUMN updated_at")
+    op.execute("ALTER TABLE users DROP COLUMN version")
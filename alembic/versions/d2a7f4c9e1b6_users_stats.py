@@ -0,0 +1,92 @@
+"""users-stats
+
+Revision ID: d2a7f4c9e1b6
+Revises: c5d1e8f3a7b2
+Create Date: 2026-10-17 16:41:07.915263
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d2a7f4c9e1b6"
+down_revision: Union[str, None] = "c5d1e8f3a7b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Все восемь сочетаний флагов заводятся заранее, поэтому триггерам достаточно
+# UPDATE по первичному ключу.
+DECREMENT = """
+    UPDATE users_stats SET count = count - 1
+    WHERE is_active = old.is_active
+        AND is_verified = old.is_verified
+        AND is_superuser = old.is_superuser;
+"""
+INCREMENT = """
+    UPDATE users_stats SET count = count + 1
+    WHERE is_active = new.is_active
+        AND is_verified = new.is_verified
+        AND is_superuser = new.is_superuser;
+"""
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE users_stats (
+            is_active BOOLEAN NOT NULL,
+            is_verified BOOLEAN NOT NULL,
+            is_superuser BOOLEAN NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (is_active, is_verified, is_superuser)
+        ) WITHOUT ROWID
+        """
+    )
+    op.execute(
+        """
+        WITH flag(value) AS (VALUES (0), (1))
+        INSERT INTO users_stats (is_active, is_verified, is_superuser, count)
+        SELECT a.value, v.value, s.value, (
+            SELECT COUNT(*) FROM users
+            WHERE is_active = a.value
+                AND is_verified = v.value
+                AND is_superuser = s.value
+        )
+        FROM flag a, flag v, flag s
+        """
+    )
+    op.execute(
+        f"""
+        CREATE TRIGGER users_stats_ai AFTER INSERT ON users BEGIN
+            {INCREMENT}
+        END
+        """
+    )
+    op.execute(
+        f"""
+        CREATE TRIGGER users_stats_au
+        AFTER UPDATE OF is_active, is_verified, is_superuser ON users
+        WHEN old.is_active IS NOT new.is_active
+            OR old.is_verified IS NOT new.is_verified
+            OR old.is_superuser IS NOT new.is_superuser
+        BEGIN
+            {DECREMENT}
+            {INCREMENT}
+        END
+        """
+    )
+    op.execute(
+        f"""
+        CREATE TRIGGER users_stats_ad AFTER DELETE ON users BEGIN
+            {DECREMENT}
+        END
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS users_stats_ad")
+    op.execute("DROP TRIGGER IF EXISTS users_stats_au")
+    op.execute("DROP TRIGGER IF EXISTS users_stats_ai")
+    op.execute("DROP TABLE IF EXISTS users_stats")
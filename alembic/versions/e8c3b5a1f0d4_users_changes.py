@@ -0,0 +1,76 @@
+"""users-changes
+
+Revision ID: e8c3b5a1f0d4
+Revises: d2a7f4c9e1b6
+Create Date: 2026-10-17 19:20:44.102958
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e8c3b5a1f0d4"
+down_revision: Union[str, None] = "d2a7f4c9e1b6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # AUTOINCREMENT: номера не переиспользуются после удаления записей
+    # при сжатии журнала, поэтому seq монотонен.
+    op.execute(
+        """
+        CREATE TABLE users_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+            changed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    # Наибольший seq, удалённый по сроку хранения: читать журнал с меньшего
+    # номера уже нельзя.
+    op.execute(
+        """
+        CREATE TABLE users_changes_floor (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            seq INTEGER NOT NULL
+        )
+        """
+    )
+    op.execute("INSERT INTO users_changes_floor (id, seq) VALUES (0, 0)")
+    op.execute(
+        """
+        CREATE TRIGGER users_changes_ai AFTER INSERT ON users BEGIN
+            INSERT INTO users_changes (user_id, op) VALUES (new.id, 'insert');
+        END
+        """
+    )
+    # Изменение только служебных столбцов version и updated_at (их пишет
+    # триггер users_version_au) в журнал не попадает.
+    op.execute(
+        """
+        CREATE TRIGGER users_changes_au
+        AFTER UPDATE OF email, username, hashed_password, avatar, phone_number,
+            is_active, is_superuser, is_verified ON users
+        BEGIN
+            INSERT INTO users_changes (user_id, op) VALUES (new.id, 'update');
+        END
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_changes_ad AFTER DELETE ON users BEGIN
+            INSERT INTO users_changes (user_id, op) VALUES (old.id, 'delete');
+        END
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS users_changes_ad")
+    op.execute("DROP TRIGGER IF EXISTS users_changes_au")
+    op.execute("DROP TRIGGER IF EXISTS users_changes_ai")
+    op.execute("DROP TABLE IF EXISTS users_changes_floor")
+    op.execute("DROP TABLE IF EXISTS users_changes")
@@ -1,82 +1,236 @@
-from typing import List
-
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi import (APIRouter, Depends, HTTPException, Query, Request,
+                     Response, status)
+from fastapi.responses import StreamingResponse
+from fastapi_users import exceptions
 from sqlalchemy.engine.cursor import CursorResult
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.sql import text
+from sqlalchemy.sql import bindparam, text
 
 from src.apps import schemas
 from src.apps.models import UserTable
-from src.db import get_async_session
+from src.db import (SHARD_COUNT, shard_index, shard_read_session_makers,
+                    use_read_session)
 from src.logger import logger
 from src.services.auth import current_user
-from src.services.sorted import sorted_query
+from src.services.batch import BATCH_MAX_SIZE, parse_ids
+from src.services.cache import invalidate_user, user_cache
+from src.services.changes import (DEFAULT_CHANGES_LIMIT, MAX_CHANGES_LIMIT,
+                                  ChangesExpired, change_events, changes_floor,
+                                  read_changes)
+from src.services.coherence import generations
+from src.services.conditional import conditional_response, list_etag, user_etag
+from src.services.export import MEDIA_TYPES, export_rows
+from src.services.manager import UserManager, get_user_manager
+from src.services.pagination import (DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+                                     decode_cursor, encode_cursor)
+from src.services.readmodel import read_model
+from src.services.search import (DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT,
+                                 search_key, search_query_sql)
+from src.services.serialize import (Payload, json_response, payload_response,
+                                    user_batch_response, user_response,
+                                    users_payload)
+from src.services.shards import (email_taken, group_by_shard, merge_sorted,
+                                 scatter, sharded_table_version, sort_key)
+from src.services.singleflight import list_flight, search_flight, user_flight
+from src.services.sorted import (CACHED_COLUMNS, filter_conditions,
+                                 keyset_parameters, parse_fields, parse_sort,
+                                 sort_string, users_query)
+from src.services.stats import STATS_SQL, user_stats
+from src.services.writer import shard_writer, write_schedulers
 
 router_user = APIRouter(
     tags=["Users"],
     prefix="/users",
+    dependencies=[Depends(use_read_session)],
 )
 
 
+async def _load_user(user_id: int) -> Optional[Dict[str, Any]]:
+    """Читает профиль пользователя через кэш user_cache из шарда пользователя.
+
+    Одновременные промахи кэша по одному id выполняют один запрос к базе.
+    """
+    user_dict = user_cache.get(user_id)
+    if user_dict is not None:
+        return user_dict
+    stamp = user_cache.stamp(user_id)
+    # Поколение в ключе: запрос после изменения строки не ждёт старый вызов.
+    return await user_flight.do((user_id, stamp), lambda: _select_user(user_id, stamp))
+
+
+async def _select_user(user_id: int, stamp: Any) -> Optional[Dict[str, Any]]:
+    query = text(
+        f"""
+        SELECT {CACHED_COLUMNS}
+        FROM users
+        WHERE id=:id
+        """
+    ).bindparams(id=user_id)
+    async with shard_read_session_makers[shard_index(user_id)]() as session:
+        row: CursorResult = await session.execute(query)
+        user_row = row.mappings().fetchone()
+    if user_row is None:
+        return None
+    user_dict = dict(user_row)
+    user_cache.set(user_id, user_dict, stamp=stamp)
+    return user_dict
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        logger.info(str(e), extra={"status_code": 400})
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router_user.get(
     "/",
     status_code=status.HTTP_200_OK,
     response_model=List[schemas.UserSchema],
 )
 async def get_all_users(
-    session: AsyncSession = Depends(get_async_session),
+    request: Request,
+    response: Response,
     filter_username: str = Query(None, description="Фильтр по имени пользователя"),
     filter_active: bool = Query(None, description="Фильтр по активности"),
-    sort_by: str = Query(None, description="Поле для сортировки"),
+    filter_superuser: bool = Query(
+        None, description="Фильтр по правам суперпользователя"
+    ),
+    filter_verified: bool = Query(None, description="Фильтр по подтверждению"),
+    sort_by: str = Query(
+        None, description="Поля сортировки через запятую, -поле — по убыванию"
+    ),
+    limit: int = Query(
+        None, ge=1, le=MAX_PAGE_SIZE, description="Размер страницы (постранично)"
+    ),
+    cursor: str = Query(None, description="Курсор следующей страницы"),
+    fields: str = Query(
+        None, description="Поля ответа через запятую, например id,username"
+    ),
 ):
     """
     Получение списка всех пользователей.
 
+    Если задан limit или cursor, список отдаётся постранично: страница
+    выбирается по ключу (sort_by, id) без OFFSET, а курсор следующей
+    страницы возвращается в заголовке X-Next-Cursor.
+
+    ETag и Last-Modified берутся из версии таблицы users_version: если список
+    не менялся, на условный запрос отдаётся 304 без выполнения выборки.
+
+    При нескольких шардах (SHARD_COUNT) выборка выполняется во всех шардах
+    параллельно, а отсортированные ответы сливаются. При включённой модели
+    чтения (READ_MODEL=1) список с сортировкой по одному полю отдаётся
+    из памяти процесса без обращения к базе.
+
     Args:
-        session (AsyncSession, optional): Асинхронная сессия SQLAlchemy.
+        request (Request): Текущий запрос с заголовками If-None-Match
+            и If-Modified-Since.
+        response (Response): Ответ, в который добавляются X-Next-Cursor,
+            ETag и Last-Modified.
         filter_username (str, optional): Фильтр по имени пользователя.
         filter_active (bool, optional): Фильтр по активности.
-        sort_by (str, optional): Поле для сортировки.
+        filter_superuser (bool, optional): Фильтр по правам суперпользователя.
+        filter_verified (bool, optional): Фильтр по подтверждению.
+        sort_by (str, optional): Поля сортировки, например "username,-email".
+        limit (int, optional): Размер страницы.
+        cursor (str, optional): Курсор, полученный с предыдущей страницы.
+        fields (str, optional): Поля ответа; из базы читаются только они
+            и ключи сортировки.
 
     Returns:
-        List[schemas.UserSchema]: Список моделей данных всех пользователей в системе.
+        List[schemas.UserSchema]: Список моделей данных всех пользователей в системе
+        или ответ 304, если список не изменился.
+
+    Raises:
+        HTTPException: Если курсор, поле сортировки или fields некорректны.
     """
-    sql_query = text(
-        """
-        SELECT id, username, email, avatar, phone_number, is_active, is_superuser, is_verified
-        FROM users
-        """
+    filters, parameters = filter_conditions(
+        filter_username, filter_active, filter_superuser, filter_verified
     )
-    sql_query = sorted_query(sort_by)
-    parameters = {}
-
-    if filter_username:
-        sql_query += " WHERE LOWER(username) = LOWER(:filter_username)"
-        parameters["filter_username"] = filter_username
-
-    if filter_active is not None:
-        if "WHERE" in sql_query:
-            sql_query += " AND is_active = :filter_active"
-        else:
-            sql_query += " WHERE is_active = :filter_active"
-        parameters["filter_active"] = filter_active
     try:
-        result = await session.execute(text(sql_query), parameters)
-        user_dicts = result.mappings().fetchall()
-        users = [
-            schemas.UserSchema(
-                id=user_dict["id"],
-                username=user_dict["username"],
-                email=user_dict["email"],
-                avatar=user_dict["avatar"],
-                phone_number=user_dict["phone_number"],
-                is_active=user_dict["is_active"],
-                is_superuser=user_dict["is_superuser"],
-                is_verified=user_dict["is_verified"],
-            )
-            for user_dict in user_dicts
-        ]
-        return users
+        sort = parse_sort(sort_by)
+    except ValueError as e:
+        logger.info(str(e), extra={"status_code": 400})
+        raise HTTPException(status_code=400, detail=str(e))
+    selected = _parse_fields(fields)
+
+    paginated = limit is not None or cursor is not None
+    if paginated:
+        limit = limit or DEFAULT_PAGE_SIZE
+        # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница.
+        parameters["limit"] = limit + 1
+        if cursor is not None:
+            try:
+                cursor_keys, cursor_id = decode_cursor(cursor, sort)
+            except ValueError as e:
+                logger.info(str(e), extra={"status_code": 400})
+                raise HTTPException(status_code=400, detail=str(e))
+            parameters.update(keyset_parameters(sort, cursor_keys, cursor_id))
+    try:
+        in_memory = read_model.ready and read_model.supports(sort)
+        if in_memory:
+            await read_model.ensure_fresh()
+            version, updated_at = read_model.version, read_model.updated_at
+        else:
+            version, updated_at = await sharded_table_version()
+        not_modified = conditional_response(
+            request, response, list_etag(version), updated_at
+        )
+        if not_modified is not None:
+            return not_modified
+
+        async def load_page() -> Tuple[Payload, Optional[str]]:
+            if in_memory:
+                user_dicts = read_model.select(
+                    filters,
+                    parameters,
+                    sort,
+                    (cursor_keys, cursor_id) if cursor is not None else None,
+                    parameters.get("limit"),
+                )
+            else:
+                query = users_query(
+                    filters,
+                    sort,
+                    keyset=cursor is not None,
+                    limit=paginated,
+                    fields=selected,
+                )
+
+                async def select_users(session: AsyncSession):
+                    result = await session.execute(query, parameters)
+                    return result.mappings().fetchall()
+
+                user_dicts = merge_sorted(
+                    await scatter(select_users),
+                    sort_key(sort),
+                    parameters.get("limit"),
+                )
+            next_cursor = None
+            if paginated and len(user_dicts) > limit:
+                user_dicts = user_dicts[:limit]
+                next_cursor = encode_cursor(sort, user_dicts[-1])
+            return users_payload(user_dicts, "get_all_users", selected), next_cursor
+
+        # Одинаковые одновременные запросы к той же версии таблицы получают
+        # одно сериализованное тело.
+        flight_key = (
+            version,
+            sort_string(sort),
+            tuple(sorted(parameters.items())),
+            selected,
+            paginated,
+        )
+        payload, next_cursor = await list_flight.do(flight_key, load_page)
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return payload_response(payload, response)
     except Exception as e:
         logger.error(f"Error in get_all_users: {str(e)}")
         raise HTTPException(
@@ -85,82 +239,461 @@ async def get_all_users(
         )
 
 
+@router_user.get("/export", status_code=status.HTTP_200_OK)
+async def export_users(
+    filter_username: str = Query(None, description="Фильтр по имени пользователя"),
+    filter_active: bool = Query(None, description="Фильтр по активности"),
+    filter_superuser: bool = Query(
+        None, description="Фильтр по правам суперпользователя"
+    ),
+    filter_verified: bool = Query(None, description="Фильтр по подтверждению"),
+    sort_by: str = Query(
+        None, description="Поля сортировки через запятую, -поле — по убыванию"
+    ),
+    export_format: str = Query(
+        "ndjson",
+        alias="format",
+        pattern="^(ndjson|csv)$",
+        description="Формат выгрузки",
+    ),
+):
+    """
+    Потоковая выгрузка пользователей в формате NDJSON или CSV.
+
+    Строки читаются из базы порциями и сразу отправляются клиенту,
+    поэтому расход памяти не зависит от размера таблицы.
+
+    Args:
+        filter_username (str, optional): Фильтр по имени пользователя.
+        filter_active (bool, optional): Фильтр по активности.
+        filter_superuser (bool, optional): Фильтр по правам суперпользователя.
+        filter_verified (bool, optional): Фильтр по подтверждению.
+        sort_by (str, optional): Поля сортировки, например "username,-email".
+        export_format (str, optional): Формат выгрузки: ndjson или csv.
+
+    Returns:
+        StreamingResponse: Поток строк с данными пользователей.
+
+    Raises:
+        HTTPException: Если указано некорректное поле для сортировки.
+    """
+    filters, parameters = filter_conditions(
+        filter_username, filter_active, filter_superuser, filter_verified
+    )
+    try:
+        sort = parse_sort(sort_by)
+    except ValueError as e:
+        logger.info(str(e), extra={"status_code": 400})
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        export_rows(users_query(filters, sort), parameters, export_format, sort),
+        media_type=MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="users.{export_format}"'
+        },
+    )
+
+
+@router_user.get(
+    "/stats",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.UserStats,
+)
+async def get_users_stats(request: Request, response: Response):
+    """
+    Количество пользователей по флагам активности, подтверждения и прав.
+
+    Счётчики хранятся в таблице users_stats и поддерживаются триггерами,
+    поэтому запрос читает восемь строк независимо от размера users.
+
+    Args:
+        request (Request): Текущий запрос с условными заголовками.
+        response (Response): Ответ, в который добавляются ETag и Last-Modified.
+
+    Returns:
+        schemas.UserStats: Итоги и разбивка по сочетаниям флагов
+        или ответ 304, если таблица не менялась.
+    """
+    version, updated_at = await sharded_table_version()
+    not_modified = conditional_response(
+        request, response, list_etag(version, "stats"), updated_at
+    )
+    if not_modified is not None:
+        return not_modified
+
+    async def select_stats(session: AsyncSession):
+        rows = await session.execute(text(STATS_SQL))
+        return rows.mappings().fetchall()
+
+    shards = await scatter(select_stats)
+    return user_stats(row for rows in shards for row in rows)
+
+
+CHANGES_EXPIRED_DETAIL = "Changes before since were compacted, resync required"
+
+
+@router_user.get(
+    "/changes",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.UserChanges,
+)
+async def get_users_changes(
+    since: int = Query(0, ge=0, description="Последний полученный номер изменения"),
+    limit: int = Query(
+        DEFAULT_CHANGES_LIMIT,
+        ge=1,
+        le=MAX_CHANGES_LIMIT,
+        description="Максимальное количество изменений",
+    ),
+    shard: int = Query(0, ge=0, lt=SHARD_COUNT, description="Номер шарда"),
+):
+    """
+    Изменения пользователей после номера since из журнала users_changes.
+
+    Журнал и номера изменений у каждого шарда свои: при нескольких шардах
+    зеркало читает журнал каждого шарда отдельно (параметр shard).
+
+    Для insert и update в user передаётся текущее состояние пользователя
+    (null, если он уже удалён — тогда ниже по журналу будет delete).
+    Следующий запрос нужно выполнять с since=last_seq.
+
+    Args:
+        since (int, optional): Последний полученный номер изменения.
+        limit (int, optional): Максимальное количество изменений.
+        shard (int, optional): Номер шарда.
+
+    Returns:
+        schemas.UserChanges: Изменения, номер последнего из них (last_seq),
+        последний номер в журнале (head) и признак has_more.
+
+    Raises:
+        HTTPException: 410, если изменения после since уже удалены сжатием журнала.
+    """
+    try:
+        async with shard_read_session_makers[shard]() as session:
+            entries, head, more = await read_changes(session, since, limit)
+    except ChangesExpired:
+        logger.info(CHANGES_EXPIRED_DETAIL, extra={"status_code": 410})
+        raise HTTPException(status_code=410, detail=CHANGES_EXPIRED_DETAIL)
+    return json_response(
+        orjson.dumps(
+            {
+                "changes": entries,
+                "last_seq": entries[-1]["seq"] if entries else since,
+                "head": head,
+                "has_more": more,
+            }
+        )
+    )
+
+
+@router_user.get("/changes/stream", status_code=status.HTTP_200_OK)
+async def stream_users_changes(
+    request: Request,
+    since: int = Query(0, ge=0, description="Последний полученный номер изменения"),
+    shard: int = Query(0, ge=0, lt=SHARD_COUNT, description="Номер шарда"),
+):
+    """
+    Поток изменений пользователей шарда в формате Server-Sent Events.
+
+    Каждое событие содержит id (номер изменения), event (insert, update
+    или delete) и data — запись в том же виде, что в /users/changes.
+    При переподключении номер берётся из заголовка Last-Event-ID.
+
+    Args:
+        request (Request): Текущий запрос.
+        since (int, optional): Последний полученный номер изменения.
+        shard (int, optional): Номер шарда.
+
+    Returns:
+        StreamingResponse: Поток событий text/event-stream.
+
+    Raises:
+        HTTPException: 410, если изменения после since уже удалены сжатием журнала.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id is not None and last_event_id.isdigit():
+        since = int(last_event_id)
+    # Отдельная короткая сессия: сессия запроса жила бы всё время потока.
+    async with shard_read_session_makers[shard]() as session:
+        floor = await changes_floor(session)
+    if since < floor:
+        logger.info(CHANGES_EXPIRED_DETAIL, extra={"status_code": 410})
+        raise HTTPException(status_code=410, detail=CHANGES_EXPIRED_DETAIL)
+    return StreamingResponse(
+        change_events(since, shard),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _batch_ids(ids: List[str]) -> List[int]:
+    try:
+        return parse_ids(ids)
+    except ValueError as e:
+        logger.info(str(e), extra={"status_code": 400})
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router_user.get(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.UserBatch,
+)
+async def get_users_batch(
+    ids: List[str] = Query(..., description="Идентификаторы пользователей"),
+):
+    """
+    Получение нескольких пользователей по списку ID одним запросом.
+
+    Args:
+        ids (List[str]): Идентификаторы: ids=1&ids=2 или ids=1,2.
+
+    Returns:
+        schemas.UserBatch: Найденные пользователи в порядке запроса
+        и список ненайденных ID.
+
+    Raises:
+        HTTPException: Если ID некорректны или их больше BATCH_MAX_SIZE.
+    """
+    user_ids = _batch_ids(ids)
+    found = {}
+    stamps = {}
+    for user_id in user_ids:
+        user_dict = user_cache.get(user_id)
+        if user_dict is not None:
+            found[user_id] = user_dict
+        else:
+            stamps[user_id] = user_cache.stamp(user_id)
+    if stamps:
+        query = text(
+            f"""
+            SELECT {CACHED_COLUMNS}
+            FROM users
+            WHERE id IN :ids
+            """
+        ).bindparams(bindparam("ids", expanding=True))
+
+        async def select_users(shard: int, shard_ids: List[int]):
+            async with shard_read_session_makers[shard]() as session:
+                rows = await session.execute(query, {"ids": shard_ids})
+                return rows.mappings().fetchall()
+
+        shards = await asyncio.gather(
+            *(
+                select_users(shard, shard_ids)
+                for shard, shard_ids in group_by_shard(stamps).items()
+            )
+        )
+        for user_row in (row for rows in shards for row in rows):
+            user_dict = dict(user_row)
+            found[user_dict["id"]] = user_dict
+            user_cache.set(user_dict["id"], user_dict, stamp=stamps[user_dict["id"]])
+    return user_batch_response(
+        [found[user_id] for user_id in user_ids if user_id in found],
+        [user_id for user_id in user_ids if user_id not in found],
+        "get_users_batch",
+    )
+
+
+@router_user.delete("/batch", response_model=schemas.UserBatchDeleted)
+async def delete_users_batch(
+    ids: List[str] = Query(..., description="Идентификаторы пользователей"),
+    user: UserTable = Depends(current_user),
+):
+    """
+    Удаление нескольких пользователей одной транзакцией в каждом шарде.
+
+    Права проверяются для каждого ID так же, как в delete_user_by_id:
+    если хотя бы один пользователь недоступен для удаления, не удаляется никто.
+
+    Args:
+        ids (List[str]): Идентификаторы: ids=1&ids=2 или ids=1,2.
+        user (UserTable): Текущий пользователь, авторизованный в системе.
+
+    Returns:
+        schemas.UserBatchDeleted: Удалённые и ненайденные ID.
+
+    Raises:
+        HTTPException: Если ID некорректны, их слишком много или не хватает прав.
+    """
+    user_ids = _batch_ids(ids)
+    if not user.is_superuser and any(user_id != user.id for user_id in user_ids):
+        logger.info("You don't have the rights to do this", extra={"status_code": 403})
+        raise HTTPException(
+            status_code=403, detail="You don't have the rights to do this."
+        )
+    query = text(
+        """
+        DELETE FROM users WHERE id IN :ids RETURNING id
+        """
+    ).bindparams(bindparam("ids", expanding=True))
+
+    def delete_users(shard_ids: List[int]):
+        async def job(write_session: AsyncSession) -> List[int]:
+            rows = await write_session.execute(query, {"ids": shard_ids})
+            return [row.id for row in rows]
+
+        return job
+
+    shards = await asyncio.gather(
+        *(
+            write_schedulers[shard].submit(delete_users(shard_ids))
+            for shard, shard_ids in group_by_shard(user_ids).items()
+        )
+    )
+    deleted = {user_id for shard_deleted in shards for user_id in shard_deleted}
+    for user_id in deleted:
+        invalidate_user(user_id)
+    return schemas.UserBatchDeleted(
+        deleted=[user_id for user_id in user_ids if user_id in deleted],
+        missing=[user_id for user_id in user_ids if user_id not in deleted],
+    )
+
+
+@router_user.post(
+    "/batch",
+    status_code=status.HTTP_200_OK,
+    response_model=schemas.UserBatchCreated,
+)
+async def create_users_batch(
+    user_creates: List[schemas.UserCreate],
+    request: Request,
+    user: UserTable = Depends(current_user),
+    user_manager: UserManager = Depends(get_user_manager),
+):
+    """
+    Создание нескольких пользователей (только для суперпользователей).
+
+    Args:
+        user_creates (List[schemas.UserCreate]): Данные создаваемых пользователей.
+        request (Request): Текущий запрос.
+        user (UserTable): Текущий пользователь, авторизованный в системе.
+        user_manager (UserManager): Менеджер пользователей.
+
+    Returns:
+        schemas.UserBatchCreated: Созданные пользователи и ошибки с индексами
+        записей во входном списке.
+
+    Raises:
+        HTTPException: Если пользователь не суперпользователь или записей
+        больше BATCH_MAX_SIZE.
+    """
+    if not user.is_superuser:
+        logger.info("You don't have the rights to do this", extra={"status_code": 403})
+        raise HTTPException(
+            status_code=403, detail="You don't have the rights to do this."
+        )
+    if len(user_creates) > BATCH_MAX_SIZE:
+        detail = f"No more than {BATCH_MAX_SIZE} users per request"
+        logger.info(detail, extra={"status_code": 400})
+        raise HTTPException(status_code=400, detail=detail)
+    results = await user_manager.create_batch(user_creates, request=request)
+    created = []
+    errors = []
+    for index, result in enumerate(results):
+        if isinstance(result, exceptions.UserAlreadyExists):
+            errors.append(
+                schemas.UserBatchError(index=index, detail="User already exists")
+            )
+        elif isinstance(result, exceptions.InvalidPasswordException):
+            errors.append(
+                schemas.UserBatchError(index=index, detail=str(result.reason))
+            )
+        elif isinstance(result, Exception):
+            errors.append(schemas.UserBatchError(index=index, detail="Integrity error"))
+        else:
+            created.append(schemas.UserSchema.model_validate(result))
+    return schemas.UserBatchCreated(created=created, errors=errors)
+
+
 @router_user.get(
     "/{id}/",
     status_code=status.HTTP_200_OK,
     response_model=schemas.UserSchema,
 )
-async def get_user_by_id(id: int, session: AsyncSession = Depends(get_async_session)):
+async def get_user_by_id(
+    id: int,
+    request: Request,
+    response: Response,
+    fields: str = Query(
+        None, description="Поля ответа через запятую, например id,username"
+    ),
+):
     """
     Получение информации о пользователе по его ID.
 
     Args:
         id (int): Идентификатор пользователя.
-        session (AsyncSession, optional): Асинхронная сессия SQLAlchemy.
+        request (Request): Текущий запрос с условными заголовками.
+        response (Response): Ответ, в который добавляются ETag и Last-Modified.
+        fields (str, optional): Поля ответа. Профиль читается целиком
+            через кэш user_cache, выборка применяется при сериализации.
 
     Returns:
-        schemas.UserSchema: Модель данных пользователя.
+        schemas.UserSchema: Модель данных пользователя или ответ 304,
+        если версия строки совпадает с If-None-Match.
 
     Raises:
-        HTTPException: Если пользователь с указанным ID не найден.
+        HTTPException: Если пользователь с указанным ID не найден
+        или fields некорректен.
     """
-    query = text(
-        """
-            SELECT id, username, email, avatar, phone_number, is_active, is_superuser, is_verified
-            FROM users
-            WHERE id=:id
-            """
-    ).bindparams(id=id)
-    row: CursorResult = await session.execute(query)
-    user_row = row.mappings().fetchone()
-    if user_row is None:
+    selected = _parse_fields(fields)
+    user_dict = await _load_user(id)
+    if user_dict is None:
         logger.info("User not found", extra={"status_code": 404})
         raise HTTPException(status_code=404, detail="User not found")
-    user_dict = dict(user_row)
-    user_schema = schemas.UserSchema(**user_dict)
-    return user_schema
+    not_modified = conditional_response(
+        request, response, user_etag(user_dict), user_dict["updated_at"]
+    )
+    if not_modified is not None:
+        return not_modified
+    return user_response(user_dict, "get_user_by_id", response, selected)
 
 
 @router_user.get("/me", response_model=schemas.UserSchema)
 async def get_current_user(
+    request: Request,
+    response: Response,
+    fields: str = Query(
+        None, description="Поля ответа через запятую, например id,username"
+    ),
     user: UserTable = Depends(current_user),
-    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Получение информации о текущем пользователе.
 
+    Строка пользователя уже загружена зависимостью current_user,
+    поэтому повторный запрос к базе не выполняется.
+
     Args:
+        request (Request): Текущий запрос с условными заголовками.
+        response (Response): Ответ, в который добавляются ETag и Last-Modified.
+        fields (str, optional): Поля ответа.
         user (UserTable): Текущий авторизованный пользователь.
-        session (AsyncSession, optional): Асинхронная сессия SQLAlchemy.
 
     Returns:
-        schemas.UserSchema: Модель данных текущего пользователя.
+        schemas.UserSchema: Модель данных текущего пользователя или ответ 304.
 
     Raises:
-        HTTPException: Если текущий пользователь не найден.
+        HTTPException: Если fields некорректен.
     """
-    query = text(
-        """
-        SELECT id, email, username, avatar, phone_number, is_active, is_superuser, is_verified
-        FROM users
-        WHERE id=:user_id
-        """
-    ).bindparams(user_id=user.id)
-    row: CursorResult = await session.execute(query)
-    user_row = row.mappings().fetchone()
-    if user_row is None:
-        logger.info("User not found", extra={"status_code": 404})
-        raise HTTPException(status_code=404, detail="User not found")
-    user_dict = dict(user_row)
-    user_schema = schemas.UserSchema(**user_dict)
-    return user_schema
+    selected = _parse_fields(fields)
+    not_modified = conditional_response(
+        request, response, user_etag(user), user.updated_at
+    )
+    if not_modified is not None:
+        return not_modified
+    if selected is not None:
+        user_dict = {field: getattr(user, field) for field in selected}
+        return user_response(user_dict, "get_current_user", response, selected)
+    return schemas.UserSchema.model_validate(user)
 
 
 @router_user.put("/me", response_model=schemas.UserSchema)
 async def update_current_user(
     user_update: schemas.UserUpdate,
     user: UserTable = Depends(current_user),
-    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Обновление информации о текущем пользователе.
@@ -168,13 +701,13 @@ async def update_current_user(
     Args:
         user_update (schemas.UserUpdate): Модель данных с обновленной информацией о пользователе.
         user (UserTable): Текущий авторизованный пользователь.
-        session (AsyncSession, optional): Асинхронная сессия SQLAlchemy.
 
     Returns:
         schemas.UserSchema: Модель данных обновленного пользователя.
 
     Raises:
-        HTTPException: Если обновление пользователя не удалось.
+        HTTPException: Если email занят другим пользователем (в любом шарде)
+        или обновление пользователя не удалось.
     """
     query = text(
         """
@@ -197,23 +730,33 @@ async def update_current_user(
         is_verified=user_update.is_verified,
         user_id=user.id,
     )
-    await session.execute(query)
-    await session.commit()
-    updated_user = await get_current_user(user=user, session=session)
-    return updated_user
+
+    async def update(write_session: AsyncSession) -> bool:
+        if await email_taken(write_session, user_update.email, user.id):
+            return False
+        await write_session.execute(query)
+        return True
+
+    if not await shard_writer(user.id).submit(update):
+        logger.info("Email is already taken", extra={"status_code": 400})
+        raise HTTPException(status_code=400, detail="Email is already taken")
+    invalidate_user(user.id)
+    user_dict = await _load_user(user.id)
+    if user_dict is None:
+        logger.info("User not found", extra={"status_code": 404})
+        raise HTTPException(status_code=404, detail="User not found")
+    return schemas.UserSchema(**user_dict)
 
 
 @router_user.delete("/me")
 async def delete_current_user(
     user: UserTable = Depends(current_user),
-    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Удаление текущего пользователя.
 
     Args:
         user (UserTable): Текущий авторизованный пользователь.
-        session (AsyncSession, optional): Асинхронная сессия SQLAlchemy.
 
     Returns:
         dict: Словарь с сообщением об успешном удалении текущего пользователя.
@@ -227,8 +770,10 @@ async def delete_current_user(
         """
     ).bindparams(user_id=user.id)
 
-    await session.execute(query)
-    await session.commit()
+    await shard_writer(user.id).submit(
+        lambda write_session: write_session.execute(query)
+    )
+    invalidate_user(user.id)
     return {"message": "User deleted"}
 
 
@@ -236,7 +781,6 @@ async def delete_current_user(
 async def delete_user_by_id(
     id: int,
     user: UserTable = Depends(current_user),
-    session: AsyncSession = Depends(get_async_session),
 ):
     """
     Удаление пользователя по ID.
@@ -244,7 +788,6 @@ async def delete_user_by_id(
     Args:
         id (int): Идентификатор пользователя, которого необходимо удалить.
         user (UserTable, optional): Текущий пользователь, авторизованный в системе.
-        session (AsyncSession, optional): Асинхронная сессия SQLAlchemy.
 
     Raises:
         HTTPException: Если текущий пользователь не является суперпользователем и не соответствует ID пользователя для удаления.
@@ -262,8 +805,8 @@ async def delete_user_by_id(
         DELETE FROM users WHERE id = :user_id
         """
     ).bindparams(user_id=id)
-    await session.execute(query)
-    await session.commit()
+    await shard_writer(id).submit(lambda write_session: write_session.execute(query))
+    invalidate_user(id)
     return {"message": "User deleted"}
 
 
@@ -274,42 +817,65 @@ async def delete_user_by_id(
 )
 async def search_users(
     search_query: str = Query(..., min_length=1, description="Search query"),
-    session: AsyncSession = Depends(get_async_session),
+    include_email: bool = Query(False, description="Искать также по email"),
+    limit: int = Query(
+        DEFAULT_SEARCH_LIMIT,
+        ge=1,
+        le=MAX_SEARCH_LIMIT,
+        description="Максимальное количество результатов",
+    ),
+    fields: str = Query(
+        None, description="Поля ответа через запятую, например id,username"
+    ),
 ):
     """
     Поиск пользователей по имени пользователя.
 
+    Запросы от трёх символов обслуживаются полнотекстовым индексом users_fts
+    (FTS5, trigram) и ранжируются по релевантности; более короткие
+    выполняются через LIKE. При нескольких шардах поиск выполняется во всех
+    параллельно, а ответы сливаются по id: оценки релевантности разных
+    шардов несравнимы, поэтому ранжирования по релевантности нет.
+    При включённой модели чтения (READ_MODEL=1) поиск по подстроке идёт
+    в памяти процесса, а результаты упорядочены по id.
+
     Args:
         search_query (str): Строка для поиска пользователей.
+        include_email (bool, optional): Искать подстроку также в email.
+        limit (int, optional): Максимальное количество результатов.
+        fields (str, optional): Поля ответа; из базы читаются только они.
 
     Returns:
         List[schemas.UserSchema]: Список найденных пользователей.
+
+    Raises:
+        HTTPException: Если fields некорректен или ничего не найдено.
     """
-    query = text(
-        """
-        SELECT * 
-        FROM users
-        WHERE username LIKE '%' || :search_query || '%'
-        """
-    )
-    rows: CursorResult = await session.execute(
-        query, {"search_query": f"%{search_query}%"}
-    )
-    user_list = []
-    for user_row in rows.fetchall():
-        user_dict = {
-            "id": user_row.id,
-            "email": user_row.email,
-            "username": user_row.username,
-            "avatar": user_row.avatar,
-            "phone_number": user_row.phone_number,
-            "is_active": user_row.is_active,
-            "is_superuser": user_row.is_superuser,
-            "is_verified": user_row.is_verified,
-        }
-        user_schema = schemas.UserSchema(**user_dict)
-        user_list.append(user_schema)
-    if not user_list:
+    selected = _parse_fields(fields)
+
+    async def run_search() -> Optional[Payload]:
+        if read_model.ready:
+            await read_model.ensure_fresh()
+            user_list = read_model.search(search_query, include_email, limit)
+        else:
+            ranked = SHARD_COUNT == 1
+            sql_query, parameters = search_query_sql(
+                search_query, include_email, limit, selected, ranked
+            )
+
+            async def select_users(session: AsyncSession):
+                rows: CursorResult = await session.execute(text(sql_query), parameters)
+                return rows.mappings().fetchall()
+
+            user_list = merge_sorted(
+                await scatter(select_users), search_key(search_query, ranked), limit
+            )
+        return users_payload(user_list, "search_users", selected) if user_list else None
+
+    # Счётчик изменений в ключе: поиск после записи не ждёт старый вызов.
+    flight_key = (generations.total(), search_query, include_email, limit, selected)
+    payload = await search_flight.do(flight_key, run_search)
+    if payload is None:
         logger.info(
             "There is no user with this name in the database.",
             extra={"status_code": 404},
@@ -317,4 +883,4 @@ async def search_users(
         raise HTTPException(
             status_code=404, detail="There is no user with this name in the database."
         )
-    return user_list
+    return payload_response(payload)
@@ -2,7 +2,7 @@ import re
 from typing import List
 
 from fastapi import HTTPException, status
-from sqlalchemy import Boolean, Column, Integer, String
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String, text
 from sqlalchemy.engine.cursor import CursorResult
 from sqlalchemy.exc import DatabaseError, IntegrityError, InternalError
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -16,8 +16,28 @@ Base = declarative_base()
 
 class UserTable(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_username", "username"),
+        Index("ix_users_email", "email"),
+        Index("ix_users_is_active", "is_active"),
+        Index("ix_users_is_superuser", "is_superuser"),
+        Index("ix_users_is_verified", "is_verified"),
+        Index("ix_users_is_active_username", "is_active", "username"),
+        Index("ix_users_is_active_email", "is_active", "email"),
+        Index("ix_users_is_active_is_superuser", "is_active", "is_superuser"),
+        Index("ix_users_is_active_is_verified", "is_active", "is_verified"),
+        Index("ix_users_is_superuser_username", "is_superuser", "username"),
+        Index("ix_users_is_superuser_email", "is_superuser", "email"),
+        Index("ix_users_is_superuser_is_active", "is_superuser", "is_active"),
+        Index("ix_users_is_superuser_is_verified", "is_superuser", "is_verified"),
+        Index("ix_users_is_verified_username", "is_verified", "username"),
+        Index("ix_users_is_verified_email", "is_verified", "email"),
+        Index("ix_users_is_verified_is_active", "is_verified", "is_active"),
+        Index("ix_users_is_verified_is_superuser", "is_verified", "is_superuser"),
+        Index("ix_users_lower_username", text("lower(username)")),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     email = Column(String, nullable=False)
     username = Column(String, nullable=False)
     hashed_password: str = Column(String(length=1024), nullable=False)
@@ -26,6 +46,8 @@ class UserTable(Base):
     is_active: bool = Column(Boolean, default=True, nullable=False)
     is_superuser: bool = Column(Boolean, default=False, nullable=False)
     is_verified: bool = Column(Boolean, default=False, nullable=False)
+    version: int = Column(Integer, server_default=text("1"), nullable=False)
+    updated_at = Column(DateTime, nullable=True)
 
     @validates("phone_number")
     def validate_phone_number(self, key, phone_number):
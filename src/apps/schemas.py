@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from fastapi_users import schemas
 from pydantic import BaseModel
@@ -40,3 +40,52 @@ class UserSchema(UserRead):
     is_active: bool = True
     is_superuser: bool = False
     is_verified: bool = False
+
+
+class UserBatch(BaseModel):
+    users: List[UserSchema]
+    missing: List[int]
+
+
+class UserBatchDeleted(BaseModel):
+    deleted: List[int]
+    missing: List[int]
+
+
+class UserBatchError(BaseModel):
+    index: int
+    detail: str
+
+
+class UserBatchCreated(BaseModel):
+    created: List[UserSchema]
+    errors: List[UserBatchError]
+
+
+class UserStatsGroup(BaseModel):
+    is_active: bool
+    is_verified: bool
+    is_superuser: bool
+    count: int
+
+
+class UserStats(BaseModel):
+    total: int
+    active: int
+    verified: int
+    superuser: int
+    groups: List[UserStatsGroup]
+
+
+class UserChange(BaseModel):
+    seq: int
+    op: str
+    id: int
+    user: Optional[UserSchema]
+
+
+class UserChanges(BaseModel):
+    changes: List[UserChange]
+    last_seq: int
+    head: int
+    has_more: bool
@@ -0,0 +1,84 @@
+"""Генерация синтетической таблицы users для нагрузочных тестов.
+
+Пример:
+    python src/bench/generate.py bench.sqlite --rows 1000000 --seed 1
+
+Схема создаётся миграциями alembic, строки вставляются загрузчиком
+load_sql пачками. У всех пользователей один пароль BENCH_PASSWORD (хеш
+считается один раз), id 1 — суперпользователь bench_admin.
+"""
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT)
+
+from alembic import command  # noqa: E402
+from alembic.config import Config  # noqa: E402
+from src.bench.users import BENCH_PASSWORD, iter_users  # noqa: E402
+from src.data.load_sql import Progress, connect, import_users  # noqa: E402
+
+DEFAULT_ROWS = 10000
+DEFAULT_BATCH_SIZE = 10000
+
+
+def create_schema(database: str) -> None:
+    config = Config()
+    config.set_main_option("script_location", os.path.join(ROOT, "alembic"))
+    config.set_main_option("sqlalchemy.url", f"sqlite:///{database}")
+    command.upgrade(config, "head")
+
+
+def hash_password(password: str) -> str:
+    from fastapi_users.password import PasswordHelper
+
+    return PasswordHelper().hash(password)
+
+
+def generate(
+    database: str,
+    rows: int = DEFAULT_ROWS,
+    seed: int = 0,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    hashed_password: Optional[str] = None,
+) -> Progress:
+    if os.path.exists(database):
+        raise FileExistsError(f"{database} already exists")
+    create_schema(database)
+    hashed_password = hashed_password or hash_password(BENCH_PASSWORD)
+    conn = connect(database)
+    try:
+        progress = import_users(
+            conn,
+            iter_users(rows, hashed_password, seed),
+            mode="insert",
+            batch_size=batch_size,
+            rebuild_indexes=True,
+        )
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return progress
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Генерация синтетической базы пользователей."
+    )
+    parser.add_argument("database", help="файл SQLite (не должен существовать)")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    progress = generate(args.database, args.rows, args.seed, args.batch_size)
+    progress.report("done")
+
+
+if __name__ == "__main__":
+    main()
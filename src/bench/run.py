@@ -0,0 +1,455 @@
+"""Нагрузочный прогон маршрутов /users и /auth.
+
+Пример:
+    python src/bench/generate.py bench.sqlite --rows 100000
+    python src/bench/run.py bench.sqlite --concurrency 32 --output result.json
+    python src/bench/run.py bench.sqlite --baseline result.json
+
+Без --url приложение запускается в этом же процессе (httpx.ASGITransport)
+поверх указанной базы; с --url запросы идут к запущенному uvicorn/gunicorn,
+который должен работать с той же базой. Для каждого сценария выводятся
+пропускная способность и задержки p50/p95/p99 в миллисекундах.
+
+Чтение идёт по нижней половине id, удаления — по верхней, начиная с
+последнего id, поэтому прогон портит базу только сверху и повторный
+запуск на той же базе не встречает удалённых пользователей в чтениях.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(ROOT)
+
+from src.bench import users  # noqa: E402
+from src.bench.users import BENCH_PASSWORD, is_active, user_email  # noqa: E402
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_REQUESTS = 1000
+DEFAULT_WRITE_REQUESTS = 200
+DEFAULT_THRESHOLD = 0.1
+BATCH_SIZE = 10
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+class BenchContext:
+    """Общее состояние прогона: диапазоны id, сессии и счётчики."""
+
+    def __init__(self, database: str, seed: int):
+        self._conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+        # Пользователи, созданные прошлыми прогонами, в диапазоны не входят.
+        (self.max_id,) = self._conn.execute(
+            f"SELECT MAX(id) FROM users WHERE email LIKE '{user_email('%')}'"
+        ).fetchone()
+        if not self.max_id or self.max_id < 4:
+            raise ValueError(f"{database} has too few users, run generate.py first")
+        self.rng = random.Random(seed)
+        self.read_max_id = self.max_id // 2
+        self._delete_ids: List[int] = []
+        self._last_delete_id = self.max_id + 1
+        self._serial = itertools.count()
+        self.run_id = uuid.uuid4().hex[:8]
+        self.admin: Dict[str, str] = {}
+        self.sessions: List[Tuple[Dict[str, str], Dict[str, Any]]] = []
+        self.victims: List[Dict[str, str]] = []
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def read_id(self) -> int:
+        return self.rng.randint(2, self.read_max_id)
+
+    def active_id(self) -> int:
+        while True:
+            user_id = self.read_id()
+            if is_active(user_id):
+                return user_id
+
+    def delete_id(self) -> int:
+        """Следующий ещё не удалённый id из верхней половины, по убыванию."""
+        if not self._delete_ids:
+            rows = self._conn.execute(
+                "SELECT id FROM users WHERE id > ? AND id < ? "
+                f"AND email LIKE '{user_email('%')}' ORDER BY id DESC LIMIT 1000",
+                (self.read_max_id, self._last_delete_id),
+            ).fetchall()
+            if not rows:
+                raise RuntimeError("Ran out of users to delete, generate a new table")
+            self._delete_ids = [row[0] for row in reversed(rows)]
+        self._last_delete_id = self._delete_ids.pop()
+        return self._last_delete_id
+
+    def new_user(self) -> Dict[str, Any]:
+        name = f"bench_{self.run_id}_{next(self._serial)}"
+        return {
+            "email": f"{name}@example.com",
+            "username": name,
+            "password": BENCH_PASSWORD,
+            "is_active": True,
+            "is_superuser": False,
+            "is_verified": False,
+        }
+
+
+class Scenario:
+    def __init__(
+        self,
+        name: str,
+        build: Callable[[BenchContext], Request],
+        writes: bool = False,
+    ):
+        self.name = name
+        self.build = build
+        self.writes = writes
+
+
+def _search_query(ctx: BenchContext) -> str:
+    return f"{ctx.rng.choice(users.NAMES)}_{ctx.rng.randint(1, 9)}"
+
+
+def _session(ctx: BenchContext) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    return ctx.sessions[ctx.rng.randrange(len(ctx.sessions))]
+
+
+def _update_me(ctx: BenchContext) -> Request:
+    headers, profile = _session(ctx)
+    body = dict(profile, phone_number=f"+7{ctx.rng.randrange(10**9, 10**10)}")
+    return "PUT", "/users/me", {"headers": headers, "json": body}
+
+
+SCENARIOS = [
+    Scenario("list_users", lambda ctx: ("GET", "/users/", {"params": {"limit": 50}})),
+    Scenario(
+        "list_users_sorted",
+        lambda ctx: (
+            "GET",
+            "/users/",
+            {"params": {"sort_by": "username", "filter_active": True, "limit": 50}},
+        ),
+    ),
+    Scenario(
+        "list_users_filtered",
+        lambda ctx: (
+            "GET",
+            "/users/",
+            {"params": {"filter_username": f"anna_{ctx.read_id()}"}},
+        ),
+    ),
+    Scenario(
+        "export_users",
+        lambda ctx: (
+            "GET",
+            "/users/export",
+            {"params": {"filter_username": f"anna_{ctx.read_id()}"}},
+        ),
+    ),
+    Scenario("get_user", lambda ctx: ("GET", f"/users/{ctx.read_id()}/", {})),
+    Scenario(
+        "get_users_batch",
+        lambda ctx: (
+            "GET",
+            "/users/batch",
+            {"params": {"ids": ",".join(str(ctx.read_id()) for _ in range(50))}},
+        ),
+    ),
+    Scenario(
+        "search_users",
+        lambda ctx: (
+            "GET",
+            "/users/search_user",
+            {"params": {"search_query": _search_query(ctx), "limit": 20}},
+        ),
+    ),
+    Scenario("get_me", lambda ctx: ("GET", "/users/me", {"headers": _session(ctx)[0]})),
+    Scenario("update_me", _update_me, writes=True),
+    Scenario(
+        "login",
+        lambda ctx: (
+            "POST",
+            "/auth/jwt/login",
+            {
+                "data": {
+                    "username": user_email(ctx.active_id()),
+                    "password": BENCH_PASSWORD,
+                }
+            },
+        ),
+    ),
+    Scenario(
+        "register",
+        lambda ctx: ("POST", "/auth/register", {"json": ctx.new_user()}),
+        writes=True,
+    ),
+    Scenario(
+        "create_users_batch",
+        lambda ctx: (
+            "POST",
+            "/users/batch",
+            {
+                "headers": ctx.admin,
+                "json": [ctx.new_user() for _ in range(BATCH_SIZE)],
+            },
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "delete_user",
+        lambda ctx: ("DELETE", f"/users/{ctx.delete_id()}", {"headers": ctx.admin}),
+        writes=True,
+    ),
+    Scenario(
+        "delete_users_batch",
+        lambda ctx: (
+            "DELETE",
+            "/users/batch",
+            {
+                "headers": ctx.admin,
+                "params": {
+                    "ids": ",".join(str(ctx.delete_id()) for _ in range(BATCH_SIZE))
+                },
+            },
+        ),
+        writes=True,
+    ),
+    Scenario(
+        "delete_me",
+        lambda ctx: ("DELETE", "/users/me", {"headers": ctx.victims.pop()}),
+        writes=True,
+    ),
+]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Процентиль методом ближайшего ранга."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        "throughput": round(count / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if count else 0.0,
+    }
+
+
+async def login(client: httpx.AsyncClient, email: str) -> Dict[str, str]:
+    response = await client.post(
+        "/auth/jwt/login", data={"username": email, "password": BENCH_PASSWORD}
+    )
+    if response.status_code >= 400:
+        raise RuntimeError(f"Login as {email} failed: {response.status_code}")
+    cookies = "; ".join(f"{name}={value}" for name, value in response.cookies.items())
+    return {"Cookie": cookies}
+
+
+async def prepare(
+    client: httpx.AsyncClient,
+    ctx: BenchContext,
+    scenarios: List[Scenario],
+    concurrency: int,
+    write_requests: int,
+) -> None:
+    names = {scenario.name for scenario in scenarios}
+    ctx.admin = await login(client, users.ADMIN_EMAIL)
+    if names & {"get_me", "update_me"}:
+        for _ in range(concurrency):
+            headers = await login(client, user_email(ctx.active_id()))
+            profile = (await client.get("/users/me", headers=headers)).json()
+            profile.pop("id")
+            ctx.sessions.append((headers, profile))
+    if "delete_me" in names:
+        while len(ctx.victims) < write_requests:
+            user_id = ctx.delete_id()
+            if is_active(user_id):
+                ctx.victims.append(await login(client, user_email(user_id)))
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    ctx: BenchContext,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    remaining = itertools.count(requests, -1)
+
+    async def worker() -> None:
+        nonlocal errors
+        while next(remaining) > 0:
+            method, url, kwargs = scenario.build(ctx)
+            started = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def compare(
+    results: Dict[str, Any], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    """Печатает сравнение с базовым прогоном и возвращает регрессии по p95."""
+    regressions = []
+    print(f"{'scenario':<22}{'p95 ms':>12}{'base':>12}{'ratio':>8}", file=sys.stderr)
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None or not previous["p95_ms"]:
+            continue
+        ratio = current["p95_ms"] / previous["p95_ms"]
+        print(
+            f"{name:<22}{current['p95_ms']:>12.3f}{previous['p95_ms']:>12.3f}"
+            f"{ratio:>8.2f}",
+            file=sys.stderr,
+        )
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def make_client(url: Optional[str]) -> httpx.AsyncClient:
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=60)
+    # Настройки базы читаются при импорте приложения, поэтому импорт здесь,
+    # после того как main() выставил DATABASE_NAME.
+    from src.main import app
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+    )
+
+
+async def bench(args: argparse.Namespace) -> Dict[str, Any]:
+    scenarios = [
+        scenario
+        for scenario in SCENARIOS
+        if not args.scenario or scenario.name in args.scenario
+    ]
+    ctx = BenchContext(args.database, args.seed)
+    results: Dict[str, Any] = {
+        "meta": {
+            "database": os.path.basename(args.database),
+            "users": ctx.max_id,
+            "target": args.url or "in-process",
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "write_requests": args.write_requests,
+            "seed": args.seed,
+            "python": platform.python_version(),
+        },
+        "scenarios": {},
+    }
+    try:
+        async with make_client(args.url) as client:
+            await prepare(client, ctx, scenarios, args.concurrency, args.write_requests)
+            for scenario in scenarios:
+                requests = args.write_requests if scenario.writes else args.requests
+                for _ in range(args.warmup if not scenario.writes else 0):
+                    method, url, kwargs = scenario.build(ctx)
+                    await client.request(method, url, **kwargs)
+                summary = await run_scenario(
+                    client, ctx, scenario, requests, args.concurrency
+                )
+                results["scenarios"][scenario.name] = summary
+                print(
+                    f"{scenario.name}: {summary['throughput']} req/s "
+                    f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms "
+                    f"p99={summary['p99_ms']}ms errors={summary['errors']}",
+                    file=sys.stderr,
+                )
+    finally:
+        ctx.close()
+    if not args.url:
+        from src.services.password import password_pool
+        from src.services.writer import stop_writers
+
+        await stop_writers()
+        password_pool.shutdown()
+    return results
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон API.")
+    parser.add_argument("database", help="база, созданная generate.py")
+    parser.add_argument(
+        "--url", help="адрес запущенного сервера, например http://127.0.0.1:8000"
+    )
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=DEFAULT_REQUESTS)
+    parser.add_argument(
+        "--write-requests",
+        type=int,
+        default=DEFAULT_WRITE_REQUESTS,
+        help="число запросов в сценариях, изменяющих данные",
+    )
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=[scenario.name for scenario in SCENARIOS],
+        help="запустить только указанные сценарии (можно повторять)",
+    )
+    parser.add_argument("--output", help="файл для результатов в JSON")
+    parser.add_argument("--baseline", help="JSON предыдущего прогона для сравнения")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="допустимый рост p95 относительно baseline (0.1 — 10%%)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    if not args.url:
+        database = os.path.abspath(args.database)
+        os.environ["DATABASE_NAME"] = database
+        os.environ.setdefault("COHERENCE_FILE", f"{database}.gen")
+    results = asyncio.run(bench(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"p95 regressions: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Синтетические пользователи для нагрузочных тестов.
+
+Модуль не импортирует приложение: run.py должен выставить DATABASE_NAME
+до импорта src.db.
+"""
+import random
+from typing import Any, Dict, Iterator
+
+BENCH_PASSWORD = "bench-password"
+ADMIN_EMAIL = "bench_admin@example.com"
+
+NAMES = (
+    "anna", "olga", "yana", "ivan", "petr", "maria", "sergey", "elena",
+    "dmitry", "irina", "alexey", "natalia", "pavel", "svetlana", "nikolay",
+    "tatiana", "andrey", "ekaterina", "mikhail", "julia",
+)  # fmt: skip
+
+
+def user_email(user_id: int) -> str:
+    return f"user{user_id}@example.com"
+
+
+def is_active(user_id: int) -> bool:
+    """Каждый десятый пользователь неактивен и не может войти."""
+    return user_id % 10 != 0
+
+
+def iter_users(
+    rows: int, hashed_password: str, seed: int = 0
+) -> Iterator[Dict[str, Any]]:
+    """Детерминированные пользователи 1..rows: один seed — одна и та же таблица."""
+    rng = random.Random(seed)
+    yield {
+        "id": 1,
+        "email": ADMIN_EMAIL,
+        "username": "bench_admin",
+        "hashed_password": hashed_password,
+        "is_active": True,
+        "is_superuser": True,
+        "is_verified": True,
+    }
+    for user_id in range(2, rows + 1):
+        yield {
+            "id": user_id,
+            "email": user_email(user_id),
+            "username": f"{rng.choice(NAMES)}_{user_id}",
+            "hashed_password": hashed_password,
+            "avatar": None,
+            "phone_number": f"+7{rng.randrange(10**9, 10**10)}",
+            "is_active": is_active(user_id),
+            "is_superuser": False,
+            "is_verified": rng.random() < 0.5,
+        }
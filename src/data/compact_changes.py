@@ -0,0 +1,57 @@
+"""Сжатие журнала изменений users_changes.
+
+Пример:
+    python src/data/compact_changes.py --retention-days 7
+
+Для каждого пользователя остаётся только последняя запись, а записи старше
+срока хранения удаляются. Зеркала, которые отстали дальше удалённых записей,
+получают 410 и должны заново выгрузить /users/. При SHARD_COUNT > 1
+(или --shards) сжимается журнал каждого шарда.
+"""
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+from src.data.load_sql import connect  # noqa: E402
+from src.db import DATABASE_NAME, SHARD_COUNT, shard_database  # noqa: E402
+from src.services import changes  # noqa: E402
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Сжатие журнала users_changes.")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=SHARD_COUNT,
+        help="число шардов рядом с --database (по умолчанию SHARD_COUNT)",
+    )
+    parser.add_argument(
+        "--retention-days",
+        type=float,
+        default=changes.CHANGES_RETENTION_DAYS,
+        help="срок хранения записей в днях (по умолчанию CHANGES_RETENTION_DAYS)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    for index in range(args.shards):
+        path = shard_database(index, args.shards, args.database)
+        conn = connect(path)
+        try:
+            collapsed, expired = changes.compact_changes(conn, args.retention_days)
+        finally:
+            conn.close()
+        prefix = f"{path}: " if args.shards > 1 else ""
+        print(f"{prefix}collapsed: {collapsed} expired: {expired}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,337 @@
+"""Импорт пользователей в таблицу users.
+
+Пример:
+    python src/data/load_sql.py src/data/users.json --mode upsert --batch-size 5000
+
+Файл читается потоково (JSON-массив, NDJSON или CSV), записи вставляются
+через executemany пачками, каждая пачка — отдельная транзакция, поэтому
+расход памяти не зависит от размера файла. При SHARD_COUNT > 1 (или
+--shards) каждая запись пишется в файл своего шарда (id % числу шардов),
+поэтому id обязателен.
+"""
+import argparse
+import csv
 import json
 import os
 import sqlite3
+import sys
+import time
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+from src.db import (DATABASE_NAME, SHARD_COUNT, shard_database,  # noqa: E402
+                    shard_index)
+from src.services.coherence import generations  # noqa: E402
+
+DEFAULT_DATA_FILE = os.path.abspath("src/data/users.json")
+DEFAULT_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 1 << 16
+PROGRESS_INTERVAL = 5.0
+
+COLUMNS = (
+    "id",
+    "email",
+    "username",
+    "hashed_password",
+    "avatar",
+    "phone_number",
+    "is_active",
+    "is_superuser",
+    "is_verified",
+)
+BOOLEAN_COLUMNS = ("is_active", "is_superuser", "is_verified")
+BOOLEAN_DEFAULTS = {"is_active": True, "is_superuser": False, "is_verified": False}
+
+INSERT_SQL = (
+    f"INSERT INTO users ({', '.join(COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in COLUMNS)})"
+)
+MODE_SQL = {
+    "insert": INSERT_SQL,
+    "skip": INSERT_SQL + " ON CONFLICT(id) DO NOTHING",
+    "upsert": INSERT_SQL
+    + " ON CONFLICT(id) DO UPDATE SET "
+    + ", ".join(f"{column} = excluded.{column}" for column in COLUMNS[1:]),
+}
+
+
+def iter_json_array(
+    stream: IO[str], chunk_size: int = READ_CHUNK_SIZE
+) -> Iterator[Any]:
+    """Разбирает JSON-массив по элементам, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    state = "start"
+    while True:
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position >= len(buffer):
+                break
+            if state == "start":
+                if buffer[position] != "[":
+                    raise ValueError("JSON input must be an array of users")
+                position += 1
+                state = "first"
+            elif state == "separator":
+                if buffer[position] == ",":
+                    state = "item"
+                elif buffer[position] == "]":
+                    return
+                else:
+                    raise ValueError(f"Unexpected {buffer[position]!r} in JSON array")
+                position += 1
+            else:
+                if state == "first" and buffer[position] == "]":
+                    return
+                try:
+                    item, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    break
+                state = "separator"
+                yield item
+        if eof:
+            raise ValueError("Unexpected end of JSON input")
+
+
+def iter_ndjson(stream: IO[str]) -> Iterator[Any]:
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_csv(stream: IO[str]) -> Iterator[Dict[str, Any]]:
+    for row in csv.DictReader(stream):
+        yield {key: (value if value != "" else None) for key, value in row.items()}
+
+
+READERS = {"json": iter_json_array, "ndjson": iter_ndjson, "csv": iter_csv}
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    if extension == ".csv":
+        return "csv"
+    return "json"
+
+
+def _as_bool(value: Any, column: str) -> bool:
+    if value is None:
+        return BOOLEAN_DEFAULTS[column]
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "t", "yes")
+    return bool(value)
+
+
+def to_row(item: Dict[str, Any]) -> Tuple:
+    user_id = item.get("id")
+    row = [int(user_id) if user_id is not None else None]
+    for column in COLUMNS[1:]:
+        value = item.get(column)
+        if column in BOOLEAN_COLUMNS:
+            value = _as_bool(value, column)
+        row.append(value)
+    return tuple(row)
+
 
-data_file_path = os.path.abspath("src/data/users.json")
-
-with open(data_file_path, "r") as json_file:
-    data = json.load(json_file)
-
-conn = sqlite3.connect("applications.sqlite")
-cursor = conn.cursor()
-
-for item in data:
-    cursor.execute(
-        "INSERT INTO users (id, email, username, hashed_password, avatar, phone_number, is_active, is_superuser, is_verified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (
-            item["id"],
-            item["email"],
-            item["username"],
-            item["hashed_password"],
-            item["avatar"],
-            item["phone_number"],
-            item["is_active"],
-            item["is_superuser"],
-            item["is_verified"],
-        ),
+def drop_indexes(conn: sqlite3.Connection) -> List[str]:
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type = 'index' AND tbl_name = 'users' AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX "{name}"')
+    return [sql for _, sql in indexes]
+
+
+class Progress:
+    def __init__(self, interval: float = PROGRESS_INTERVAL):
+        self.started = time.perf_counter()
+        self.reported = self.started
+        self.interval = interval
+        self.read = 0
+        self.written = 0
+
+    def update(self, read: int, written: int) -> None:
+        self.read += read
+        self.written += written
+        now = time.perf_counter()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.report("progress")
+
+    def report(self, label: str) -> None:
+        elapsed = time.perf_counter() - self.started
+        rate = self.read / elapsed if elapsed else 0.0
+        print(
+            f"{label}: read={self.read} written={self.written} "
+            f"skipped={self.read - self.written} "
+            f"elapsed={elapsed:.2f}s rate={rate:.0f} rows/s",
+            file=sys.stderr,
+        )
+
+
+def import_users(
+    conn: sqlite3.Connection,
+    items: Iterator[Dict[str, Any]],
+    mode: str = "skip",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    rebuild_indexes: bool = False,
+    progress: Optional[Progress] = None,
+) -> Progress:
+    return import_sharded([conn], items, mode, batch_size, rebuild_indexes, progress)
+
+
+def import_sharded(
+    conns: Sequence[sqlite3.Connection],
+    items: Iterator[Dict[str, Any]],
+    mode: str = "skip",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    rebuild_indexes: bool = False,
+    progress: Optional[Progress] = None,
+) -> Progress:
+    """Импорт в шарды conns: запись попадает в conns[id % len(conns)]."""
+    progress = progress or Progress()
+    sql = MODE_SQL[mode]
+    index_sql: List[List[str]] = []
+    if rebuild_indexes:
+        for conn in conns:
+            conn.execute("BEGIN IMMEDIATE")
+            index_sql.append(drop_indexes(conn))
+            conn.execute("COMMIT")
+    try:
+        batches: List[List[Tuple]] = [[] for _ in conns]
+        for item in items:
+            row = to_row(item)
+            if len(conns) == 1:
+                shard = 0
+            elif row[0] is None:
+                raise ValueError("Every user needs an id when importing into shards")
+            else:
+                shard = shard_index(row[0], len(conns))
+            batches[shard].append(row)
+            if len(batches[shard]) >= batch_size:
+                _write_batch(conns[shard], sql, batches[shard], progress)
+                batches[shard] = []
+        for conn, batch in zip(conns, batches):
+            if batch:
+                _write_batch(conn, sql, batch, progress)
+    finally:
+        if index_sql:
+            started = time.perf_counter()
+            for conn, statements in zip(conns, index_sql):
+                conn.execute("BEGIN IMMEDIATE")
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute("COMMIT")
+            print(
+                f"indexes rebuilt: {sum(map(len, index_sql))} "
+                f"in {time.perf_counter() - started:.2f}s",
+                file=sys.stderr,
+            )
+    return progress
+
+
+def _write_batch(
+    conn: sqlite3.Connection, sql: str, batch: List[Tuple], progress: Progress
+) -> None:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # rowcount не учитывает строки, изменённые триггерами.
+        written = conn.executemany(sql, batch).rowcount
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    progress.update(len(batch), written)
+
+
+def connect(database: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(database, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Импорт пользователей в SQLite.")
+    parser.add_argument(
+        "path",
+        nargs="?",
+        default=DEFAULT_DATA_FILE,
+        help="файл с пользователями или '-' для stdin",
+    )
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=SHARD_COUNT,
+        help="число шардов рядом с --database (по умолчанию SHARD_COUNT)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=sorted(READERS),
+        help="формат файла (по умолчанию определяется по расширению)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=sorted(MODE_SQL),
+        default="skip",
+        help="insert — ошибка на существующем id, skip — пропустить, "
+        "upsert — обновить (по умолчанию skip)",
     )
-conn.commit()
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--rebuild-indexes",
+        action="store_true",
+        help="удалить индексы users на время загрузки и построить заново",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    data_format = args.format or detect_format(args.path)
+    conns = [
+        connect(shard_database(index, args.shards, args.database))
+        for index in range(args.shards)
+    ]
+    stream = (
+        sys.stdin
+        if args.path == "-"
+        else open(args.path, "r", encoding="utf-8", newline="")
+    )
+    try:
+        progress = import_sharded(
+            conns,
+            READERS[data_format](stream),
+            mode=args.mode,
+            batch_size=args.batch_size,
+            rebuild_indexes=args.rebuild_indexes,
+        )
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        for conn in conns:
+            conn.close()
+        # Какие строки изменились, воркерам неизвестно: сбрасываем их кэши целиком.
+        generations.bump()
+    progress.report("done")
+
 
-conn.close()
+if __name__ == "__main__":
+    main()
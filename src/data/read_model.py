@@ -0,0 +1,79 @@
+"""Сверка модели чтения в памяти с SQLite и отчёт о занимаемой памяти.
+
+Пример:
+    python src/data/read_model.py --check --follow 60
+
+Модель загружается из базы так же, как при старте приложения
+(READ_MODEL=1), и выводится объём памяти по столбцам. С --follow модель
+указанное число секунд догоняет базу по журналу users_changes, как это
+делают воркеры, а с --check затем сравнивается с таблицей users: данные
+строк и порядок каждой сортировки. При расхождениях код возврата 1.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Optional
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+from src.data.load_sql import connect  # noqa: E402
+from src.db import DATABASE_NAME, SHARD_COUNT  # noqa: E402
+from src.services.readmodel import ReadModel  # noqa: E402
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Сверка модели чтения с SQLite.")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="сравнить модель с таблицей users",
+    )
+    parser.add_argument(
+        "--follow",
+        type=float,
+        default=0,
+        help="сколько секунд применять изменения из журнала перед сверкой",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if SHARD_COUNT > 1:
+        # Приложение не включает модель чтения при нескольких шардах.
+        print("READ_MODEL is not supported with SHARD_COUNT > 1", file=sys.stderr)
+        return 1
+    conn = connect(args.database)
+    model = ReadModel()
+    try:
+        started = time.perf_counter()
+        model.load(conn)
+        print(
+            f"loaded {len(model.rows_by_id)} rows "
+            f"in {time.perf_counter() - started:.2f}s",
+            file=sys.stderr,
+        )
+        deadline = time.monotonic() + args.follow
+        while time.monotonic() < deadline:
+            time.sleep(1)
+            model.refresh_from(conn)
+        # Поисковые строки строятся при первом поиске; учитываем и их.
+        model.search("@", include_email=True, limit=1)
+        for name, size in model.memory_report().items():
+            print(f"{name}: {size} bytes", file=sys.stderr)
+        problems = model.check(conn) if args.check else []
+    finally:
+        conn.close()
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    if args.check:
+        print(f"mismatches: {len(problems)}", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
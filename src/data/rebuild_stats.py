@@ -0,0 +1,107 @@
+"""Пересчёт таблицы users_stats по таблице users.
+
+Пример:
+    python src/data/rebuild_stats.py --check
+
+Счётчики считаются заново через GROUP BY и сравниваются с теми, что
+поддерживают триггеры. С --check расхождения только выводятся (код
+возврата 1), без него — счётчики перезаписываются одной транзакцией.
+При SHARD_COUNT > 1 (или --shards) проверяется каждый файл шарда.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from typing import Dict, List, Optional, Tuple
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+from src.data.load_sql import connect  # noqa: E402
+from src.db import DATABASE_NAME, SHARD_COUNT, shard_database  # noqa: E402
+from src.services.stats import RECOUNT_SQL, STATS_SQL  # noqa: E402
+
+Flags = Tuple[bool, bool, bool]
+
+
+def _counts(conn: sqlite3.Connection, sql: str) -> Dict[Flags, int]:
+    counts: Dict[Flags, int] = {}
+    for active, verified, superuser, count in conn.execute(sql):
+        flags = (bool(active), bool(verified), bool(superuser))
+        counts[flags] = counts.get(flags, 0) + count
+    return counts
+
+
+def diff_stats(conn: sqlite3.Connection) -> List[Tuple[Flags, int, int]]:
+    """Сочетания флагов, где счётчик не совпадает с пересчётом: (флаги, было, стало)."""
+    stored = _counts(conn, STATS_SQL)
+    actual = _counts(conn, RECOUNT_SQL)
+    return [
+        (flags, stored.get(flags, 0), actual.get(flags, 0))
+        for flags in sorted(set(stored) | set(actual))
+        if stored.get(flags, 0) != actual.get(flags, 0)
+    ]
+
+
+def rebuild_stats(conn: sqlite3.Connection) -> List[Tuple[Flags, int, int]]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        differences = diff_stats(conn)
+        for (active, verified, superuser), _, count in differences:
+            conn.execute(
+                "INSERT INTO users_stats "
+                "(is_active, is_verified, is_superuser, count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (is_active, is_verified, is_superuser) "
+                "DO UPDATE SET count = excluded.count",
+                (active, verified, superuser, count),
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return differences
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Пересчёт таблицы users_stats.")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=SHARD_COUNT,
+        help="число шардов рядом с --database (по умолчанию SHARD_COUNT)",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="только сравнить счётчики с пересчётом, ничего не записывая",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    total = 0
+    for index in range(args.shards):
+        path = shard_database(index, args.shards, args.database)
+        conn = connect(path)
+        try:
+            differences = diff_stats(conn) if args.check else rebuild_stats(conn)
+        finally:
+            conn.close()
+        prefix = f"{path}: " if args.shards > 1 else ""
+        for (active, verified, superuser), stored, actual in differences:
+            print(
+                f"{prefix}is_active={active} is_verified={verified} "
+                f"is_superuser={superuser}: stored={stored} actual={actual}",
+                file=sys.stderr,
+            )
+        total += len(differences)
+    label = "mismatches" if args.check else "fixed"
+    print(f"{label}: {total}", file=sys.stderr)
+    return 1 if args.check and total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
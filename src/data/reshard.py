@@ -0,0 +1,122 @@
+"""Перераспределение таблицы users на другое число шардов.
+
+Пример:
+    alembic -x shards=4 upgrade head
+    python src/data/reshard.py --from-shards 1 --to-shards 4
+
+Файлы новых шардов должны быть созданы миграциями и пусты. Строки читаются
+из старых шардов порциями и записываются в шард id % to-shards, все новые
+шарды фиксируются в конце одной транзакцией каждый. Старые файлы не
+изменяются: после проверки приложение перезапускается с новым SHARD_COUNT,
+а старые файлы удаляются вручную. Триггеры новых шардов заново заполняют
+users_version, users_stats и users_changes, поэтому ETag строк меняются,
+а зеркала журнала изменений должны выгрузить данные заново.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from typing import List, Optional
+
+sys.path.append(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+)
+
+from src.data.load_sql import connect  # noqa: E402
+from src.db import DATABASE_NAME, shard_database, shard_index  # noqa: E402
+
+RESHARD_CHUNK_SIZE = 1000
+
+
+class ReshardError(Exception):
+    pass
+
+
+def _columns(conn: sqlite3.Connection) -> List[str]:
+    return [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+
+
+def reshard(
+    database: str,
+    from_shards: int,
+    to_shards: int,
+    chunk_size: int = RESHARD_CHUNK_SIZE,
+) -> List[int]:
+    """Копирует строки users в новые шарды; возвращает число строк в каждом."""
+    sources = [shard_database(i, from_shards, database) for i in range(from_shards)]
+    targets = [shard_database(i, to_shards, database) for i in range(to_shards)]
+    if set(sources) & set(targets):
+        raise ReshardError("Source and target shards must be different files")
+    for path in sources + targets:
+        if not os.path.exists(path):
+            raise ReshardError(f"{path} does not exist, run alembic upgrade first")
+
+    target_conns = [connect(path) for path in targets]
+    try:
+        columns = _columns(target_conns[0])
+        for path, conn in zip(targets, target_conns):
+            if _columns(conn) != columns:
+                raise ReshardError(f"{path} has a different users schema")
+            if conn.execute("SELECT EXISTS (SELECT 1 FROM users)").fetchone()[0]:
+                raise ReshardError(f"{path} is not empty")
+        insert = (
+            f"INSERT INTO users ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' for _ in columns)})"
+        )
+        for conn in target_conns:
+            conn.execute("BEGIN IMMEDIATE")
+        counts = [0] * to_shards
+        try:
+            for path in sources:
+                source = sqlite3.connect(path)
+                try:
+                    if _columns(source) != columns:
+                        raise ReshardError(f"{path} has a different users schema")
+                    cursor = source.execute(
+                        f"SELECT {', '.join(columns)} FROM users ORDER BY id"
+                    )
+                    while rows := cursor.fetchmany(chunk_size):
+                        buckets: List[List[tuple]] = [[] for _ in range(to_shards)]
+                        for row in rows:
+                            buckets[shard_index(row[0], to_shards)].append(row)
+                        for index, bucket in enumerate(buckets):
+                            target_conns[index].executemany(insert, bucket)
+                            counts[index] += len(bucket)
+                finally:
+                    source.close()
+            for conn in target_conns:
+                conn.execute("COMMIT")
+        except BaseException:
+            for conn in target_conns:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            raise
+    finally:
+        for conn in target_conns:
+            conn.close()
+    return counts
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Перераспределение users по шардам.")
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--from-shards", type=int, required=True)
+    parser.add_argument("--to-shards", type=int, required=True)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    try:
+        counts = reshard(args.database, args.from_shards, args.to_shards)
+    except ReshardError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    for index, count in enumerate(counts):
+        path = shard_database(index, args.to_shards, args.database)
+        print(f"{path}: {count} rows", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
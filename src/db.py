@@ -1,18 +1,128 @@
+import os
+import zlib
 from typing import AsyncGenerator
 
-from fastapi import Depends
-from fastapi_users_db_sqlalchemy import (SQLAlchemyBaseUserTable,
-                                         SQLAlchemyUserDatabase)
-from sqlalchemy import Boolean, Column, Integer, String
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from fastapi import Request
+from fastapi_users_db_sqlalchemy import SQLAlchemyBaseUserTable
+from sqlalchemy import Boolean, Column, DateTime, Integer, String, event, text
+from sqlalchemy.ext.asyncio import (AsyncEngine, AsyncSession,
+                                    create_async_engine)
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 Base = declarative_base()
 
-DATABASE_NAME = "applications.sqlite"
+DATABASE_NAME = os.getenv("DATABASE_NAME", "applications.sqlite")
 
-engine = create_async_engine(f"sqlite+aiosqlite:///{DATABASE_NAME}")
-async_session_maker = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# Отрицательное значение cache_size задаётся в КиБ: -65536 — это 64 МиБ.
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "4"))
+# Число файлов SQLite, между которыми распределяются строки users. У каждого
+# шарда свой движок записи (и своя блокировка записи) и свой пул чтения.
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def create_sqlite_engine(
+    database: str = DATABASE_NAME,
+    readonly: bool = False,
+    pool_size: int = 1,
+) -> AsyncEngine:
+    """Создаёт движок SQLite с настройками соединений под конкурентную нагрузку.
+
+    Движок записи держит единственное соединение и открывает транзакции
+    через BEGIN IMMEDIATE, чтобы блокировка на запись бралась сразу,
+    а не при первом изменении. Движок чтения держит пул соединений
+    в режиме query_only.
+    """
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{database}",
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+    )
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Транзакциями управляет SQLAlchemy (см. begin_transaction ниже),
+        # а не неявный BEGIN драйвера sqlite3.
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        if readonly:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def begin_transaction(conn):
+        conn.exec_driver_sql("BEGIN" if readonly else "BEGIN IMMEDIATE")
+
+    return engine
+
+
+def shard_database(
+    index: int, count: int = SHARD_COUNT, database: str = DATABASE_NAME
+) -> str:
+    """Файл шарда: при одном шарде это сама база, иначе рядом с ней
+    applications.<index>.sqlite."""
+    if count == 1:
+        return database
+    root, extension = os.path.splitext(database)
+    return f"{root}.{index}{extension}"
+
+
+def shard_index(user_id: int, count: int = SHARD_COUNT) -> int:
+    """Шард строки users: id выдаются с шагом count (см. next_user_id),
+    поэтому остаток от деления распределяет строки равномерно."""
+    return user_id % count
+
+
+def email_shard(email: str, count: int = SHARD_COUNT) -> int:
+    """Шард для нового пользователя: хеш email равномерно распределяет
+    новые строки. Уникальность email от размещения не зависит: перед
+    созданием и сменой email он ищется во всех шардах (get_by_email,
+    src.services.shards.email_taken)."""
+    return zlib.crc32(email.lower().encode()) % count
+
+
+shard_engines = [create_sqlite_engine(shard_database(i)) for i in range(SHARD_COUNT)]
+shard_read_engines = [
+    create_sqlite_engine(shard_database(i), readonly=True, pool_size=READ_POOL_SIZE)
+    for i in range(SHARD_COUNT)
+]
+shard_session_makers = [
+    sessionmaker(shard_engine, class_=AsyncSession, expire_on_commit=False)
+    for shard_engine in shard_engines
+]
+shard_read_session_makers = [
+    sessionmaker(shard_engine, class_=AsyncSession, expire_on_commit=False)
+    for shard_engine in shard_read_engines
+]
+# При SHARD_COUNT=1 шард 0 — это вся база.
+engine, read_engine = shard_engines[0], shard_read_engines[0]
+async_session_maker, read_session_maker = (
+    shard_session_makers[0],
+    shard_read_session_makers[0],
+)
+
+# Следующий id в шарде: остаток от деления на число шардов равен номеру
+# шарда. При одном шарде это MAX(id) + 1, как у rowid по умолчанию.
+NEXT_ID_SQL = text("SELECT COALESCE(MAX(id), :shard) + :count FROM users")
+
+
+async def next_user_id(session: AsyncSession, shard: int) -> int:
+    """Вызывается в транзакции записи шарда (BEGIN IMMEDIATE), поэтому
+    выданный id не достанется параллельной вставке."""
+    result = await session.execute(NEXT_ID_SQL, {"shard": shard, "count": SHARD_COUNT})
+    return result.scalar_one()
 
 
 class UserTable(Base, SQLAlchemyBaseUserTable):
@@ -27,6 +137,9 @@ class UserTable(Base, SQLAlchemyBaseUserTable):
     is_active: bool = Column(Boolean, default=True, nullable=False)
     is_superuser: bool = Column(Boolean, default=False, nullable=False)
     is_verified: bool = Column(Boolean, default=False, nullable=False)
+    # Выставляются триггерами users_version_* (см. миграцию c5d1e8f3a7b2).
+    version: int = Column(Integer, server_default=text("1"), nullable=False)
+    updated_at = Column(DateTime, nullable=True)
 
 
 async def create_db_and_tables():
@@ -34,10 +147,21 @@ async def create_db_and_tables():
         await conn.run_sync(Base.metadata.create_all)
 
 
-async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_maker() as session:
-        yield session
+def use_read_session(request: Request) -> None:
+    """Зависимость роутера: его запросы читают через пул чтения при любом методе.
 
+    Подключается к роутерам, изменения которых выполняет планировщик
+    записи (src.services.writer), чтобы сессия запроса не занимала
+    соединение записи.
+    """
+    request.state.read_session = True
 
-async def get_user_db(session: AsyncSession = Depends(get_async_session)):
-    yield SQLAlchemyUserDatabase(session, UserTable)
+
+async def get_async_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """Выдаёт сессию чтения для GET-запросов и сессию записи для остальных."""
+    if request.method in READ_METHODS or getattr(request.state, "read_session", False):
+        session_maker = read_session_maker
+    else:
+        session_maker = async_session_maker
+    async with session_maker() as session:
+        yield session
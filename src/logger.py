@@ -1,11 +1,258 @@
+"""Журналирование без блокирующего ввода-вывода в обработчиках запросов.
+
+Логгеры пишут записи в очередь (QueueHandler), а в файл и stdout их выводит
+фоновый поток QueueListener. Переполненная очередь не задерживает запрос:
+запись отбрасывается и учитывается в счётчике dropped.
+"""
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+import uuid
 from sys import stdout
+from typing import Dict, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# text — прежний однострочный формат, json — объект на строку с request_id
+# и latency_ms.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Пустое значение отключает запись в файл.
+LOG_FILE = os.getenv("LOG_FILE", "./logs.log")
+# Отдельный файл на процесс (logs.<pid>.log): воркеры gunicorn не пишут
+# в один файл наперегонки, и его можно безопасно ротировать.
+LOG_FILE_PER_WORKER = os.getenv("LOG_FILE_PER_WORKER", "0") == "1"
+# Ротация по размеру; 0 — без ротации.
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", "0"))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Одинаковые сообщения с кодом 404 пишутся не чаще раза за интервал (секунды);
+# 0 — без ограничения.
+LOG_404_INTERVAL = float(os.getenv("LOG_404_INTERVAL", "10"))
+# Строка журнала на каждый запрос: метод, путь, статус и задержка.
+LOG_ACCESS = os.getenv("LOG_ACCESS", "0") == "1"
+
+# Предел числа различных сообщений, для которых хранится окно ограничения 404.
+MAX_WINDOWS = 4096
 
-stream_handler = logging.StreamHandler(stream=stdout)
-log_handler = logging.FileHandler("./logs.log")
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=(stream_handler, log_handler),
-    format="[%(levelname)s][%(asctime)s]:  %(message)s, %(name)s, ",
+TEXT_FORMAT = "[%(levelname)s][%(asctime)s]:  %(message)s, %(name)s, "
+CONTEXT_FIELDS = ("request_id", "latency_ms", "status_code")
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "request_id", default=None
+)
+request_started_var: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_started", default=None
 )
+
+_REQUEST_ID = re.compile(r"^[\w.-]{1,128}$")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет к записи id запроса и время с его начала.
+
+    Выполняется в потоке, который пишет запись, пока контекст запроса доступен.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        started = request_started_var.get()
+        record.latency_ms = (
+            round((time.perf_counter() - started) * 1000, 3)
+            if started is not None
+            else None
+        )
+        return True
+
+
+class NotFoundRateLimitFilter(logging.Filter):
+    """Пропускает одно сообщение с кодом 404 за интервал на каждый текст.
+
+    Остальные отбрасываются; к следующему пропущенному сообщению
+    дописывается число отброшенных.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self.suppressed = 0
+        self._windows: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0 or getattr(record, "status_code", None) != 404:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window_start, skipped = self._windows.get(key, (None, 0))
+            if window_start is not None and now - window_start < self.interval:
+                self._windows[key] = (window_start, skipped + 1)
+                self.suppressed += 1
+                return False
+            if key not in self._windows and len(self._windows) >= MAX_WINDOWS:
+                self._prune(now)
+            self._windows[key] = (now, 0)
+        if skipped:
+            record.msg = f"{record.getMessage()} ({skipped} similar suppressed)"
+            record.args = None
+        return True
+
+    def _prune(self, now: float) -> None:
+        # Счётчики отброшенных сообщений в закрытых окнах теряются: это
+        # допустимо для выборочного журнала, а число ключей остаётся ограниченным.
+        self._windows = {
+            key: window
+            for key, window in self._windows.items()
+            if now - window[0] < self.interval
+        }
+        if len(self._windows) >= MAX_WINDOWS:
+            self._windows.clear()
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Сообщение и трассировка форматируются здесь, так как args и exc_info
+        # могут не пережить передачу в другой поток, а само оформление
+        # (текст или JSON) остаётся обработчикам слушателя.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def log_file_path(path: str = LOG_FILE, per_worker: bool = LOG_FILE_PER_WORKER) -> str:
+    if not per_worker:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{extension}"
+
+
+def _output_handlers() -> Tuple[logging.Handler, ...]:
+    formatter = (
+        JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    )
+    handlers = [logging.StreamHandler(stream=stdout)]
+    if LOG_FILE:
+        path = log_file_path()
+        if LOG_MAX_BYTES > 0:
+            handlers.append(
+                logging.handlers.RotatingFileHandler(
+                    path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT
+                )
+            )
+        else:
+            handlers.append(logging.FileHandler(path))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return tuple(handlers)
+
+
+log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+queue_handler = NonBlockingQueueHandler(log_queue)
+not_found_filter = NotFoundRateLimitFilter(LOG_404_INTERVAL)
+queue_handler.addFilter(not_found_filter)
+queue_handler.addFilter(ContextFilter())
+listener = logging.handlers.QueueListener(log_queue, *_output_handlers())
+
+logging.basicConfig(level=LOG_LEVEL, handlers=(queue_handler,))
+listener.start()
+# Дописывает оставшиеся в очереди записи при завершении процесса.
+atexit.register(listener.stop)
+
 logger = logging.getLogger(__name__)
+access_logger = logging.getLogger("src.access")
+
+
+def logging_stats() -> Dict[str, int]:
+    return {
+        "queue_depth": log_queue.qsize(),
+        "dropped": queue_handler.dropped,
+        "suppressed": not_found_filter.suppressed,
+    }
+
+
+def _request_id(scope) -> str:
+    for name, value in scope.get("headers", ()):
+        if name == b"x-request-id":
+            value = value.decode("latin-1")
+            if _REQUEST_ID.match(value):
+                return value
+            break
+    return uuid.uuid4().hex
+
+
+class RequestContextMiddleware:
+    """ASGI-middleware: id запроса (из X-Request-ID или новый) и время начала
+    для записей журнала; id возвращается клиенту в заголовке X-Request-ID."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = _request_id(scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [
+                    (b"x-request-id", request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        id_token = request_id_var.set(request_id)
+        started_token = request_started_var.set(time.perf_counter())
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if LOG_ACCESS:
+                access_logger.info(
+                    f"{scope['method']} {scope['path']} {status_code}",
+                    extra={"status_code": status_code},
+                )
+            request_started_var.reset(started_token)
+            request_id_var.reset(id_token)
@@ -3,7 +3,17 @@ from fastapi import FastAPI
 
 from src.api.router import router_user
 from src.apps.schemas import UserCreate, UserRead
-from src.services.auth import auth_backend, current_user, fastapi_users
+from src.db import SHARD_COUNT, shard_engines, shard_read_engines
+from src.logger import RequestContextMiddleware, logger, logging_stats
+from src.services import metrics
+from src.services.auth import (auth_backend, current_user, fastapi_users,
+                               token_cache)
+from src.services.cache import user_cache
+from src.services.compression import CompressionMiddleware, compression_stats
+from src.services.password import password_pool
+from src.services.readmodel import READ_MODEL, read_model
+from src.services.singleflight import list_flight, search_flight, user_flight
+from src.services.writer import stop_writers, write_stats
 
 app = FastAPI(
     title="API сервис на Python, который будет предоставлять CRUD операции для работы с базой данных, содержащей информацию о пользователях.",
@@ -31,6 +41,97 @@ app.include_router(
 
 app.include_router(router_user)
 
+# Самый внутренний слой: метрики и журнал видят ответ до сжатия.
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+# Добавлен последним, поэтому внешний: контекст запроса виден всем слоям.
+app.add_middleware(RequestContextMiddleware)
+app.add_route("/metrics", metrics.metrics_endpoint, include_in_schema=False)
+
+for index, (write_engine, read_engine) in enumerate(
+    zip(shard_engines, shard_read_engines)
+):
+    # При одном шарде метки прежние: write и read.
+    suffix = f"_{index}" if SHARD_COUNT > 1 else ""
+    metrics.instrument_engine(write_engine, f"write{suffix}")
+    metrics.instrument_engine(read_engine, f"read{suffix}")
+metrics.registry.register_collector(metrics.cache_collector("user", user_cache))
+metrics.registry.register_collector(metrics.cache_collector("auth_token", token_cache))
+metrics.registry.register_collector(
+    metrics.stats_collector(
+        "password_pool",
+        "Password hashing pool",
+        password_pool.stats,
+        counters=("completed",),
+    )
+)
+metrics.registry.register_collector(
+    metrics.stats_collector(
+        "write_scheduler",
+        "Write scheduler",
+        write_stats,
+        counters=("batches", "jobs"),
+    )
+)
+
+metrics.registry.register_collector(
+    metrics.stats_collector(
+        "logging",
+        "Logging queue",
+        logging_stats,
+        counters=("dropped", "suppressed"),
+    )
+)
+
+metrics.registry.register_collector(
+    metrics.stats_collector(
+        "read_model",
+        "In-memory read model",
+        read_model.stats,
+        counters=("refreshes", "reloads"),
+    )
+)
+metrics.registry.register_collector(
+    metrics.stats_collector(
+        "compression",
+        "Response compression",
+        compression_stats,
+        counters=("responses", "bytes_in", "bytes_out", "cache_hits", "cache_misses"),
+    )
+)
+for name, flight in (
+    ("user", user_flight),
+    ("list", list_flight),
+    ("search", search_flight),
+):
+    metrics.registry.register_collector(
+        metrics.stats_collector(
+            f"single_flight_{name}",
+            f"Single-flight {name} reads",
+            flight.stats,
+            counters=("calls", "collapsed", "timeouts"),
+        )
+    )
+
+
+@app.on_event("startup")
+async def load_read_model():
+    if READ_MODEL and SHARD_COUNT > 1:
+        logger.warning("READ_MODEL is not supported with SHARD_COUNT > 1, disabled")
+    elif READ_MODEL:
+        await read_model.reload()
+
+
+@app.on_event("shutdown")
+async def stop_write_scheduler():
+    await stop_writers()
+
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    password_pool.shutdown()
+
+
 if __name__ == "__main__":
     uvicorn.run(
         app,
@@ -1,23 +1,96 @@
 import os
+import time
+from typing import Any, Dict, Optional, Tuple
 
+import jwt
 from dotenv import load_dotenv
-from fastapi_users import FastAPIUsers
+from fastapi_users import BaseUserManager, FastAPIUsers, exceptions, models
 from fastapi_users.authentication import (AuthenticationBackend,
                                           CookieTransport, JWTStrategy)
+from fastapi_users.jwt import decode_jwt
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
 
 from src.apps.models import UserTable
+from src.services.cache import LRUCache
+from src.services.coherence import generations
 from src.services.manager import get_user_manager
 
-cookie_transport = CookieTransport(cookie_max_age=3600)
+TOKEN_LIFETIME_SECONDS = 3600
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+cookie_transport = CookieTransport(cookie_max_age=TOKEN_LIFETIME_SECONDS)
 
 
 load_dotenv()
 
 SECRET = os.getenv("SECRET")
 
+# Проверенный токен -> значения столбцов пользователя. Запись живёт до
+# истечения токена и отзывается изменением поколения пользователя
+# (см. invalidate_user).
+token_cache = LRUCache(AUTH_CACHE_SIZE, TOKEN_LIFETIME_SECONDS, generations)
+
+
+def _user_snapshot(user: UserTable) -> Tuple[type, Dict[str, Any]]:
+    mapper = inspect(user).mapper
+    return type(user), {
+        attribute.key: getattr(user, attribute.key) for attribute in mapper.column_attrs
+    }
+
+
+def _user_from_snapshot(snapshot: Tuple[type, Dict[str, Any]]) -> UserTable:
+    """Свой экземпляр на каждый запрос: UserDatabase.update присоединяет
+    пользователя к сессии записи и меняет его, общий объект из кэша
+    увидели бы параллельные запросы."""
+    user_class, values = snapshot
+    # Значения выставляются как при загрузке строки, минуя @validates.
+    user = user_class.__mapper__.class_manager.new_instance()
+    user.__dict__.update(values)
+    make_transient_to_detached(user)
+    return user
+
+
+class CachedJWTStrategy(JWTStrategy):
+    async def read_token(
+        self, token: Optional[str], user_manager: BaseUserManager[models.UP, models.ID]
+    ) -> Optional[models.UP]:
+        if token is None:
+            return None
+        snapshot = token_cache.get(token)
+        if snapshot is not None:
+            return _user_from_snapshot(snapshot)
+
+        try:
+            data = decode_jwt(
+                token, self.decode_key, self.token_audience, algorithms=[self.algorithm]
+            )
+            user_id = data.get("sub")
+            if user_id is None:
+                return None
+        except jwt.PyJWTError:
+            return None
+
+        try:
+            parsed_id = user_manager.parse_id(user_id)
+            stamp = token_cache.stamp(parsed_id)
+            user = await user_manager.get(parsed_id)
+        except (exceptions.UserNotExists, exceptions.InvalidID):
+            return None
+        expires_in = data.get("exp", time.time() + TOKEN_LIFETIME_SECONDS) - time.time()
+        if expires_in > 0:
+            token_cache.set(
+                token,
+                _user_snapshot(user),
+                ttl=expires_in,
+                owner=parsed_id,
+                stamp=stamp,
+            )
+        return user
+
 
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
+    return CachedJWTStrategy(secret=SECRET, lifetime_seconds=TOKEN_LIFETIME_SECONDS)
 
 
 auth_backend = AuthenticationBackend(
@@ -0,0 +1,17 @@
+import os
+from typing import List
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
+
+
+def parse_ids(values: List[str]) -> List[int]:
+    """Разбирает ids=1&ids=2 и ids=1,2 в список id без повторов, сохраняя порядок."""
+    ids = {}
+    for value in values:
+        for part in value.split(","):
+            part = part.strip()
+            if part:
+                ids[int(part)] = None
+    if len(ids) > BATCH_MAX_SIZE:
+        raise ValueError(f"No more than {BATCH_MAX_SIZE} ids per request")
+    return list(ids)
@@ -0,0 +1,111 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from src.services.coherence import GenerationTable, Stamp, generations
+
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Ограниченный по размеру кэш с вытеснением LRU и временем жизни записей.
+
+    Если передана таблица поколений, каждая запись хранит отметку поколения
+    своего пользователя (owner) на момент чтения из базы и считается
+    устаревшей, как только любой воркер отметит изменение этого пользователя.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        generations: Optional[GenerationTable] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generations = generations
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        value, expires_at, owner, stamp = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        if self.generations is not None and stamp != self.generations.stamp(owner):
+            del self._data[key]
+            self.stale += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def stamp(self, owner: Hashable) -> Optional[Stamp]:
+        """Отметку нужно взять до чтения из базы и передать в set()."""
+        if self.generations is None:
+            return None
+        return self.generations.stamp(owner)
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        owner: Hashable = None,
+        stamp: Optional[Stamp] = None,
+    ) -> None:
+        if self.maxsize <= 0:
+            return
+        owner = key if owner is None else owner
+        if stamp is None:
+            stamp = self.stamp(owner)
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at, owner, stamp)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "stale": self.stale,
+        }
+
+
+# Профили пользователей по id: строки с полями CACHED_FIELDS.
+user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL, generations)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Сбрасывает профиль в этом процессе и отмечает изменение для остальных.
+
+    Вызывается после фиксации изменения в базе.
+    """
+    user_cache.invalidate(user_id)
+    generations.bump(user_id)
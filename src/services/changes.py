@@ -0,0 +1,169 @@
+import asyncio
+import os
+import sqlite3
+import sys
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Tuple
+
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+
+from src.db import shard_read_session_makers
+from src.services.conditional import table_version
+from src.services.serialize import user_row
+from src.services.sorted import USER_FIELDS
+
+DEFAULT_CHANGES_LIMIT = 100
+MAX_CHANGES_LIMIT = 1000
+# Как часто поток SSE проверяет версию таблицы users_version (секунды).
+CHANGES_POLL_INTERVAL = float(os.getenv("CHANGES_POLL_INTERVAL", "1"))
+# Комментарий-пинг в потоке SSE, чтобы прокси не закрывали тихое соединение.
+CHANGES_HEARTBEAT = float(os.getenv("CHANGES_HEARTBEAT", "15"))
+# Записи журнала старше срока удаляются при сжатии (дни).
+CHANGES_RETENTION_DAYS = float(os.getenv("CHANGES_RETENTION_DAYS", "7"))
+
+# Журнал users_changes ведут триггеры users_changes_* (см. миграцию
+# e8c3b5a1f0d4). Данные строки берутся из users на момент чтения: для
+# insert и update это текущее состояние пользователя, для delete — null.
+CHANGES_SQL = text(
+    f"""
+    SELECT users_changes.seq, users_changes.op, users_changes.user_id,
+        {", ".join(f"users.{field}" for field in USER_FIELDS)}
+    FROM users_changes
+    LEFT JOIN users
+        ON users.id = users_changes.user_id AND users_changes.op != 'delete'
+    WHERE users_changes.seq > :since
+    ORDER BY users_changes.seq
+    LIMIT :limit
+    """
+)
+HEAD_SQL = "SELECT COALESCE(MAX(seq), 0) FROM users_changes"
+FLOOR_SQL = "SELECT seq FROM users_changes_floor WHERE id = 0"
+
+
+class ChangesExpired(Exception):
+    """Записи после since удалены по сроку хранения: нужна полная синхронизация."""
+
+
+def change_entry(row: Mapping[str, Any]) -> Dict[str, Any]:
+    return {
+        "seq": row["seq"],
+        "op": row["op"],
+        "id": row["user_id"],
+        "user": user_row(row) if row["id"] is not None else None,
+    }
+
+
+async def changes_floor(session: AsyncSession) -> int:
+    return (await session.execute(text(FLOOR_SQL))).scalar_one()
+
+
+async def read_changes(
+    session: AsyncSession, since: int, limit: int
+) -> Tuple[List[Dict[str, Any]], int, bool]:
+    """Изменения после since: (записи, последний seq в журнале, есть ли ещё)."""
+    if since < await changes_floor(session):
+        raise ChangesExpired()
+    head = (await session.execute(text(HEAD_SQL))).scalar_one()
+    rows = await session.execute(CHANGES_SQL, {"since": since, "limit": limit + 1})
+    entries = [change_entry(row) for row in rows.mappings()]
+    return entries[:limit], head, len(entries) > limit
+
+
+def _event(entry: Dict[str, Any]) -> bytes:
+    return (
+        f"id: {entry['seq']}\nevent: {entry['op']}\n".encode()
+        + b"data: "
+        + orjson.dumps(entry)
+        + b"\n\n"
+    )
+
+
+async def change_events(since: int, shard: int = 0) -> AsyncIterator[bytes]:
+    """Поток SSE журнала шарда: сначала накопившиеся изменения, затем новые
+    по мере появления.
+
+    Каждая страница журнала читается в своей короткой сессии и отдаётся
+    клиенту уже после её закрытия: медленный клиент не держит соединение
+    пула чтения и транзакцию, мешающую контрольным точкам WAL. Журнал
+    перечитывается, только когда меняется версия таблицы users.
+    """
+    version: Optional[int] = None
+    idle = 0.0
+    while True:
+        async with shard_read_session_makers[shard]() as session:
+            current, _ = await table_version(session)
+        if current != version:
+            more = True
+            while more:
+                async with shard_read_session_makers[shard]() as session:
+                    try:
+                        entries, _, more = await read_changes(
+                            session, since, MAX_CHANGES_LIMIT
+                        )
+                    except ChangesExpired:
+                        entries = None
+                if entries is None:
+                    yield b"event: expired\ndata: {}\n\n"
+                    return
+                for entry in entries:
+                    since = entry["seq"]
+                    yield _event(entry)
+            version = current
+            idle = 0.0
+        await asyncio.sleep(CHANGES_POLL_INTERVAL)
+        idle += CHANGES_POLL_INTERVAL
+        if idle >= CHANGES_HEARTBEAT:
+            idle = 0.0
+            yield b": keepalive\n\n"
+
+
+def compact_changes(
+    conn: sqlite3.Connection, retention_days: float = CHANGES_RETENTION_DAYS
+) -> Tuple[int, int]:
+    """Сжимает журнал одной транзакцией: (свёрнуто, удалено по сроку).
+
+    Для каждого пользователя остаётся только последняя запись: она отдаёт
+    текущее состояние строки, поэтому зеркало с любым since после сжатия
+    приходит к тому же результату. Записи старше retention_days удаляются,
+    а их наибольший seq становится нижней границей журнала.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        collapsed = conn.execute(
+            """
+            DELETE FROM users_changes
+            WHERE seq NOT IN (
+                SELECT MAX(seq) FROM users_changes GROUP BY user_id
+            )
+            """
+        ).rowcount
+        # seq растёт вместе с changed_at, поэтому достаточно найти первую
+        # запись, которую нужно сохранить.
+        kept = conn.execute(
+            """
+            SELECT seq FROM users_changes
+            WHERE changed_at >= datetime('now', ?)
+            ORDER BY seq
+            LIMIT 1
+            """,
+            (f"-{retention_days * 86400:.0f} seconds",),
+        ).fetchone()
+        cutoff = kept[0] if kept is not None else sys.maxsize
+        floor = conn.execute(
+            "SELECT MAX(seq) FROM users_changes WHERE seq < ?", (cutoff,)
+        ).fetchone()[0]
+        expired = 0
+        if floor is not None:
+            expired = conn.execute(
+                "DELETE FROM users_changes WHERE seq <= ?", (floor,)
+            ).rowcount
+            conn.execute(
+                "UPDATE users_changes_floor SET seq = MAX(seq, ?) WHERE id = 0",
+                (floor,),
+            )
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return collapsed, expired
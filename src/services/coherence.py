@@ -0,0 +1,89 @@
+import fcntl
+import mmap
+import os
+import struct
+from typing import Optional, Tuple
+
+from src.db import DATABASE_NAME
+
+COHERENCE_FILE = os.getenv("COHERENCE_FILE", f"{DATABASE_NAME}.gen")
+COHERENCE_BUCKETS = int(os.getenv("COHERENCE_BUCKETS", "4096"))
+
+_SLOT = struct.Struct("<Q")
+_EPOCH_SLOT = 0
+_TOTAL_SLOT = 1
+_FIRST_BUCKET_SLOT = 2
+
+Stamp = Tuple[int, int]
+
+
+class GenerationTable:
+    """Счётчики поколений в общем для всех воркеров mmap-файле.
+
+    Файл состоит из 64-битных слотов: эпоха (меняется при массовых
+    изменениях, после которых неизвестно, какие строки затронуты),
+    общее число изменений и счётчики корзин, в которые попадают id
+    пользователей. Запись в базу увеличивает счётчик корзины изменённого
+    id, а кэши сравнивают сохранённую отметку (эпоха, корзина) с текущей:
+    чтение — это два обращения к разделяемой памяти без системных вызовов.
+    """
+
+    def __init__(self, path: str = COHERENCE_FILE, buckets: int = COHERENCE_BUCKETS):
+        self.path = path
+        self.buckets = buckets
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+
+    def _open(self) -> mmap.mmap:
+        if self._map is None:
+            size = (_FIRST_BUCKET_SLOT + self.buckets) * _SLOT.size
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(fd).st_size < size:
+                    os.ftruncate(fd, size)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._fd = fd
+            self._map = mmap.mmap(fd, size)
+        return self._map
+
+    def _read(self, slot: int) -> int:
+        return _SLOT.unpack_from(self._open(), slot * _SLOT.size)[0]
+
+    def _increment(self, slot: int) -> None:
+        buffer = self._open()
+        offset = slot * _SLOT.size
+        _SLOT.pack_into(buffer, offset, _SLOT.unpack_from(buffer, offset)[0] + 1)
+
+    def _bucket_slot(self, user_id: int) -> int:
+        return _FIRST_BUCKET_SLOT + hash(user_id) % self.buckets
+
+    def stamp(self, user_id: int) -> Stamp:
+        return self._read(_EPOCH_SLOT), self._read(self._bucket_slot(user_id))
+
+    def total(self) -> int:
+        return self._read(_TOTAL_SLOT)
+
+    def bump(self, user_id: Optional[int] = None) -> None:
+        """Отмечает изменение пользователя user_id или, без него, всей таблицы."""
+        self._open()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if user_id is None:
+                self._increment(_EPOCH_SLOT)
+            else:
+                self._increment(self._bucket_slot(user_id))
+            self._increment(_TOTAL_SLOT)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map = None
+            self._fd = None
+
+
+generations = GenerationTable()
@@ -0,0 +1,295 @@
+"""Сжатие ответов (zstd, brotli, gzip) с кэшем сжатых тел.
+
+Кодировка выбирается по Accept-Encoding с учётом весов q.
+Ответы с ETag (список /users/, статистика, профили) одинаковы, пока
+не изменилась версия данных, поэтому их сжатые тела кэшируются по пути,
+строке запроса, кодировке и ETag и не сжимаются заново при каждом опросе.
+"""
+import gzip
+import os
+import zlib
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import brotli
+import zstandard
+from starlette.datastructures import Headers, MutableHeaders
+
+COMPRESSION = os.getenv("COMPRESSION", "1") == "1"
+# Тела меньше порога (байты) отдаются без сжатия.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3"))
+# Порядок предпочтения, если клиент принимает несколько кодировок.
+COMPRESSION_ENCODINGS = os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+# Предел суммарного размера сжатых тел в кэше (байты); 0 отключает кэш.
+COMPRESSION_CACHE_BYTES = int(
+    os.getenv("COMPRESSION_CACHE_BYTES", str(32 * 1024 * 1024))
+)
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/plain",
+    "text/html",
+)
+
+
+class _GzipStream:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        # Сброс после каждой порции: потоковая выгрузка не копится в буфере.
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class _ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# Кодировка -> (сжатие целого тела, фабрика потокового сжатия).
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[], object]]] = {
+    "gzip": (
+        lambda data: gzip.compress(data, COMPRESSION_GZIP_LEVEL),
+        lambda: _GzipStream(COMPRESSION_GZIP_LEVEL),
+    ),
+    "br": (
+        lambda data: brotli.compress(data, quality=COMPRESSION_BROTLI_QUALITY),
+        lambda: _BrotliStream(COMPRESSION_BROTLI_QUALITY),
+    ),
+    "zstd": (
+        lambda data: zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(
+            data
+        ),
+        lambda: _ZstdStream(COMPRESSION_ZSTD_LEVEL),
+    ),
+}
+
+PREFERRED_ENCODINGS = tuple(
+    name.strip() for name in COMPRESSION_ENCODINGS.split(",") if name.strip() in CODECS
+)
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Кодировки из Accept-Encoding с весами q."""
+    accepted: Dict[str, float] = {}
+    for part in header.split(","):
+        name, _, parameters = part.strip().partition(";")
+        if not name:
+            continue
+        quality = 1.0
+        parameter, _, value = parameters.strip().partition("=")
+        if parameter.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Кодировка с наибольшим q среди доступных; при равных — по порядку
+    COMPRESSION_ENCODINGS."""
+    accepted = parse_accept_encoding(header)
+    best, best_quality = None, 0.0
+    for name in PREFERRED_ENCODINGS:
+        quality = accepted.get(name, accepted.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+class CompressedCache:
+    """LRU-кэш сжатых тел, ограниченный суммарным размером.
+
+    Вместе с телом хранится контрольная сумма исходного: запись
+    используется, только если обработчик вернул те же байты.
+    """
+
+    def __init__(self, max_bytes: int = COMPRESSION_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[Hashable, Tuple[int, bytes]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, checksum: int) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None or entry[0] != checksum:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, checksum: int, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        previous = self._data.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous[1])
+        self._data[key] = (checksum, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._data.popitem(last=False)
+            self.size -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+compressed_cache = CompressedCache()
+# Счётчики сжатия: экземпляр middleware создаёт Starlette, поэтому они общие.
+counters: Counter = Counter()
+
+
+class CompressionMiddleware:
+    """ASGI-middleware: сжимает ответы по Accept-Encoding.
+
+    Целое тело сжимается один раз (или берётся из кэша по ETag), потоковые
+    ответы (выгрузка) сжимаются по порциям. Поток событий SSE, ответы
+    без тела, уже сжатые и небольшие ответы передаются как есть.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        cache: CompressedCache = compressed_cache,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not COMPRESSION:
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        stream = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, stream, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if stream is not None:
+                chunk = stream.compress(body)
+                if not more_body:
+                    chunk += stream.finish()
+                counters["bytes_in"] += len(body)
+                counters["bytes_out"] += len(chunk)
+                await send({**message, "body": chunk})
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            compressible = self._compressible(headers)
+            etag = None
+            if compressible or start["status"] == 304:
+                # Одинаковые Vary и ETag у ответа любого размера и у 304,
+                # которым он подтверждается: размер 304 неизвестен.
+                etag = self._negotiated(headers)
+            if not compressible or (not more_body and len(body) < self.minimum_size):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            del headers["content-length"]
+            headers["content-encoding"] = encoding
+            counters["responses"] += 1
+            if more_body:
+                stream = CODECS[encoding][1]()
+                chunk = stream.compress(body)
+            else:
+                chunk = self._compress(scope, start, etag, encoding, body)
+                headers["content-length"] = str(len(chunk))
+            counters["bytes_in"] += len(body)
+            counters["bytes_out"] += len(chunk)
+            await send(start)
+            await send({**message, "body": chunk})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _negotiated(headers: MutableHeaders) -> Optional[str]:
+        """Vary и слабый ETag представления при согласованной кодировке;
+        возвращает исходный ETag."""
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag is not None and not etag.startswith("W/"):
+            # Сжатое представление не совпадает побайтно с несжатым.
+            headers["etag"] = f"W/{etag}"
+        return etag
+
+    @staticmethod
+    def _compressible(headers: MutableHeaders) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip()
+        return content_type in COMPRESSIBLE_TYPES
+
+    def _compress(
+        self, scope, start, etag: Optional[str], encoding: str, body: bytes
+    ) -> bytes:
+        compress = CODECS[encoding][0]
+        if etag is None or start["status"] != 200 or self.cache.max_bytes <= 0:
+            return compress(body)
+        key = (scope["path"], scope.get("query_string", b""), encoding, etag)
+        checksum = zlib.crc32(body)
+        compressed = self.cache.get(key, checksum)
+        if compressed is None:
+            compressed = compress(body)
+            self.cache.set(key, checksum, compressed)
+        return compressed
+
+
+def compression_stats() -> Dict[str, int]:
+    return {
+        "responses": counters["responses"],
+        "bytes_in": counters["bytes_in"],
+        "bytes_out": counters["bytes_out"],
+        "cache_hits": compressed_cache.hits,
+        "cache_misses": compressed_cache.misses,
+        "cache_entries": len(compressed_cache),
+        "cache_bytes": compressed_cache.size,
+    }
@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Mapping, Optional, Tuple, Union
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import text
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Версии строк и таблицы ведут триггеры users_version_* (см. миграцию
+# c5d1e8f3a7b2), поэтому их видят все пути записи, включая «сырой» SQL.
+TABLE_VERSION_QUERY = text("SELECT version, updated_at FROM users_version WHERE id = 0")
+
+Timestamp = Union[datetime, str, None]
+
+
+def _as_datetime(value: Timestamp) -> Optional[datetime]:
+    """updated_at из SQLite: datetime через ORM или строка через text()."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def user_etag(user: Union[Mapping[str, Any], Any]) -> str:
+    if isinstance(user, Mapping):
+        return f'"{user["id"]}-{user["version"]}"'
+    return f'"{user.id}-{user.version}"'
+
+
+def list_etag(version: int, resource: str = "users") -> str:
+    return f'"{resource}-{version}"'
+
+
+async def table_version(session: AsyncSession) -> Tuple[int, Timestamp]:
+    """Версия таблицы users и время последнего изменения (одна строка)."""
+    row = (await session.execute(TABLE_VERSION_QUERY)).one()
+    return row.version, row.updated_at
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Для If-None-Match используется слабое сравнение (RFC 9110, 13.1.2).
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def is_not_modified(
+    request: Request, etag: str, last_modified: Optional[datetime]
+) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match имеет приоритет, If-Modified-Since тогда не проверяется.
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return last_modified <= since
+
+
+def conditional_response(
+    request: Request,
+    response: Response,
+    etag: str,
+    updated_at: Timestamp = None,
+) -> Optional[Response]:
+    """Выставляет ETag и Last-Modified в response.
+
+    Возвращает ответ 304 без тела, если условие запроса выполнено, иначе None.
+    """
+    last_modified = _as_datetime(updated_at)
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    if not is_not_modified(request, etag, last_modified):
+        return None
+    not_modified = Response(status_code=304)
+    for key, value in response.headers.items():
+        if key != "content-length":
+            not_modified.headers.append(key, value)
+    return not_modified
@@ -0,0 +1,107 @@
+import contextlib
+import csv
+import io
+import json
+import os
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Executable
+
+from src.db import shard_read_session_makers
+from src.services.shards import merge_streams, sort_key
+from src.services.sorted import USER_FIELDS, Sort
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+EXPORT_FIELDS = USER_FIELDS
+BOOLEAN_FIELDS = ("is_active", "is_superuser", "is_verified")
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _row_to_dict(row: Mapping[str, Any]) -> Dict[str, Any]:
+    user_dict = {field: row[field] for field in EXPORT_FIELDS}
+    for field in BOOLEAN_FIELDS:
+        user_dict[field] = bool(user_dict[field])
+    return user_dict
+
+
+def _ndjson_chunk(rows: Iterable[Mapping[str, Any]]) -> str:
+    return "".join(
+        json.dumps(_row_to_dict(row), ensure_ascii=False) + "\n" for row in rows
+    )
+
+
+def _csv_chunk(rows: Iterable[Mapping[str, Any]], header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        user_dict = _row_to_dict(row)
+        writer.writerow(user_dict[field] for field in EXPORT_FIELDS)
+    return buffer.getvalue()
+
+
+async def _partitions(
+    session: AsyncSession, query: Executable, parameters: Dict[str, Any]
+) -> AsyncIterator[List[Mapping[str, Any]]]:
+    result = await session.stream(query, parameters)
+    async for chunk in result.mappings().partitions(EXPORT_CHUNK_SIZE):
+        yield chunk
+
+
+async def _rows(
+    partitions: AsyncIterator[List[Mapping[str, Any]]]
+) -> AsyncIterator[Mapping[str, Any]]:
+    async for chunk in partitions:
+        for row in chunk:
+            yield row
+
+
+async def _merged_partitions(
+    streams: List[AsyncIterator[List[Mapping[str, Any]]]], sort: Sort
+) -> AsyncIterator[List[Mapping[str, Any]]]:
+    if len(streams) == 1:
+        async for chunk in streams[0]:
+            yield chunk
+        return
+    chunk = []
+    async for row in merge_streams(
+        [_rows(stream) for stream in streams], sort_key(sort)
+    ):
+        chunk.append(row)
+        if len(chunk) >= EXPORT_CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def export_rows(
+    query: Executable, parameters: Dict[str, Any], export_format: str, sort: Sort
+) -> AsyncIterator[bytes]:
+    """Построчно выгружает результат запроса порциями по EXPORT_CHUNK_SIZE строк.
+
+    Сессии открываются внутри генератора, так как он выполняется уже после
+    выхода из обработчика, пока StreamingResponse отправляет тело ответа.
+    Потоки шардов сливаются в порядке sort.
+    """
+    async with contextlib.AsyncExitStack() as stack:
+        streams = [
+            _partitions(
+                await stack.enter_async_context(session_maker()), query, parameters
+            )
+            for session_maker in shard_read_session_makers
+        ]
+        if export_format == "csv":
+            yield _csv_chunk((), header=True).encode()
+        async for chunk in _merged_partitions(streams, sort):
+            if export_format == "csv":
+                yield _csv_chunk(chunk, header=False).encode()
+            else:
+                yield _ndjson_chunk(chunk).encode()
@@ -1,18 +1,96 @@
+import asyncio
 import os
-from typing import Optional
+from typing import Any, Dict, List, Optional, Union
 
 from dotenv import load_dotenv
 from fastapi import Depends, Request
+from fastapi.security import OAuth2PasswordRequestForm
 from fastapi_users import (BaseUserManager, IntegerIDMixin, exceptions, models,
                            schemas)
+from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 
-from src.db import UserTable, get_user_db
+from src.db import (SHARD_COUNT, UserTable, email_shard, next_user_id,
+                    shard_index, shard_read_session_makers)
+from src.services.cache import invalidate_user, user_cache
+from src.services.coherence import generations
+from src.services.metrics import auth_logins
+from src.services.password import password_pool
+from src.services.sorted import CACHED_FIELDS
+from src.services.writer import shard_writer, write_schedulers
 
 load_dotenv()
 
 SECRET = os.getenv("SECRET")
 
 
+class ShardedUserDatabase(SQLAlchemyUserDatabase):
+    """Адаптер fastapi-users поверх шардов.
+
+    Чтение по id выполняется в пуле чтения шарда этого id, поиск по email —
+    во всех шардах параллельно. Регистрация, смена пароля и другие изменения
+    ставятся в очередь планировщика записи шарда, как и изменения роутера
+    /users, поэтому своей сессии у адаптера нет.
+    """
+
+    def __init__(self, user_table: type = UserTable):
+        super().__init__(None, user_table)
+
+    async def get(self, id: Any) -> Optional[UserTable]:
+        async with shard_read_session_makers[shard_index(id)]() as session:
+            return await SQLAlchemyUserDatabase(session, self.user_table).get(id)
+
+    async def get_by_email(self, email: str) -> Optional[UserTable]:
+        async def find(session_maker: sessionmaker) -> Optional[UserTable]:
+            async with session_maker() as session:
+                user_db = SQLAlchemyUserDatabase(session, self.user_table)
+                return await user_db.get_by_email(email)
+
+        users = await asyncio.gather(*map(find, shard_read_session_makers))
+        return next((user for user in users if user is not None), None)
+
+    async def create(self, create_dict: Dict[str, Any]) -> UserTable:
+        shard = email_shard(create_dict["email"])
+
+        async def insert(session: AsyncSession) -> UserTable:
+            user = self.user_table(**create_dict, id=await next_user_id(session, shard))
+            session.add(user)
+            await session.flush()
+            # Версию и updated_at выставил триггер вставки.
+            await session.refresh(user)
+            return user
+
+        return await write_schedulers[shard].submit(insert)
+
+    async def update(self, user: UserTable, update_dict: Dict[str, Any]) -> UserTable:
+        async def apply(session: AsyncSession) -> UserTable:
+            # Изменяется строка, загруженная в сессии писателя: переданный
+            # экземпляр может быть копией из кэша токенов.
+            current = await session.get(self.user_table, user.id)
+            if current is None:
+                raise exceptions.UserNotExists()
+            for key, value in update_dict.items():
+                setattr(current, key, value)
+            await session.flush()
+            await session.refresh(current)
+            return current
+
+        return await shard_writer(user.id).submit(apply)
+
+    async def delete(self, user: UserTable) -> None:
+        query = delete(self.user_table).where(self.user_table.id == user.id)
+        await shard_writer(user.id).submit(
+            lambda write_session: write_session.execute(query)
+        )
+
+
+async def get_user_db():
+    yield ShardedUserDatabase(UserTable)
+
+
 class UserManager(IntegerIDMixin, BaseUserManager[UserTable, int]):
     reset_password_token_secret = SECRET
     verification_token_secret = SECRET
@@ -22,6 +100,38 @@ class UserManager(IntegerIDMixin, BaseUserManager[UserTable, int]):
     ):
         print(f"User {user.id} has registered.")
 
+    async def on_after_update(
+        self,
+        user: UserTable,
+        update_dict: Dict[str, Any],
+        request: Optional[Request] = None,
+    ):
+        invalidate_user(user.id)
+
+    async def on_after_reset_password(
+        self, user: UserTable, request: Optional[Request] = None
+    ):
+        invalidate_user(user.id)
+
+    def _cache_user(self, user: UserTable) -> None:
+        # Новая строка тоже изменение: по счётчику поколений его замечают
+        # модели чтения других воркеров. Отметка ставится до записи в кэш,
+        # иначе запись сразу бы устарела.
+        generations.bump(user.id)
+        user_cache.set(
+            user.id, {field: getattr(user, field) for field in CACHED_FIELDS}
+        )
+
+    async def _create_dict(self, user_create: schemas.UC, safe: bool) -> Dict[str, Any]:
+        user_dict = (
+            user_create.create_update_dict()
+            if safe
+            else user_create.create_update_dict_superuser()
+        )
+        password = user_dict.pop("password")
+        user_dict["hashed_password"] = await password_pool.hash(password)
+        return user_dict
+
     async def create(
         self,
         user_create: schemas.UC,
@@ -32,17 +142,126 @@ class UserManager(IntegerIDMixin, BaseUserManager[UserTable, int]):
         existing_user = await self.user_db.get_by_email(user_create.email)
         if existing_user is not None:
             raise exceptions.UserAlreadyExists()
-        user_dict = (
-            user_create.create_update_dict()
-            if safe
-            else user_create.create_update_dict_superuser()
-        )
-        password = user_dict.pop("password")
-        user_dict["hashed_password"] = self.password_helper.hash(password)
+        user_dict = await self._create_dict(user_create, safe)
         created_user = await self.user_db.create(user_dict)
+        self._cache_user(created_user)
         await self.on_after_register(created_user, request)
         return created_user
 
+    async def create_batch(
+        self,
+        user_creates: List[schemas.UC],
+        safe: bool = False,
+        request: Optional[Request] = None,
+    ) -> List[Union[models.UP, Exception]]:
+        """Создаёт пользователей пачкой, возвращая для каждого пользователя или ошибку.
+
+        Существующие email проверяются одним запросом в каждом шарде, пароли
+        хешируются до записи, а вставки выполняются одной транзакцией
+        планировщика записи шарда, каждая в своей точке сохранения.
+        """
+        results: List[Union[models.UP, Exception, None]] = [None] * len(user_creates)
+        statement = select(UserTable.email).where(
+            func.lower(UserTable.email).in_(
+                [user_create.email.lower() for user_create in user_creates]
+            )
+        )
+
+        async def select_emails(session_maker) -> List[str]:
+            async with session_maker() as session:
+                return list((await session.execute(statement)).scalars())
+
+        shards = await asyncio.gather(*map(select_emails, shard_read_session_makers))
+        taken_emails = {email.lower() for emails in shards for email in emails}
+
+        pending = []
+        for index, user_create in enumerate(user_creates):
+            email = user_create.email.lower()
+            if email in taken_emails:
+                results[index] = exceptions.UserAlreadyExists()
+                continue
+            try:
+                await self.validate_password(user_create.password, user_create)
+            except exceptions.InvalidPasswordException as e:
+                results[index] = e
+                continue
+            taken_emails.add(email)
+            pending.append((index, user_create))
+
+        hashed = await asyncio.gather(
+            *(self._create_dict(user_create, safe) for _, user_create in pending)
+        )
+        by_shard: Dict[int, List] = {}
+        for (index, _), user_dict in zip(pending, hashed):
+            by_shard.setdefault(email_shard(user_dict["email"]), []).append(
+                (index, user_dict)
+            )
+
+        def insert_users(shard: int, shard_pending: List):
+            async def job(session: AsyncSession):
+                outcomes = []
+                user_id = await next_user_id(session, shard)
+                for index, user_dict in shard_pending:
+                    user = UserTable(id=user_id, **user_dict)
+                    try:
+                        async with session.begin_nested():
+                            session.add(user)
+                            await session.flush()
+                        # Версию и updated_at выставил триггер вставки.
+                        await session.refresh(user)
+                    except IntegrityError as e:
+                        outcomes.append((index, e))
+                    else:
+                        outcomes.append((index, user))
+                        user_id += SHARD_COUNT
+                return outcomes
+
+            return job
+
+        shards = await asyncio.gather(
+            *(
+                write_schedulers[shard].submit(insert_users(shard, shard_pending))
+                for shard, shard_pending in by_shard.items()
+            )
+        )
+        for index, outcome in (outcome for outcomes in shards for outcome in outcomes):
+            results[index] = outcome
+        for result in results:
+            if isinstance(result, UserTable):
+                self._cache_user(result)
+                await self.on_after_register(result, request)
+        return results
+
+    async def authenticate(
+        self, credentials: OAuth2PasswordRequestForm
+    ) -> Optional[models.UP]:
+        try:
+            user = await self.get_by_email(credentials.username)
+        except exceptions.UserNotExists:
+            # Хешируем впустую, чтобы время ответа не выдавало существование email.
+            await password_pool.hash(credentials.password)
+            auth_logins.inc(result="failure")
+            return None
+
+        verified, updated_password_hash = await password_pool.verify_and_update(
+            credentials.password, user.hashed_password
+        )
+        if not verified:
+            auth_logins.inc(result="failure")
+            return None
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+        auth_logins.inc(result="success")
+        return user
+
+    async def _update(self, user: models.UP, update_dict: Dict[str, Any]) -> models.UP:
+        update_dict = dict(update_dict)
+        password = update_dict.pop("password", None)
+        if password is not None:
+            await self.validate_password(password, user)
+            update_dict["hashed_password"] = await password_pool.hash(password)
+        return await super()._update(user, update_dict)
+
 
 async def get_user_manager(user_db=Depends(get_user_db)):
     yield UserManager(user_db)
@@ -0,0 +1,352 @@
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.requests import Request
+from starlette.responses import Response
+
+from src.logger import logger
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+# Starlette сам дописывает charset к text/*.
+CONTENT_TYPE = "text/plain; version=0.0.4"
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Метрика с метками в текстовом формате Prometheus."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set(self, value: float, **labels) -> None:
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], LabelValues, float]]:
+        for key, value in self._values.items():
+            yield self.name, self.labelnames, key, value
+
+    def render_samples(self) -> List[str]:
+        return [
+            f"{name}{_format_labels(labelnames, values)} {_format_value(value)}"
+            for name, labelnames, values, value in self.samples()
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = HTTP_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> [счётчики корзин..., сумма, количество].
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def samples(self) -> Iterable[Tuple[str, Sequence[str], LabelValues, float]]:
+        bucket_labels = self.labelnames + ("le",)
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_labels, key + (
+                    _format_value(bound),
+                ), cumulative
+            yield f"{self.name}_bucket", bucket_labels, key + ("+Inf",), series[-1]
+            yield f"{self.name}_sum", self.labelnames, key, series[-2]
+            yield f"{self.name}_count", self.labelnames, key, series[-1]
+
+
+Collector = Callable[[], Iterable[Metric]]
+
+
+class Registry:
+    """Метрики процесса. Значения, которые уже считаются в других объектах
+    (кэши, пулы), снимаются коллекторами в момент запроса /metrics."""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        # Одноимённые метрики разных коллекторов (например, размеры двух
+        # кэшей) выводятся одним семейством с общими HELP и TYPE.
+        families: Dict[str, List[Metric]] = {}
+        for metric in self._metrics:
+            families.setdefault(metric.name, []).append(metric)
+        for collector in self._collectors:
+            for metric in collector():
+                families.setdefault(metric.name, []).append(metric)
+        lines: List[str] = []
+        for name, metrics in families.items():
+            lines.append(f"# HELP {name} {metrics[0].documentation}")
+            lines.append(f"# TYPE {name} {metrics[0].type}")
+            for metric in metrics:
+                lines.extend(metric.render_samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(
+    Counter(
+        "http_requests_total",
+        "HTTP requests by route template and status.",
+        ("method", "route", "status"),
+    )
+)
+http_request_duration = registry.register(
+    Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route template, including the response body.",
+        ("method", "route"),
+    )
+)
+http_requests_in_flight = registry.register(
+    Gauge("http_requests_in_flight", "HTTP requests being processed.", ("method",))
+)
+sql_query_duration = registry.register(
+    Histogram(
+        "sql_query_duration_seconds",
+        "SQL statement latency by engine and normalized statement.",
+        ("engine", "statement"),
+        SQL_BUCKETS,
+    )
+)
+sql_errors = registry.register(
+    Counter("sql_errors_total", "Failed SQL statements.", ("engine",))
+)
+sql_slow_queries = registry.register(
+    Counter(
+        "sql_slow_queries_total",
+        "SQL statements slower than SLOW_QUERY_MS.",
+        ("engine",),
+    )
+)
+pool_checkouts = registry.register(
+    Counter("db_pool_checkouts_total", "Connection pool checkouts.", ("engine",))
+)
+auth_logins = registry.register(
+    Counter("auth_logins_total", "Login attempts by result.", ("result",))
+)
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Маршруты Starlette (например, /docs) не кладут себя в scope,
+    # а несовпавшие пути не должны порождать новые ряды.
+    return scope["path"] if "endpoint" in scope else "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка, статус и число запросов в работе по маршрутам."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec(method=method)
+            route = _route_template(scope)
+            http_requests.inc(method=method, route=route, status=status_code)
+            http_request_duration.observe(elapsed, method=method, route=route)
+
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+@lru_cache(maxsize=1024)
+def normalize_statement(statement: str) -> str:
+    """Приводит запрос к форме без литералов: списки IN (?, ?, ...) сворачиваются."""
+    statement = _WHITESPACE.sub(" ", statement).strip()
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    return _PLACEHOLDER_LIST.sub("(?...)", statement)
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """Подключает к движку замер каждого запроса, журнал медленных запросов
+    и счётчики пула соединений."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        normalized = normalize_statement(statement)
+        sql_query_duration.observe(elapsed, engine=name, statement=normalized)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            sql_slow_queries.inc(engine=name)
+            logger.warning(
+                f"Slow query on {name} ({elapsed * 1000:.1f} ms): {normalized}"
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        started = (
+            context.connection.info.get("query_started") if context.connection else None
+        )
+        if started:
+            started.pop()
+        sql_errors.inc(engine=name)
+
+    @event.listens_for(sync_engine.pool, "checkout")
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_checkouts.inc(engine=name)
+
+    def collect_pool() -> Iterable[Metric]:
+        pool = sync_engine.pool
+        checked_out = Gauge(
+            "db_pool_checked_out",
+            "Connections currently checked out.",
+            ("engine",),
+        )
+        checked_out.set(pool.checkedout(), engine=name)
+        size = Gauge("db_pool_size", "Connection pool size.", ("engine",))
+        size.set(pool.size(), engine=name)
+        return checked_out, size
+
+    registry.register_collector(collect_pool)
+
+
+def cache_collector(name: str, cache) -> Collector:
+    """Коллектор для LRUCache: размер и счётчики попаданий, промахов, вытеснений."""
+
+    def collect() -> Iterable[Metric]:
+        stats = cache.stats()
+        size = Gauge("cache_entries", "Entries in the cache.", ("cache",))
+        size.set(stats.pop("size"), cache=name)
+        metrics: List[Metric] = [size]
+        for key, value in stats.items():
+            counter = Counter(f"cache_{key}_total", f"Cache {key}.", ("cache",))
+            counter.set(value, cache=name)
+            metrics.append(counter)
+        return metrics
+
+    return collect
+
+
+def stats_collector(
+    prefix: str,
+    documentation: str,
+    stats: Callable[[], Dict],
+    counters: Sequence[str] = (),
+) -> Collector:
+    """Коллектор для объекта со stats(): ключи из counters выставляются
+    счётчиками {prefix}_{key}_total, остальные — gauge {prefix}_{key}."""
+
+    def collect() -> Iterable[Metric]:
+        metrics: List[Metric] = []
+        for key, value in stats().items():
+            if key in counters:
+                metric: Metric = Counter(
+                    f"{prefix}_{key}_total", f"{documentation}: {key}."
+                )
+            else:
+                metric = Gauge(f"{prefix}_{key}", f"{documentation}: {key}.")
+            metric.set(value)
+            metrics.append(metric)
+        return metrics
+
+    return collect
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(registry.render(), media_type=CONTENT_TYPE)
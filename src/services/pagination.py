@@ -0,0 +1,31 @@
+import base64
+import binascii
+import json
+from typing import Any, List, Mapping, Tuple
+
+from src.services.sorted import Sort, sort_string
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(sort: Sort, row: Mapping[str, Any]) -> str:
+    payload = {
+        "s": sort_string(sort),
+        "k": [row[column] for column, _ in sort[:-1]],
+        "i": row["id"],
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: Sort) -> Tuple[List[Any], int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        keys, last_id = list(payload["k"]), int(payload["i"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if payload.get("s") != sort_string(sort) or len(keys) != len(sort) - 1:
+        raise ValueError("Cursor does not match sort_by")
+    return keys, last_id
@@ -0,0 +1,108 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import (Executor, ProcessPoolExecutor,
+                                ThreadPoolExecutor)
+from typing import Dict, Optional, Tuple
+
+from fastapi_users.password import PasswordHelper
+
+PASSWORD_POOL = os.getenv("PASSWORD_POOL", "thread")
+# Число воркеров gunicorn (.docker/app.sh): пулы всех воркеров делят одни
+# и те же процессоры, поэтому каждому достаётся их доля.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+PASSWORD_POOL_SIZE = int(
+    os.getenv(
+        "PASSWORD_POOL_SIZE", str((os.cpu_count() or 1) // max(1, WEB_CONCURRENCY))
+    )
+)
+
+_helper: Optional[PasswordHelper] = None
+
+
+def _get_helper() -> PasswordHelper:
+    global _helper
+    if _helper is None:
+        _helper = PasswordHelper()
+    return _helper
+
+
+def hash_password(password: str) -> str:
+    return _get_helper().hash(password)
+
+
+def verify_and_update(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    return _get_helper().verify_and_update(plain_password, hashed_password)
+
+
+class PasswordPool:
+    """Хеширование и проверка паролей вне цикла событий.
+
+    thread (по умолчанию) — пул потоков: bcrypt отпускает GIL на время
+    хеширования, поэтому потоки считают параллельно. process — пул процессов
+    для схем, которые GIL держат; процессы запускаются через spawn, а не
+    fork, чтобы не копировать потоки aiosqlite и журнала из воркера.
+    Задачи сверх числа воркеров ждут в очереди исполнителя, её глубина
+    доступна в stats().
+    """
+
+    def __init__(self, kind: str = PASSWORD_POOL, size: int = PASSWORD_POOL_SIZE):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown password pool {kind!r}")
+        self.kind = kind
+        self.size = max(1, size)
+        self._executor: Optional[Executor] = None
+        self.in_flight = 0
+        self.completed = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.size,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.size, thread_name_prefix="password"
+                )
+        return self._executor
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify_and_update(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        return await self._run(verify_and_update, plain_password, hashed_password)
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.size)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": self.size,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_pool = PasswordPool()
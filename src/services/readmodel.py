@@ -0,0 +1,534 @@
+"""Колоночная модель чтения таблицы users в памяти процесса.
+
+Столбцы хранятся массивами (array, bytearray) и списками строк, для каждого
+поля сортировки поддерживается перестановка строк, упорядоченная по
+(поле, id), а рядом — байты с кодами флагов строк в том же порядке, по
+которым фильтры по флагам находят строки страницы поиском на уровне C.
+Список пользователей с фильтрами, сортировкой по одному полю и курсором,
+а также поиск по подстроке отвечаются без обращения к SQLite.
+
+Модель догоняет базу по журналу users_changes: перед чтением проверяется
+общий счётчик изменений в разделяемой памяти (src.services.coherence),
+и только если он изменился (или прошло READ_MODEL_REFRESH секунд),
+из журнала читаются новые записи.
+"""
+import array
+import asyncio
+import bisect
+import heapq
+import os
+import sqlite3
+import string
+import sys
+import time
+from typing import (Any, Callable, Dict, Iterable, Iterator, List, Optional,
+                    Sequence, Tuple)
+
+from src.db import DATABASE_NAME, read_session_maker
+from src.services.changes import (CHANGES_SQL, FLOOR_SQL, HEAD_SQL,
+                                  MAX_CHANGES_LIMIT, ChangesExpired,
+                                  change_entry, read_changes)
+from src.services.coherence import generations
+from src.services.conditional import TABLE_VERSION_QUERY, table_version
+from src.services.search import MIN_FTS_QUERY_LENGTH
+from src.services.sorted import SORT_COLUMNS, USER_COLUMNS, USER_FIELDS, Sort
+
+READ_MODEL = os.getenv("READ_MODEL", "0") == "1"
+# Наибольшая задержка, с которой модель замечает изменения, сделанные
+# в обход приложения (без отметки в таблице поколений), в секундах.
+READ_MODEL_REFRESH = float(os.getenv("READ_MODEL_REFRESH", "5"))
+# Доля удалённых строк, после которой столбцы пересобираются без них.
+READ_MODEL_COMPACT_RATIO = 0.25
+
+TEXT_COLUMNS = ("username", "email", "avatar", "phone_number")
+FLAG_COLUMNS = ("is_active", "is_superuser", "is_verified")
+FLAG_FILTERS = {
+    "active": "is_active",
+    "superuser": "is_superuser",
+    "verified": "is_verified",
+}
+
+# lower() в SQLite без ICU приводит к нижнему регистру только ASCII.
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+_SEPARATOR = "\x00"
+
+Row = Dict[str, Any]
+
+
+def ascii_lower(value: str) -> str:
+    return value.translate(_ASCII_LOWER)
+
+
+def _accepted_codes(expected: Dict[str, Any]) -> Optional[bytes]:
+    """Коды флагов (бит i — FLAG_COLUMNS[i]), подходящие под фильтры по
+    флагам; None — фильтров по флагам нет."""
+    if not expected:
+        return None
+    mask = want = 0
+    for bit, column in enumerate(FLAG_COLUMNS):
+        if column in expected:
+            mask |= 1 << bit
+            if expected[column]:
+                want |= 1 << bit
+    return bytes(code for code in range(1 << len(FLAG_COLUMNS)) if code & mask == want)
+
+
+def _code_positions(
+    codes: bytearray, accepted: bytes, start: int, stop: int, descending: bool
+) -> Iterator[int]:
+    """Позиции из [start, stop) с кодом из accepted в порядке обхода.
+
+    Следующая позиция каждого кода ищется bytearray.find (rfind) на уровне C,
+    ближайшая из них выбирается кучей: неподходящие строки Python не
+    перебирает.
+    """
+
+    def following(code: int, position: int) -> int:
+        if descending:
+            return codes.rfind(code, start, position)
+        return codes.find(code, position, stop)
+
+    sign = -1 if descending else 1
+    heads = []
+    for code in accepted:
+        position = following(code, stop if descending else start)
+        if position >= 0:
+            heads.append((sign * position, code))
+    heapq.heapify(heads)
+    while heads:
+        order, code = heapq.heappop(heads)
+        position = sign * order
+        yield position
+        position = following(code, position if descending else position + 1)
+        if position >= 0:
+            heapq.heappush(heads, (sign * position, code))
+
+
+class ReadModel:
+    def __init__(self):
+        self._clear()
+        self.seq = 0
+        self.version: Optional[int] = None
+        self.updated_at: Any = None
+        self.loaded = False
+        self.refreshes = 0
+        self.reloads = 0
+        self._seen_total: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _clear(self) -> None:
+        self.ids = array.array("q")
+        self.text: Dict[str, List[Optional[str]]] = {c: [] for c in TEXT_COLUMNS}
+        self.flags: Dict[str, bytearray] = {c: bytearray() for c in FLAG_COLUMNS}
+        self.rows_by_id: Dict[int, int] = {}
+        # username в нижнем регистре (ASCII, как lower() в SQLite) -> строки.
+        self.by_username: Dict[str, List[int]] = {}
+        # Поле -> номера живых строк по возрастанию (поле, id).
+        self.permutations: Dict[str, array.array] = {}
+        # Поле -> коды флагов строк (см. _code) в порядке его перестановки:
+        # по ним фильтры по флагам находят строки страницы без обхода в Python.
+        self.flag_codes: Dict[str, bytearray] = {}
+        self.dead = 0
+        # Строки поиска по способу свёртки регистра: только ASCII или Unicode.
+        self._haystacks: Dict[bool, Tuple[str, str, array.array, array.array]] = {}
+
+    # Построение и изменение.
+
+    def build(self, rows: Iterable[Sequence[Any]]) -> None:
+        """Заполняет модель строками в порядке USER_FIELDS, отсортированными по id."""
+        self._clear()
+        for row in rows:
+            self._append_columns(dict(zip(USER_FIELDS, row)))
+        count = len(self.ids)
+        # Строки идут по возрастанию id, а сортировка устойчива, поэтому
+        # при равных значениях поля порядок по id сохраняется.
+        self.permutations["id"] = array.array("q", range(count))
+        for column in SORT_COLUMNS:
+            values = self._values(column)
+            self.permutations[column] = array.array(
+                "q", sorted(range(count), key=values.__getitem__)
+            )
+        codes = bytearray(map(self._code, range(count)))
+        for column, permutation in self.permutations.items():
+            self.flag_codes[column] = bytearray(map(codes.__getitem__, permutation))
+
+    def _code(self, row: int) -> int:
+        flags = self.flags
+        return sum(flags[column][row] << bit for bit, column in enumerate(FLAG_COLUMNS))
+
+    def _values(self, column: str) -> Sequence[Any]:
+        if column == "id":
+            return self.ids
+        return self.flags[column] if column in self.flags else self.text[column]
+
+    def _key(self, column: str) -> Callable[[int], Any]:
+        ids = self.ids
+        if column == "id":
+            return ids.__getitem__
+        values = self._values(column)
+        return lambda row: (values[row], ids[row])
+
+    def _append_columns(self, user: Row) -> int:
+        row = len(self.ids)
+        self.ids.append(user["id"])
+        for column in TEXT_COLUMNS:
+            self.text[column].append(user[column])
+        for column in FLAG_COLUMNS:
+            self.flags[column].append(1 if user[column] else 0)
+        self.rows_by_id[user["id"]] = row
+        self.by_username.setdefault(ascii_lower(user["username"]), []).append(row)
+        return row
+
+    def _unlink(self, row: int) -> None:
+        """Убирает строку из перестановок и индекса имён по текущим значениям."""
+        for column, permutation in self.permutations.items():
+            key = self._key(column)
+            position = bisect.bisect_left(permutation, key(row), key=key)
+            del permutation[position]
+            del self.flag_codes[column][position]
+        self.by_username[ascii_lower(self.text["username"][row])].remove(row)
+
+    def _link(self, row: int) -> None:
+        code = self._code(row)
+        for column, permutation in self.permutations.items():
+            key = self._key(column)
+            position = bisect.bisect_right(permutation, key(row), key=key)
+            permutation.insert(position, row)
+            self.flag_codes[column].insert(position, code)
+        rows = self.by_username.setdefault(ascii_lower(self.text["username"][row]), [])
+        bisect.insort(rows, row, key=self.ids.__getitem__)
+
+    def apply(self, user_id: int, user: Optional[Row]) -> None:
+        """Приводит строку user_id к состоянию user (None — строка удалена)."""
+        row = self.rows_by_id.get(user_id)
+        self._haystacks = {}
+        if user is None:
+            if row is not None:
+                self._unlink(row)
+                del self.rows_by_id[user_id]
+                self.dead += 1
+                if self.dead > len(self.rows_by_id) * READ_MODEL_COMPACT_RATIO:
+                    self.compact()
+            return
+        if row is None:
+            row = len(self.ids)
+            self.ids.append(user_id)
+            for column in TEXT_COLUMNS:
+                self.text[column].append(user[column])
+            for column in FLAG_COLUMNS:
+                self.flags[column].append(1 if user[column] else 0)
+            self.rows_by_id[user_id] = row
+        else:
+            self._unlink(row)
+            for column in TEXT_COLUMNS:
+                self.text[column][row] = user[column]
+            for column in FLAG_COLUMNS:
+                self.flags[column][row] = 1 if user[column] else 0
+        self._link(row)
+
+    def apply_changes(self, entries: Iterable[Dict[str, Any]]) -> None:
+        for entry in entries:
+            self.apply(entry["id"], entry["user"])
+            self.seq = entry["seq"]
+
+    def compact(self) -> None:
+        """Пересобирает столбцы без удалённых строк."""
+        live = [
+            tuple(self._row(row)[field] for field in USER_FIELDS)
+            for row in self.permutations["id"]
+        ]
+        self.build(live)
+
+    # Чтение.
+
+    def _row(self, row: int) -> Row:
+        text, flags = self.text, self.flags
+        return {
+            "id": self.ids[row],
+            "username": text["username"][row],
+            "email": text["email"][row],
+            "avatar": text["avatar"][row],
+            "phone_number": text["phone_number"][row],
+            "is_active": bool(flags["is_active"][row]),
+            "is_superuser": bool(flags["is_superuser"][row]),
+            "is_verified": bool(flags["is_verified"][row]),
+        }
+
+    @staticmethod
+    def supports(sort: Sort) -> bool:
+        """Готовые перестановки есть для одного поля (и id) в одном направлении."""
+        if len(sort) == 1:
+            return True
+        return len(sort) == 2 and sort[0][1] == sort[1][1]
+
+    def select(
+        self,
+        filters: Tuple[str, ...],
+        parameters: Dict[str, Any],
+        sort: Sort,
+        cursor: Optional[Tuple[List[Any], int]] = None,
+        limit: Optional[int] = None,
+    ) -> List[Row]:
+        """То же, что users_query с теми же параметрами, для сортировок,
+        которые поддерживает supports()."""
+        column, descending = sort[0]
+        key = self._key(column)
+        if "username" in filters:
+            name = ascii_lower(parameters["filter_username"])
+            ordered: Sequence[int] = sorted(self.by_username.get(name, ()), key=key)
+        else:
+            ordered = self.permutations[column]
+        start, stop = 0, len(ordered)
+        if cursor is not None:
+            keys, last_id = cursor
+            bound = last_id if column == "id" else (keys[0], last_id)
+            if descending:
+                stop = bisect.bisect_left(ordered, bound, key=key)
+            else:
+                start = bisect.bisect_right(ordered, bound, key=key)
+        accepted = _accepted_codes(
+            {
+                FLAG_FILTERS[name]: parameters[f"filter_{name}"]
+                for name in filters
+                if name in FLAG_FILTERS
+            }
+        )
+        positions: Iterable[int]
+        if accepted is not None and "username" not in filters:
+            positions = _code_positions(
+                self.flag_codes[column], accepted, start, stop, descending
+            )
+            accepted = None
+        else:
+            positions = (
+                range(stop - 1, start - 1, -1) if descending else range(start, stop)
+            )
+        result: List[Row] = []
+        for position in positions:
+            row = ordered[position]
+            # Под фильтром по имени строк считаные единицы: их флаги
+            # проверяются по одной.
+            if accepted is None or self._code(row) in accepted:
+                result.append(self._row(row))
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+
+    def _search_haystacks(
+        self, ascii_only: bool
+    ) -> Tuple[str, str, array.array, array.array]:
+        """Имена и email всех строк в порядке id одной строкой каждый."""
+        if ascii_only not in self._haystacks:
+            lower = ascii_lower if ascii_only else str.lower
+            rows = self.permutations["id"]
+            usernames = [lower(self.text["username"][row]) for row in rows]
+            emails = [lower(self.text["email"][row]) for row in rows]
+            self._haystacks[ascii_only] = (
+                _SEPARATOR.join(usernames),
+                _SEPARATOR.join(emails),
+                _offsets(usernames),
+                _offsets(emails),
+            )
+        return self._haystacks[ascii_only]
+
+    def search(self, search_query: str, include_email: bool, limit: int) -> List[Row]:
+        """Пользователи, у которых username (или email) содержит подстроку,
+        без учёта регистра, по возрастанию id.
+
+        Регистр сворачивается как в SQL-поиске: для коротких запросов (LIKE)
+        только ASCII, для остальных (FTS5 trigram) — Unicode. Порядок
+        отличается: FTS5 ранжирует по релевантности, модель отдаёт по id.
+        """
+        ascii_only = len(search_query) < MIN_FTS_QUERY_LENGTH
+        needle = ascii_lower(search_query) if ascii_only else search_query.lower()
+        if not needle or _SEPARATOR in needle:
+            return []
+        usernames, emails, username_offsets, email_offsets = self._search_haystacks(
+            ascii_only
+        )
+        found = _find(usernames, username_offsets, needle, limit)
+        if include_email:
+            found = sorted(
+                set(found) | set(_find(emails, email_offsets, needle, limit))
+            )
+        rows = self.permutations["id"]
+        return [self._row(rows[position]) for position in found[:limit]]
+
+    # Сверка с базой и отчёт о памяти.
+
+    def check(self, conn: sqlite3.Connection) -> List[str]:
+        """Расхождения модели с таблицей users (данные и порядок сортировок).
+
+        Сравнивать нужно с базой в том же состоянии, что и модель.
+        """
+        problems: List[str] = []
+        expected = {
+            row[0]: tuple(row)
+            for row in conn.execute(f"SELECT {USER_COLUMNS} FROM users")
+        }
+        for user_id, row in self.rows_by_id.items():
+            actual = tuple(self._row(row)[field] for field in USER_FIELDS)
+            if user_id not in expected:
+                problems.append(f"user {user_id} is not in the database")
+            elif actual != expected[user_id]:
+                problems.append(f"user {user_id} differs from the database")
+        for user_id in expected.keys() - self.rows_by_id.keys():
+            problems.append(f"user {user_id} is missing")
+        for column, permutation in self.permutations.items():
+            order = [
+                row[0]
+                for row in conn.execute(f"SELECT id FROM users ORDER BY {column}, id")
+            ]
+            if [self.ids[row] for row in permutation] != order:
+                problems.append(f"order by {column} differs from the database")
+            if self.flag_codes[column] != bytearray(map(self._code, permutation)):
+                problems.append(f"flag codes for {column} are out of date")
+        return problems
+
+    def memory_report(self) -> Dict[str, int]:
+        """Приблизительный объём памяти по столбцам и индексам, в байтах."""
+        report = {"ids": sys.getsizeof(self.ids)}
+        for column, values in self.text.items():
+            report[column] = sys.getsizeof(values) + sum(
+                sys.getsizeof(value) for value in values if value is not None
+            )
+        for column, values in self.flags.items():
+            report[column] = sys.getsizeof(values)
+        for column, permutation in self.permutations.items():
+            report[f"sort_{column}"] = sys.getsizeof(permutation)
+            report[f"flags_{column}"] = sys.getsizeof(self.flag_codes[column])
+        report["rows_by_id"] = sys.getsizeof(self.rows_by_id)
+        report["by_username"] = sys.getsizeof(self.by_username) + sum(
+            sys.getsizeof(rows) for rows in self.by_username.values()
+        )
+        if self._haystacks:
+            report["search"] = sum(
+                sys.getsizeof(part)
+                for haystacks in self._haystacks.values()
+                for part in haystacks
+            )
+        report["total"] = sum(report.values())
+        return report
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rows": len(self.rows_by_id),
+            "dead_rows": self.dead,
+            "seq": self.seq,
+            "refreshes": self.refreshes,
+            "reloads": self.reloads,
+        }
+
+    # Загрузка и обновление из базы.
+
+    def load(self, conn: sqlite3.Connection) -> None:
+        """Полная загрузка одним снимком: строки, версия таблицы и номер журнала."""
+        conn.execute("BEGIN")
+        try:
+            version, updated_at = conn.execute(str(TABLE_VERSION_QUERY)).fetchone()
+            seq = conn.execute(HEAD_SQL).fetchone()[0]
+            self.build(conn.execute(f"SELECT {USER_COLUMNS} FROM users ORDER BY id"))
+        finally:
+            conn.execute("COMMIT")
+        self.seq, self.version, self.updated_at = seq, version, updated_at
+        self.loaded = True
+
+    def refresh_from(self, conn: sqlite3.Connection) -> None:
+        """Синхронное обновление по журналу (для сверки из командной строки)."""
+        conn.row_factory = sqlite3.Row
+        conn.execute("BEGIN")
+        try:
+            if self.seq < conn.execute(FLOOR_SQL).fetchone()[0]:
+                raise ChangesExpired()
+            version, updated_at = conn.execute(str(TABLE_VERSION_QUERY)).fetchone()
+            while True:
+                rows = conn.execute(
+                    str(CHANGES_SQL), {"since": self.seq, "limit": MAX_CHANGES_LIMIT}
+                ).fetchall()
+                self.apply_changes(change_entry(row) for row in rows)
+                if len(rows) < MAX_CHANGES_LIMIT:
+                    break
+        finally:
+            conn.execute("COMMIT")
+            conn.row_factory = None
+        self.version, self.updated_at = version, updated_at
+
+    async def reload(self, database: str = DATABASE_NAME) -> None:
+        def load() -> "ReadModel":
+            model = ReadModel()
+            conn = sqlite3.connect(database, isolation_level=None)
+            try:
+                model.load(conn)
+            finally:
+                conn.close()
+            return model
+
+        model = await asyncio.to_thread(load)
+        # Новая модель строится в потоке, а подменяется целиком в цикле событий.
+        lock, refreshes, reloads = self._lock, self.refreshes, self.reloads
+        self.__dict__.update(model.__dict__)
+        self._lock, self.refreshes, self.reloads = lock, refreshes, reloads + 1
+
+    async def refresh(self) -> None:
+        async with self._lock:
+            total = generations.total()
+            expired = False
+            async with read_session_maker() as session:
+                version, updated_at = await table_version(session)
+                if version != self.version:
+                    try:
+                        while True:
+                            entries, _, more = await read_changes(
+                                session, self.seq, MAX_CHANGES_LIMIT
+                            )
+                            self.apply_changes(entries)
+                            if not more:
+                                break
+                    except ChangesExpired:
+                        expired = True
+                    else:
+                        self.version, self.updated_at = version, updated_at
+                        self.refreshes += 1
+            if expired:
+                await self.reload()
+            self._seen_total = total
+            self._checked_at = time.monotonic()
+
+    async def ensure_fresh(self) -> None:
+        """Догоняет базу, если другие воркеры отметили изменения или истёк
+        READ_MODEL_REFRESH; иначе обходится без обращения к базе."""
+        if (
+            generations.total() != self._seen_total
+            or time.monotonic() - self._checked_at >= READ_MODEL_REFRESH
+        ):
+            await self.refresh()
+
+    @property
+    def ready(self) -> bool:
+        return READ_MODEL and self.loaded
+
+
+def _offsets(values: List[str]) -> array.array:
+    offsets = array.array("q")
+    position = 0
+    for value in values:
+        offsets.append(position)
+        position += len(value) + len(_SEPARATOR)
+    return offsets
+
+
+def _find(haystack: str, offsets: array.array, needle: str, limit: int) -> List[int]:
+    """Номера строк (позиции в порядке id), содержащих needle; не больше limit."""
+    found: List[int] = []
+    position = haystack.find(needle)
+    while position != -1 and len(found) < limit:
+        index = bisect.bisect_right(offsets, position) - 1
+        found.append(index)
+        if index + 1 >= len(offsets):
+            break
+        position = haystack.find(needle, offsets[index + 1])
+    return found
+
+
+read_model = ReadModel()
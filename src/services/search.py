@@ -0,0 +1,74 @@
+from operator import itemgetter
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from src.services.sorted import select_fields
+
+DEFAULT_SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 1000
+
+# trigram-токенизатор индексирует подстроки из трёх символов,
+# более короткие запросы FTS5 обработать не может.
+MIN_FTS_QUERY_LENGTH = 3
+
+
+def _fts_phrase(search_query: str) -> str:
+    return '"' + search_query.replace('"', '""') + '"'
+
+
+def _like_pattern(search_query: str) -> str:
+    escaped = search_query
+    for special in ("\\", "%", "_"):
+        escaped = escaped.replace(special, "\\" + special)
+    return f"%{escaped}%"
+
+
+def search_query_sql(
+    search_query: str,
+    include_email: bool,
+    limit: int,
+    fields: Optional[Tuple[str, ...]] = None,
+    ranked: bool = True,
+) -> Tuple[str, Dict[str, Any]]:
+    """SQL поиска. Без ranked совпадения FTS упорядочены по id, а не по
+    релевантности: оценки bm25 зависят от числа и длины строк в своей базе
+    и между шардами несравнимы."""
+    # id и rank нужны для слияния ответов шардов (см. search_key).
+    columns = select_fields(fields, (("id", False),))
+    if len(search_query) >= MIN_FTS_QUERY_LENGTH:
+        match_columns = "{username email}" if include_email else "{username}"
+        qualified = ", ".join(f"users.{column}" for column in columns)
+        rank, order = (", users_fts.rank", "rank") if ranked else ("", "users.id")
+        sql_query = f"""
+            SELECT {qualified}{rank}
+            FROM users_fts
+            JOIN users ON users.id = users_fts.rowid
+            WHERE users_fts MATCH :match
+            ORDER BY {order}
+            LIMIT :limit
+        """
+        parameters = {
+            "match": f"{match_columns} : {_fts_phrase(search_query)}",
+            "limit": limit,
+        }
+        return sql_query, parameters
+
+    conditions = ["username LIKE :pattern ESCAPE '\\'"]
+    if include_email:
+        conditions.append("email LIKE :pattern ESCAPE '\\'")
+    sql_query = f"""
+        SELECT {", ".join(columns)}
+        FROM users
+        WHERE {" OR ".join(conditions)}
+        ORDER BY id
+        LIMIT :limit
+    """
+    return sql_query, {"pattern": _like_pattern(search_query), "limit": limit}
+
+
+def search_key(
+    search_query: str, ranked: bool = True
+) -> Callable[[Mapping[str, Any]], Any]:
+    """Порядок строк, который задаёт search_query_sql для этого запроса."""
+    if ranked and len(search_query) >= MIN_FTS_QUERY_LENGTH:
+        return itemgetter("rank")
+    return itemgetter("id")
@@ -0,0 +1,156 @@
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import orjson
+from pydantic import TypeAdapter
+from starlette.responses import Response
+
+from src.apps import schemas
+
+# orjson — строки из курсора сразу в байты JSON; pydantic — один проход
+# TypeAdapter (проверка и сериализация в pydantic-core); model — прежний путь
+# через модели и response_model FastAPI.
+SERIALIZERS = ("orjson", "pydantic", "model")
+USER_SERIALIZER = os.getenv("USER_SERIALIZER", "orjson")
+
+RowMapping = Mapping[str, Any]
+Fields = Optional[Tuple[str, ...]]
+
+_USER_FIELDS = tuple(
+    (name, field.annotation is bool)
+    for name, field in schemas.UserSchema.model_fields.items()
+)
+_USERS_ADAPTER = TypeAdapter(List[schemas.UserSchema])
+
+
+def _parse_routes(value: str) -> Dict[str, str]:
+    routes = {}
+    for item in value.split(","):
+        if item.strip():
+            route, serializer = item.split("=")
+            routes[route.strip()] = serializer.strip()
+    return routes
+
+
+# Переопределения для отдельных маршрутов (имя обработчика=сериализатор):
+# USER_SERIALIZER_ROUTES="search_users=pydantic,get_user_by_id=model".
+ROUTE_SERIALIZERS = _parse_routes(os.getenv("USER_SERIALIZER_ROUTES", ""))
+
+for _serializer in (USER_SERIALIZER, *ROUTE_SERIALIZERS.values()):
+    if _serializer not in SERIALIZERS:
+        raise ValueError(f"Unknown user serializer {_serializer!r}")
+
+
+def serializer_for(route: str) -> str:
+    return ROUTE_SERIALIZERS.get(route, USER_SERIALIZER)
+
+
+@lru_cache(maxsize=256)
+def _projection(fields: Fields) -> Tuple[Tuple[str, bool], ...]:
+    if fields is None:
+        return _USER_FIELDS
+    return tuple((name, is_bool) for name, is_bool in _USER_FIELDS if name in fields)
+
+
+def user_row(row: RowMapping, fields: Fields = None) -> Dict[str, Any]:
+    """Строка users в порядке полей UserSchema; 0/1 SQLite приводятся к bool.
+
+    Если задан fields, в результат попадают только эти поля.
+    """
+    return {
+        name: (bool(row[name]) if is_bool else row[name])
+        for name, is_bool in _projection(fields)
+    }
+
+
+def dump_users(
+    rows: Sequence[RowMapping], serializer: str, fields: Fields = None
+) -> bytes:
+    """JSON-массив пользователей; вывод совпадает с ответом FastAPI побайтно.
+
+    Неполные строки (fields) не проходят проверку UserSchema, поэтому
+    выборка полей всегда сериализуется через orjson.
+    """
+    if serializer == "pydantic" and fields is None:
+        users = _USERS_ADAPTER.validate_python([dict(row) for row in rows])
+        return _USERS_ADAPTER.dump_json(users)
+    return orjson.dumps([user_row(row, fields) for row in rows])
+
+
+def dump_user(row: RowMapping, serializer: str, fields: Fields = None) -> bytes:
+    if serializer == "pydantic" and fields is None:
+        return schemas.UserSchema.model_validate(dict(row)).model_dump_json().encode()
+    return orjson.dumps(user_row(row, fields))
+
+
+def json_response(content: bytes, response: Response = None) -> Response:
+    """Готовые байты JSON; заголовки, выставленные обработчиком в response,
+    переносятся, так как FastAPI их не сливает с возвращённым ответом."""
+    fast_response = Response(content, media_type="application/json")
+    if response is not None:
+        for key, value in response.headers.items():
+            if key != "content-length":
+                fast_response.headers.append(key, value)
+    return fast_response
+
+
+Payload = Union[bytes, List[schemas.UserSchema]]
+
+
+def users_payload(
+    rows: Sequence[RowMapping], route: str, fields: Fields = None
+) -> Payload:
+    """Тело ответа со списком без привязки к запросу: байты JSON или модели,
+    которые сериализует FastAPI. Одно тело можно отдать нескольким запросам."""
+    serializer = serializer_for(route)
+    if serializer == "model" and fields is None:
+        return [schemas.UserSchema(**row) for row in rows]
+    return dump_users(rows, serializer, fields)
+
+
+def payload_response(
+    payload: Payload, response: Response = None
+) -> Union[Response, List[schemas.UserSchema]]:
+    if isinstance(payload, bytes):
+        return json_response(payload, response)
+    return payload
+
+
+def users_response(
+    rows: Sequence[RowMapping],
+    route: str,
+    response: Response = None,
+    fields: Fields = None,
+) -> Union[Response, List[schemas.UserSchema]]:
+    return payload_response(users_payload(rows, route, fields), response)
+
+
+def user_response(
+    row: RowMapping,
+    route: str,
+    response: Response = None,
+    fields: Fields = None,
+) -> Union[Response, schemas.UserSchema]:
+    serializer = serializer_for(route)
+    if serializer == "model" and fields is None:
+        return schemas.UserSchema(**row)
+    return json_response(dump_user(row, serializer, fields), response)
+
+
+def user_batch_response(
+    rows: Sequence[RowMapping], missing: List[int], route: str
+) -> Union[Response, schemas.UserBatch]:
+    serializer = serializer_for(route)
+    if serializer == "model":
+        return schemas.UserBatch(
+            users=[schemas.UserSchema(**row) for row in rows], missing=missing
+        )
+    if serializer == "pydantic":
+        batch = schemas.UserBatch.model_validate(
+            {"users": [dict(row) for row in rows], "missing": missing}
+        )
+        return json_response(batch.model_dump_json().encode())
+    return json_response(
+        orjson.dumps({"users": [user_row(row) for row in rows], "missing": missing})
+    )
@@ -0,0 +1,135 @@
+"""Чтение из шардов: scatter-gather и слияние отсортированных результатов.
+
+Запрос выполняется в каждом шарде параллельно (у каждого свой пул чтения),
+а отсортированные ответы шардов сливаются так, чтобы порядок и граница
+страницы совпадали с ответом единой базы.
+"""
+import asyncio
+import heapq
+import itertools
+from typing import (Any, AsyncIterator, Awaitable, Callable, Dict, Iterable,
+                    List, Mapping, Optional, Sequence, Tuple, TypeVar)
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.db import SHARD_COUNT, shard_index, shard_read_session_makers
+from src.services.conditional import Timestamp, table_version
+from src.services.sorted import Sort
+
+T = TypeVar("T")
+Row = Mapping[str, Any]
+
+
+async def scatter(
+    query: Callable[[AsyncSession], Awaitable[T]],
+    shards: Optional[Iterable[int]] = None,
+) -> List[T]:
+    """Выполняет query в сессии чтения каждого шарда (или только shards)."""
+
+    async def run(index: int) -> T:
+        async with shard_read_session_makers[index]() as session:
+            return await query(session)
+
+    indexes = range(SHARD_COUNT) if shards is None else shards
+    return list(await asyncio.gather(*map(run, indexes)))
+
+
+def group_by_shard(user_ids: Iterable[int]) -> Dict[int, List[int]]:
+    groups: Dict[int, List[int]] = {}
+    for user_id in user_ids:
+        groups.setdefault(shard_index(user_id), []).append(user_id)
+    return groups
+
+
+async def sharded_table_version() -> Tuple[int, Timestamp]:
+    """Версия всех шардов для ETag: сумма растёт при любом изменении,
+    время — последнего изменения в любом шарде."""
+    versions = await scatter(table_version)
+    updated = [updated_at for _, updated_at in versions if updated_at is not None]
+    return sum(version for version, _ in versions), max(updated, default=None)
+
+
+EMAIL_OWNER_SQL = text(
+    "SELECT 1 FROM users WHERE lower(email) = lower(:email) AND id != :user_id"
+)
+
+
+async def email_taken(session: AsyncSession, email: str, user_id: int) -> bool:
+    """Занят ли email другим пользователем в каком-либо шарде.
+
+    Вызывается в транзакции записи шарда user_id: строки этого шарда
+    проверяются в ней же, остальные шарды — через их пулы чтения.
+    Уникального индекса на email нет, поэтому проверка выполняется
+    до каждого изменения email.
+    """
+
+    async def exists(shard_session: AsyncSession) -> bool:
+        result = await shard_session.execute(
+            EMAIL_OWNER_SQL, {"email": email, "user_id": user_id}
+        )
+        return result.first() is not None
+
+    own = shard_index(user_id, SHARD_COUNT)
+    if await exists(session):
+        return True
+    return any(await scatter(exists, (i for i in range(SHARD_COUNT) if i != own)))
+
+
+class _Descending:
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return other.value < self.value
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Descending) and self.value == other.value
+
+
+def sort_key(sort: Sort) -> Callable[[Row], Tuple]:
+    """Ключ Python с тем же порядком, что ORDER BY по sort. Строки SQLite
+    сравнивает побайтно в UTF-8, что совпадает с порядком кодовых точек."""
+
+    def key(row: Row) -> Tuple:
+        return tuple(
+            _Descending(row[column]) if descending else row[column]
+            for column, descending in sort
+        )
+
+    return key
+
+
+def merge_sorted(
+    results: Iterable[Sequence[T]],
+    key: Callable[[T], Any],
+    limit: Optional[int] = None,
+) -> List[T]:
+    """Слияние уже отсортированных ответов шардов; первые limit строк."""
+    return list(itertools.islice(heapq.merge(*results, key=key), limit))
+
+
+async def merge_streams(
+    streams: Sequence[AsyncIterator[T]], key: Callable[[T], Any]
+) -> AsyncIterator[T]:
+    """Слияние отсортированных асинхронных потоков строк шардов."""
+    if len(streams) == 1:
+        async for item in streams[0]:
+            yield item
+        return
+    heap = []
+    for index, stream in enumerate(streams):
+        async for item in stream:
+            heap.append((key(item), index, item))
+            break
+    heapq.heapify(heap)
+    while heap:
+        _, index, item = heap[0]
+        yield item
+        async for following in streams[index]:
+            heapq.heapreplace(heap, (key(following), index, following))
+            break
+        else:
+            heapq.heappop(heap)
@@ -0,0 +1,100 @@
+"""Схлопывание одновременных одинаковых чтений (single-flight).
+
+Пока вызов с ключом выполняется, такие же запросы не идут в базу, а ждут
+его результат. Ключ включает версию данных (поколение строки или версию
+таблицы), поэтому запрос, пришедший после изменения, не получит ответ,
+начатый до него.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") == "1"
+# Сколько ожидающий запрос ждёт чужой вызов, прежде чем выполнить свой (секунды).
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "5"))
+
+T = TypeVar("T")
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    # Исключение ведущего вызова может никто не ждать: помечаем его
+    # полученным, чтобы asyncio не писал предупреждение в журнал.
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """Первый вызов с ключом выполняется, остальные ждут его результат.
+
+    Результат (или исключение) получают все ожидающие, поэтому он должен
+    быть неизменяемым: байты ответа, модели, словари только для чтения.
+    Если ведущий вызов отменён (клиент отключился) или не успел за
+    timeout, ожидающий выполняет вызов сам.
+    """
+
+    def __init__(
+        self, timeout: float = SINGLE_FLIGHT_TIMEOUT, enabled: bool = SINGLE_FLIGHT
+    ):
+        self.timeout = timeout
+        self.enabled = enabled
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.collapsed = 0
+        self.timeouts = 0
+
+    async def do(
+        self,
+        key: Hashable,
+        call: Callable[[], Awaitable[T]],
+        timeout: Optional[float] = None,
+    ) -> T:
+        if not self.enabled:
+            return await call()
+        future = self._calls.get(key)
+        if future is None:
+            return await self._lead(key, call)
+        self.collapsed += 1
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future), self.timeout if timeout is None else timeout
+            )
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+        return await call()
+
+    async def _lead(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve)
+        self._calls[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "calls": self.calls,
+            "collapsed": self.collapsed,
+            "timeouts": self.timeouts,
+        }
+
+
+# Отдельный экземпляр на обработчик — отдельные счётчики в /metrics.
+user_flight = SingleFlight()
+list_flight = SingleFlight()
+search_flight = SingleFlight()
@@ -1,22 +1,180 @@
-def sorted_query(sort_by: str):
-    base_query = """
-        SELECT id, username, email, avatar, phone_number, is_active, is_superuser, is_verified
-        FROM users
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Integer, and_, bindparam, func, or_, select, tuple_
+from sqlalchemy.sql import ColumnElement, Select
+
+from src.apps.models import UserTable
+
+USER_COLUMNS = (
+    "id, username, email, avatar, phone_number, is_active, is_superuser, is_verified"
+)
+
+USER_FIELDS = tuple(column.strip() for column in USER_COLUMNS.split(","))
+
+# Записи user_cache хранят также версию строки для ETag и Last-Modified.
+CACHED_COLUMNS = f"{USER_COLUMNS}, version, updated_at"
+CACHED_FIELDS = USER_FIELDS + ("version", "updated_at")
+
+SORT_COLUMNS = ("username", "email", "is_active", "is_superuser", "is_verified")
+
+users_table = UserTable.__table__
+
+# (поле, по убыванию). Последним ключом всегда идёт id, чтобы порядок был
+# однозначным и по нему можно было продолжать выборку курсором.
+SortKey = Tuple[str, bool]
+Sort = Tuple[SortKey, ...]
+
+FILTERS: Dict[str, ColumnElement] = {
+    "username": func.lower(users_table.c.username)
+    == func.lower(bindparam("filter_username")),
+    "active": users_table.c.is_active == bindparam("filter_active"),
+    "superuser": users_table.c.is_superuser == bindparam("filter_superuser"),
+    "verified": users_table.c.is_verified == bindparam("filter_verified"),
+}
+# Столбцы, которые фильтр по равенству делает постоянными в выборке.
+FILTER_COLUMNS = {
+    "active": "is_active",
+    "superuser": "is_superuser",
+    "verified": "is_verified",
+}
+
+
+def filter_conditions(
+    filter_username: Optional[str] = None,
+    filter_active: Optional[bool] = None,
+    filter_superuser: Optional[bool] = None,
+    filter_verified: Optional[bool] = None,
+) -> Tuple[Tuple[str, ...], Dict[str, Any]]:
+    """Возвращает набор применённых фильтров (форму запроса) и их параметры."""
+    values = {
+        "username": filter_username or None,
+        "active": filter_active,
+        "superuser": filter_superuser,
+        "verified": filter_verified,
+    }
+    filters = tuple(name for name in FILTERS if values[name] is not None)
+    parameters = {f"filter_{name}": values[name] for name in filters}
+    return filters, parameters
+
+
+def parse_sort(sort_by: Optional[str]) -> Sort:
+    """Разбирает sort_by вида "username,-email": минус — сортировка по убыванию.
+
+    Если id не указан явно, он добавляется последним ключом в направлении
+    последнего поля, чтобы обход по индексу (поле, rowid) подходил и для
+    сортировки по убыванию.
     """
-    if sort_by:
-        if sort_by == "username":
-            order_by = "ORDER BY username"
-        elif sort_by == "email":
-            order_by = "ORDER BY email"
-        elif sort_by == "is_active":
-            order_by = "ORDER BY is_active"
-        elif sort_by == "is_superuser":
-            order_by = "ORDER BY is_superuser"
-        elif sort_by == "is_verified":
-            order_by = "ORDER BY is_verified"
-        else:
+    sort: List[SortKey] = []
+    for item in (sort_by or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        descending = item.startswith("-")
+        column = item.lstrip("-")
+        if column not in SORT_COLUMNS + ("id",) or column in dict(sort):
             raise ValueError("Invalid sort_by value")
-        sql_query = f"{base_query} {order_by}"
-    else:
-        sql_query = base_query
-    return sql_query
+        sort.append((column, descending))
+        if column == "id":
+            break
+    if not sort or sort[-1][0] != "id":
+        sort.append(("id", sort[-1][1] if sort else False))
+    return tuple(sort)
+
+
+def parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Разбирает fields вида "id,username"; None — все поля.
+
+    Поля возвращаются в порядке USER_FIELDS, чтобы одна и та же выборка
+    давала один ключ кэша запросов независимо от порядка в параметре.
+    """
+    if fields is None:
+        return None
+    requested = {item.strip() for item in fields.split(",") if item.strip()}
+    if not requested or not requested <= set(USER_FIELDS):
+        raise ValueError("Invalid fields value")
+    return tuple(field for field in USER_FIELDS if field in requested)
+
+
+def select_fields(
+    fields: Optional[Tuple[str, ...]], sort: Sort = ()
+) -> Tuple[str, ...]:
+    """Столбцы запроса: выбранные поля и ключи сортировки, нужные для курсора."""
+    fields = fields or USER_FIELDS
+    return fields + tuple(column for column, _ in sort if column not in fields)
+
+
+def sort_string(sort: Sort) -> str:
+    return ",".join(
+        f"-{column}" if descending else column for column, descending in sort
+    )
+
+
+def _keyset_clause(sort: Sort) -> ColumnElement:
+    """Условие «строго после курсора» для ключа сортировки.
+
+    При одном направлении у всех полей — сравнение кортежей, которое SQLite
+    сводит к поиску по индексу; при смешанных направлениях — раскрытая форма
+    (a > :a) OR (a = :a AND b < :b) OR ...
+    """
+    columns = [users_table.c[column] for column, _ in sort]
+    cursors = [bindparam(f"cursor_{column}") for column, _ in sort]
+    directions = {descending for _, descending in sort}
+    if len(directions) == 1:
+        left = tuple_(*columns) if len(columns) > 1 else columns[0]
+        right = tuple_(*cursors) if len(cursors) > 1 else cursors[0]
+        return left < right if directions.pop() else left > right
+    branches = []
+    for index, (_, descending) in enumerate(sort):
+        equal = [columns[i] == cursors[i] for i in range(index)]
+        after = (
+            columns[index] < cursors[index]
+            if descending
+            else columns[index] > cursors[index]
+        )
+        branches.append(and_(*equal, after))
+    return or_(*branches)
+
+
+@lru_cache(maxsize=512)
+def users_query(
+    filters: Tuple[str, ...] = (),
+    sort: Sort = (("id", False),),
+    keyset: bool = False,
+    limit: bool = False,
+    fields: Optional[Tuple[str, ...]] = None,
+) -> Select:
+    """Запрос списка пользователей для формы (фильтры, сортировка, курсор, LIMIT).
+
+    Значения передаются только параметрами, поэтому для одной формы
+    возвращается один и тот же объект: SQLAlchemy берёт скомпилированный
+    запрос из своего кэша, а SQLite — подготовленный запрос из кэша соединения.
+    Если задан набор fields, выбираются только эти поля и ключи сортировки.
+
+    Ключи сортировки по столбцам, постоянным под фильтрами, в ORDER BY и
+    условие курсора не попадают: порядок от них не зависит, а оставшиеся
+    ключи индекс (флаг, поле) отдаёт без временного B-дерева. Их значения
+    по-прежнему выбираются и передаются в курсоре.
+    """
+    statement = select(*(users_table.c[field] for field in select_fields(fields, sort)))
+    fixed = {FILTER_COLUMNS[name] for name in filters if name in FILTER_COLUMNS}
+    sort = tuple(key for key in sort if key[0] not in fixed)
+    conditions = [FILTERS[name] for name in filters]
+    if keyset:
+        conditions.append(_keyset_clause(sort))
+    if conditions:
+        statement = statement.where(*conditions)
+    statement = statement.order_by(
+        *(
+            users_table.c[column].desc() if descending else users_table.c[column]
+            for column, descending in sort
+        )
+    )
+    if limit:
+        statement = statement.limit(bindparam("limit", type_=Integer))
+    return statement
+
+
+def keyset_parameters(sort: Sort, keys: Sequence[Any], last_id: int) -> Dict[str, Any]:
+    values = list(keys) + [last_id]
+    return {f"cursor_{column}": value for (column, _), value in zip(sort, values)}
@@ -0,0 +1,43 @@
+from typing import Dict, Iterable, Mapping, Tuple
+
+from src.apps import schemas
+
+# users_stats ведут триггеры users_stats_* (см. миграцию d2a7f4c9e1b6):
+# в таблице всегда восемь строк, по одной на сочетание флагов.
+STATS_SQL = """
+    SELECT is_active, is_verified, is_superuser, count
+    FROM users_stats
+    ORDER BY is_active, is_verified, is_superuser
+"""
+
+# Пересчёт с нуля тем же разбиением — для проверки и восстановления счётчиков.
+RECOUNT_SQL = """
+    SELECT is_active, is_verified, is_superuser, COUNT(*) AS count
+    FROM users
+    GROUP BY is_active, is_verified, is_superuser
+"""
+
+
+def user_stats(rows: Iterable[Mapping]) -> schemas.UserStats:
+    """Итоги по строкам users_stats; строки нескольких шардов суммируются."""
+    counts: Dict[Tuple[bool, bool, bool], int] = {}
+    for row in rows:
+        flags = (
+            bool(row["is_active"]),
+            bool(row["is_verified"]),
+            bool(row["is_superuser"]),
+        )
+        counts[flags] = counts.get(flags, 0) + row["count"]
+    groups = [
+        schemas.UserStatsGroup(
+            is_active=active, is_verified=verified, is_superuser=superuser, count=count
+        )
+        for (active, verified, superuser), count in sorted(counts.items())
+    ]
+    return schemas.UserStats(
+        total=sum(group.count for group in groups),
+        active=sum(group.count for group in groups if group.is_active),
+        verified=sum(group.count for group in groups if group.is_verified),
+        superuser=sum(group.count for group in groups if group.is_superuser),
+        groups=groups,
+    )
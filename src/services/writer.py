@@ -0,0 +1,145 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.db import shard_index, shard_session_makers
+from src.logger import logger
+
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "64"))
+WRITE_BATCH_WAIT_MS = float(os.getenv("WRITE_BATCH_WAIT_MS", "1"))
+
+WriteJob = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class WriteScheduler:
+    """Единственный писатель: выполняет изменения пачками в одной транзакции.
+
+    Каждое изменение выполняется в своей точке сохранения (SAVEPOINT),
+    поэтому ошибка одного запроса откатывает только его, а остальные
+    фиксируются общим COMMIT. Результат или исключение возвращается
+    каждому вызывающему через его future после фиксации пачки.
+    """
+
+    def __init__(
+        self,
+        session_maker: sessionmaker,
+        max_batch_size: int = WRITE_BATCH_SIZE,
+        max_wait: float = WRITE_BATCH_WAIT_MS / 1000,
+    ):
+        self._session_maker = session_maker
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.jobs = 0
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, job: WriteJob) -> Any:
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put((job, future))
+        return await future
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "jobs": self.jobs,
+        }
+
+    async def stop(self) -> None:
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+
+    async def _collect_batch(self, first) -> Tuple[List, bool]:
+        batch = [first]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            try:
+                if timeout > 0:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                else:
+                    item = self._queue.get_nowait()
+            except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch, stopping = await self._collect_batch(first)
+            self.batches += 1
+            self.jobs += len(batch)
+            await self._execute(batch)
+
+    async def _execute(self, batch) -> None:
+        outcomes = []
+        try:
+            async with self._session_maker() as session:
+                for job, future in batch:
+                    if future.done():
+                        continue
+                    try:
+                        async with session.begin_nested():
+                            outcomes.append((future, await job(session), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                await session.commit()
+        except Exception as e:
+            logger.error(f"Error in write batch: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+# Свой писатель на каждый шард: блокировки записи шардов независимы.
+write_schedulers = [
+    WriteScheduler(session_maker) for session_maker in shard_session_makers
+]
+# При SHARD_COUNT=1 — единственный писатель всей базы.
+write_scheduler = write_schedulers[0]
+
+
+def shard_writer(user_id: int) -> WriteScheduler:
+    return write_schedulers[shard_index(user_id)]
+
+
+def write_stats() -> Dict[str, int]:
+    """Сумма stats() писателей всех шардов."""
+    totals: Dict[str, int] = {}
+    for scheduler in write_schedulers:
+        for key, value in scheduler.stats().items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+async def stop_writers() -> None:
+    await asyncio.gather(*(scheduler.stop() for scheduler in write_schedulers))
@@ -0,0 +1,69 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from alembic import command
+from alembic.config import Config
+
+
+@pytest.fixture(scope="session")
+def migrated_template(tmp_path_factory):
+    """База, приведённая миграциями к head один раз за прогон: тесты
+    получают её копии."""
+    database = tmp_path_factory.mktemp("migrated") / "users.sqlite"
+    config = Config()
+    config.set_main_option("script_location", "alembic")
+    config.set_main_option("sqlalchemy.url", f"sqlite:///{database}")
+    command.upgrade(config, "head")
+    return database
+
+
+@pytest.fixture
+def migrated_database(migrated_template, tmp_path):
+    """Фабрика копий мигрированной базы в tmp_path: make(name) -> путь."""
+
+    def make(name="users.sqlite"):
+        database = tmp_path / name
+        shutil.copyfile(migrated_template, database)
+        return database
+
+    return make
+
+
+@pytest.fixture
+def connection(migrated_database):
+    conn = sqlite3.connect(migrated_database(), isolation_level=None)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def insert_user():
+    """Вставка строки users в обход приложения (триггеры срабатывают)."""
+
+    def insert(
+        conn,
+        user_id=None,
+        username=None,
+        email=None,
+        is_active=True,
+        is_superuser=False,
+        is_verified=False,
+    ):
+        if email is None:
+            email = f"{(username or 'user').lower()}{user_id or ''}@example.com"
+        conn.execute(
+            "INSERT INTO users (id, email, username, hashed_password, "
+            "is_active, is_superuser, is_verified) VALUES (?, ?, ?, 'h', ?, ?, ?)",
+            (
+                user_id,
+                email,
+                username or f"user{user_id}",
+                is_active,
+                is_superuser,
+                is_verified,
+            ),
+        )
+
+    return insert
@@ -1,9 +1,22 @@
+import asyncio
 import json
+import sqlite3
 
 import pytest
 from fastapi.testclient import TestClient
+from fastapi_users.password import PasswordHelper
+from passlib.context import CryptContext
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
 
+from src.api import router
+from src.apps.models import UserTable
+from src.db import create_sqlite_engine
 from src.main import app
+from src.services import manager, password, writer
+from src.services.auth import current_user
+from src.services.cache import user_cache
+from src.services.writer import WriteScheduler
 
 client = TestClient(app)
 
@@ -29,3 +42,225 @@ def test_search_users():
     assert response.status_code == 200
     users = response.json()
     assert isinstance(users, list)
+
+
+def test_get_all_users_paginated():
+    expected = [user["id"] for user in client.get("/users/?sort_by=username").json()]
+    collected = []
+    params = {"sort_by": "username", "limit": 2}
+    while True:
+        response = client.get("/users/", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page) <= 2
+        collected.extend(user["id"] for user in page)
+        next_cursor = response.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            break
+        params["cursor"] = next_cursor
+    assert collected == expected
+
+
+def test_get_all_users_invalid_cursor():
+    response = client.get("/users/?limit=2&cursor=not-a-cursor")
+    assert response.status_code == 400
+
+
+def test_export_users():
+    users = client.get("/users/?sort_by=email").json()
+    response = client.get("/users/export?format=ndjson&sort_by=email")
+    assert response.status_code == 200
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert [user["id"] for user in exported] == [user["id"] for user in users]
+
+    response = client.get("/users/export?format=csv")
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0].startswith("id,username,email")
+    assert len(lines) == len(users) + 1
+
+
+def test_search_users_short_query_and_limit():
+    response = client.get("/users/search_user?search_query=an&limit=1")
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+    response = client.get(
+        "/users/search_user?search_query=example.com&include_email=true"
+    )
+    assert response.status_code == 200
+    assert len(response.json()) > 1
+
+
+def test_get_users_batch():
+    response = client.get("/users/batch?ids=2,1&ids=2&ids=999999")
+    assert response.status_code == 200
+    batch = response.json()
+    assert [user["id"] for user in batch["users"]] == [2, 1]
+    assert batch["missing"] == [999999]
+
+    response = client.get("/users/batch?ids=abc")
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def login(monkeypatch):
+    # Быстрая схема вместо bcrypt: стоимость хеша тестам не важна.
+    monkeypatch.setattr(
+        password, "_helper", PasswordHelper(CryptContext(schemes=["pbkdf2_sha256"]))
+    )
+
+    def login_as(user_id, is_superuser=False):
+        user = UserTable(
+            id=user_id,
+            email=f"user{user_id}@example.com",
+            username=f"user{user_id}",
+            hashed_password="",
+            is_active=True,
+            is_superuser=is_superuser,
+            is_verified=True,
+        )
+        app.dependency_overrides[current_user] = lambda: user
+
+    yield login_as
+    app.dependency_overrides.pop(current_user, None)
+
+
+@pytest.fixture
+def scratch_database(migrated_database, insert_user, monkeypatch):
+    """Изменения идут в копию мигрированной базы, а не в applications.sqlite."""
+    database = str(migrated_database())
+    conn = sqlite3.connect(database, isolation_level=None)
+    insert_user(conn, 1, email="existing@example.com")
+    conn.close()
+    engine = create_sqlite_engine(database)
+    read_engine = create_sqlite_engine(database, readonly=True)
+    schedulers = [
+        WriteScheduler(
+            sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        )
+    ]
+    read_session_makers = [
+        sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+    ]
+    for module in (writer, manager, router):
+        monkeypatch.setattr(module, "write_schedulers", schedulers)
+    for module in (manager, router):
+        monkeypatch.setattr(module, "shard_read_session_makers", read_session_makers)
+    # Кэш профилей общий с тестами, читающими applications.sqlite.
+    user_cache.clear()
+    yield database
+    user_cache.clear()
+    asyncio.run(engine.dispose())
+    asyncio.run(read_engine.dispose())
+
+
+def _batch_user(name, email=None):
+    return {
+        "email": email or f"{name}@example.com",
+        "username": name,
+        "password": "password",
+        "is_active": True,
+        "is_superuser": False,
+        "is_verified": False,
+    }
+
+
+def test_create_and_delete_users_batch(login, scratch_database):
+    payload = [
+        _batch_user("batch_first"),
+        _batch_user("batch_duplicate", "Existing@example.com"),
+        _batch_user("batch_second"),
+    ]
+
+    login(1)
+    response = client.post("/users/batch", json=payload)
+    assert response.status_code == 403
+
+    login(1, is_superuser=True)
+    response = client.post("/users/batch", json=payload)
+    assert response.status_code == 200
+    batch = response.json()
+    assert batch["errors"] == [{"index": 1, "detail": "User already exists"}]
+    created = [user["id"] for user in batch["created"]]
+    # В копии базы есть только пользователь 1.
+    assert created == [2, 3]
+    assert [user["username"] for user in batch["created"]] == [
+        "batch_first",
+        "batch_second",
+    ]
+
+    # Не владелец: 403, и ни один пользователь не удалён.
+    login(created[0])
+    response = client.delete("/users/batch", params={"ids": created})
+    assert response.status_code == 403
+    response = client.get("/users/batch", params={"ids": created})
+    assert [user["id"] for user in response.json()["users"]] == created
+
+    login(1, is_superuser=True)
+    response = client.delete("/users/batch", params={"ids": created + [999999]})
+    assert response.status_code == 200
+    assert response.json() == {"deleted": created, "missing": [999999]}
+    response = client.get("/users/batch", params={"ids": created})
+    assert response.json()["missing"] == created
+
+
+def test_conditional_get():
+    response = client.get("/users/1/")
+    etag = response.headers["ETag"]
+    assert response.headers["Last-Modified"].endswith("GMT")
+
+    response = client.get("/users/1/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    # При согласованном сжатии ETag уже слабый (см. CompressionMiddleware).
+    weak = "W/" + etag.removeprefix("W/")
+    response = client.get("/users/1/", headers={"If-None-Match": '"1-0", ' + weak})
+    assert response.status_code == 304
+    response = client.get("/users/1/", headers={"If-None-Match": '"1-0"'})
+    assert response.status_code == 200
+
+    response = client.get("/users/?sort_by=email")
+    headers = {"If-None-Match": response.headers["ETag"]}
+    assert client.get("/users/?sort_by=email", headers=headers).status_code == 304
+    headers = {"If-Modified-Since": response.headers["Last-Modified"]}
+    assert client.get("/users/?sort_by=email", headers=headers).status_code == 304
+
+
+def test_get_users_stats():
+    users = client.get("/users/").json()
+    response = client.get("/users/stats")
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["total"] == len(users)
+    assert stats["active"] == sum(user["is_active"] for user in users)
+    assert len(stats["groups"]) == 8
+
+
+def test_sparse_fields():
+    response = client.get("/users/?fields=username,id&sort_by=email&limit=2")
+    assert response.status_code == 200
+    assert all(set(user) == {"id", "username"} for user in response.json())
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(
+        "/users/", params={"fields": "id", "sort_by": "email", "cursor": cursor}
+    )
+    assert response.status_code == 200
+
+    assert client.get("/users/1/?fields=email").json().keys() == {"email"}
+    response = client.get("/users/search_user?search_query=an&fields=id")
+    assert all(user.keys() == {"id"} for user in response.json())
+
+    assert client.get("/users/?fields=hashed_password").status_code == 400
+    assert client.get("/users/1/?fields=").status_code == 400
+
+
+def test_get_users_changes():
+    response = client.get("/users/changes?since=0&limit=1")
+    assert response.status_code == 200
+    feed = response.json()
+    assert feed["head"] >= feed["last_seq"]
+    assert len(feed["changes"]) <= 1
+    assert client.get("/users/changes?since=-1").status_code == 422
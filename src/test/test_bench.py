@@ -0,0 +1,19 @@
+from src.bench.run import percentile, summarize
+from src.bench.users import iter_users
+
+
+def test_iter_users_is_reproducible():
+    first = list(iter_users(100, "hash", seed=1))
+    assert first == list(iter_users(100, "hash", seed=1))
+    assert [user["id"] for user in first] == list(range(1, 101))
+    assert first[0]["is_superuser"] and not any(u["is_superuser"] for u in first[1:])
+
+
+def test_percentiles():
+    latencies = [value / 1000 for value in range(1, 101)]
+    assert percentile(latencies, 0.5) == 0.05
+    assert percentile(latencies, 0.99) == 0.099
+    summary = summarize(latencies, errors=2, elapsed=2.0)
+    assert summary["throughput"] == 50.0
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]) == (50, 95, 99)
+    assert summary["errors"] == 2
@@ -0,0 +1,92 @@
+import time
+
+from fastapi_users import exceptions
+from sqlalchemy import inspect
+
+from src.apps.models import UserTable
+from src.services.auth import CachedJWTStrategy
+from src.services.cache import LRUCache, invalidate_user
+from src.services.coherence import GenerationTable
+
+
+def test_lru_cache_eviction_and_ttl():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.get(1) == "a"
+    cache.set(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a" and cache.get(3) == "c"
+
+    cache.set(4, "d", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get(4) is None
+    assert cache.stats() == {
+        "size": 1,
+        "hits": 3,
+        "misses": 2,
+        "evictions": 2,
+        "stale": 0,
+    }
+
+
+def test_lru_cache_cross_worker_invalidation(tmp_path):
+    path = str(tmp_path / "cache.gen")
+    worker_a = GenerationTable(path, buckets=16)
+    worker_b = GenerationTable(path, buckets=16)
+    cache = LRUCache(maxsize=10, ttl=60, generations=worker_a)
+    cache.set(1, "profile 1")
+    cache.set(2, "profile 2")
+
+    worker_b.bump(1)
+    assert cache.get(1) is None
+    assert cache.get(2) == "profile 2"
+
+    worker_b.bump()
+    assert cache.get(2) is None
+    assert cache.stats()["stale"] == 2
+    assert worker_a.total() == 2
+
+
+class _UserManager:
+    def __init__(self, user):
+        self.user = user
+        self.calls = 0
+
+    def parse_id(self, value):
+        return int(value)
+
+    async def get(self, user_id):
+        self.calls += 1
+        if user_id != self.user.id:
+            raise exceptions.UserNotExists()
+        return self.user
+
+
+async def test_token_cache_hit_and_invalidation():
+    user = UserTable(
+        id=987654,
+        email="cached@example.com",
+        username="cached",
+        hashed_password="",
+        is_active=True,
+        is_superuser=False,
+        is_verified=False,
+    )
+    manager = _UserManager(user)
+    strategy = CachedJWTStrategy(secret="secret", lifetime_seconds=60)
+    token = await strategy.write_token(user)
+
+    assert await strategy.read_token(token, manager) is user
+    first = await strategy.read_token(token, manager)
+    second = await strategy.read_token(token, manager)
+    assert manager.calls == 1
+    # Из кэша каждый запрос получает свой отсоединённый экземпляр.
+    assert first is not second and inspect(first).detached
+    first.username = "changed"
+    assert second.username == "cached"
+    assert (await strategy.read_token(token, manager)).username == "cached"
+
+    invalidate_user(user.id)
+    await strategy.read_token(token, manager)
+    assert manager.calls == 2
@@ -0,0 +1,72 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.db import create_sqlite_engine
+from src.services import changes
+from src.services.changes import change_events, compact_changes
+
+
+def _changes(conn):
+    return conn.execute("SELECT seq, user_id, op FROM users_changes").fetchall()
+
+
+def test_triggers_log_changes(connection, insert_user):
+    insert_user(connection, 1)
+    insert_user(connection, 2)
+    connection.execute("UPDATE users SET username = 'renamed' WHERE id = 1")
+    connection.execute("DELETE FROM users WHERE id = 2")
+    assert _changes(connection) == [
+        (1, 1, "insert"),
+        (2, 2, "insert"),
+        (3, 1, "update"),
+        (4, 2, "delete"),
+    ]
+
+
+def test_compact_changes(connection, insert_user):
+    for user_id in (1, 2, 3):
+        insert_user(connection, user_id)
+    connection.execute("UPDATE users SET username = 'renamed' WHERE id = 1")
+    connection.execute("DELETE FROM users WHERE id = 2")
+
+    assert compact_changes(connection, retention_days=7) == (2, 0)
+    assert _changes(connection) == [
+        (3, 3, "insert"),
+        (4, 1, "update"),
+        (5, 2, "delete"),
+    ]
+    floor = connection.execute("SELECT seq FROM users_changes_floor").fetchone()
+    assert floor == (0,)
+
+    connection.execute(
+        "UPDATE users_changes SET changed_at = '2000-01-01' WHERE seq < 5"
+    )
+    assert compact_changes(connection, retention_days=7) == (0, 2)
+    assert _changes(connection) == [(5, 2, "delete")]
+    assert connection.execute("SELECT seq FROM users_changes_floor").fetchone() == (4,)
+
+    # Номера не переиспользуются после удаления записей.
+    insert_user(connection, 4)
+    assert _changes(connection)[-1] == (6, 4, "insert")
+
+
+async def test_change_events_release_session(connection, insert_user, monkeypatch):
+    for user_id in range(1, 4):
+        insert_user(connection, user_id)
+    database = connection.execute("PRAGMA database_list").fetchone()[2]
+    engine = create_sqlite_engine(database, readonly=True)
+    monkeypatch.setattr(
+        changes,
+        "shard_read_session_makers",
+        [sessionmaker(engine, class_=AsyncSession)],
+    )
+    events = change_events(since=0)
+    try:
+        # Клиент получил первое событие и не читает дальше: соединение
+        # пула уже возвращено.
+        assert (await events.__anext__()).startswith(b"id: 1\n")
+        assert engine.pool.checkedout() == 0
+        assert (await events.__anext__()).startswith(b"id: 2\n")
+    finally:
+        await events.aclose()
+        await engine.dispose()
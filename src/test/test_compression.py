@@ -0,0 +1,102 @@
+import gzip
+
+import pytest
+import zstandard
+from fastapi import FastAPI, Response
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from src.services.compression import (CompressedCache, CompressionMiddleware,
+                                      choose_encoding)
+
+BODY = b'{"users": [' + b",".join(b'{"id": %d}' % i for i in range(100)) + b"]}"
+
+cache = CompressedCache(max_bytes=1024 * 1024)
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100, cache=cache)
+
+
+@app.get("/list")
+def list_users():
+    return Response(BODY, media_type="application/json", headers={"ETag": '"v1"'})
+
+
+@app.get("/not-modified")
+def not_modified():
+    return Response(status_code=304, headers={"ETag": '"v1"'})
+
+
+@app.get("/small")
+def small():
+    return Response(b'{"id": 1}', media_type="application/json")
+
+
+@app.get("/export")
+def export():
+    return StreamingResponse(iter([BODY, BODY]), media_type="application/x-ndjson")
+
+
+@app.get("/events")
+def events():
+    return StreamingResponse(iter([BODY]), media_type="text/event-stream")
+
+
+client = TestClient(app)
+
+
+def test_choose_encoding():
+    assert choose_encoding("gzip, deflate") == "gzip"
+    assert choose_encoding("gzip;q=0, identity") is None
+    assert choose_encoding("br, gzip") == "br"
+    assert choose_encoding("br;q=0.5, gzip") == "gzip"
+    assert choose_encoding("*") == "zstd"
+    assert choose_encoding("") is None
+
+
+def test_compresses_and_caches_large_body():
+    hits = cache.hits
+    for _ in range(2):
+        response = client.get("/list", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["etag"] == 'W/"v1"'
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.content == BODY
+    assert cache.hits == hits + 1
+    (compressed,) = [body for key, (_, body) in cache._data.items() if "gzip" in key]
+    assert gzip.decompress(compressed) == BODY
+
+    response = client.get("/list", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"v1"'
+
+
+def test_skips_small_and_event_stream():
+    for path in ("/small", "/events"):
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in response.headers
+
+
+def test_not_modified_matches_compressed_validators():
+    response = client.get("/not-modified", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 304
+    assert response.headers["etag"] == 'W/"v1"'
+    assert "Accept-Encoding" in response.headers["vary"]
+
+    response = client.get("/not-modified", headers={"Accept-Encoding": "identity"})
+    assert response.headers["etag"] == '"v1"'
+
+
+def _decode(response):
+    # httpx сам распаковывает gzip и br, но не zstd.
+    if response.headers["content-encoding"] == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress(response.content)
+    return response.content
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_encodings(encoding):
+    for path, expected in (("/list", BODY), ("/export", BODY + BODY)):
+        response = client.get(path, headers={"Accept-Encoding": encoding})
+        assert response.headers["content-encoding"] == encoding
+        assert _decode(response) == expected
+    assert "content-length" not in response.headers
@@ -0,0 +1,58 @@
+import io
+import json
+import sqlite3
+
+import pytest
+
+from src.data.load_sql import import_sharded, import_users, iter_json_array
+
+USERS = [
+    {
+        "id": user_id,
+        "email": f"user{user_id}@example.com",
+        "username": f"user{user_id}",
+        "hashed_password": "hash",
+        "is_active": True,
+    }
+    for user_id in range(1, 6)
+]
+
+
+def test_iter_json_array_small_chunks():
+    payload = json.dumps(USERS, indent=4)
+    assert list(iter_json_array(io.StringIO(payload), chunk_size=3)) == USERS
+
+
+def _users_connection():
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    conn.execute(
+        "CREATE TABLE users (id INTEGER PRIMARY KEY, email, username, "
+        "hashed_password, avatar, phone_number, is_active, is_superuser, is_verified)"
+    )
+    return conn
+
+
+def test_import_users_skip_and_upsert():
+    conn = _users_connection()
+    assert import_users(conn, iter(USERS[:3]), batch_size=2).written == 3
+
+    progress = import_users(conn, iter(USERS), mode="skip", batch_size=2)
+    assert (progress.read, progress.written) == (5, 2)
+
+    renamed = [dict(USERS[0], username="renamed")]
+    assert import_users(conn, iter(renamed), mode="upsert").written == 1
+    assert conn.execute("SELECT username FROM users WHERE id = 1").fetchone() == (
+        "renamed",
+    )
+
+
+def test_import_sharded_routes_by_id():
+    conns = [_users_connection() for _ in range(2)]
+    progress = import_sharded(conns, iter(USERS), batch_size=2)
+    assert (progress.read, progress.written) == (5, 5)
+    for index, conn in enumerate(conns):
+        ids = [row[0] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+        assert ids == [user["id"] for user in USERS if user["id"] % 2 == index]
+
+    with pytest.raises(ValueError):
+        import_sharded(conns, iter([dict(USERS[0], id=None)]))
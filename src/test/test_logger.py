@@ -0,0 +1,44 @@
+import json
+import logging
+
+from src.logger import (ContextFilter, JsonFormatter, NotFoundRateLimitFilter,
+                        request_id_var)
+
+
+def _record(message: str, status_code=None) -> logging.LogRecord:
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, message, None, None)
+    if status_code is not None:
+        record.status_code = status_code
+    return record
+
+
+def test_not_found_rate_limit(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("src.logger.time.monotonic", lambda: now[0])
+    limiter = NotFoundRateLimitFilter(interval=10)
+
+    assert limiter.filter(_record("User not found", 404))
+    assert not limiter.filter(_record("User not found", 404))
+    assert not limiter.filter(_record("User not found", 404))
+    assert limiter.filter(_record("Other message", 404))
+    assert limiter.filter(_record("User not found", 403))
+
+    now[0] += 10
+    record = _record("User not found", 404)
+    assert limiter.filter(record)
+    assert record.getMessage() == "User not found (2 similar suppressed)"
+    assert limiter.suppressed == 2
+
+
+def test_json_formatter_includes_request_context():
+    token = request_id_var.set("abc-123")
+    try:
+        record = _record("User not found", 404)
+        ContextFilter().filter(record)
+    finally:
+        request_id_var.reset(token)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "User not found"
+    assert entry["request_id"] == "abc-123"
+    assert entry["status_code"] == 404
+    assert "latency_ms" not in entry
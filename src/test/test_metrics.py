@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.services.metrics import Histogram, normalize_statement
+
+client = TestClient(app)
+
+
+def test_normalize_statement():
+    assert (
+        normalize_statement(
+            "SELECT *\n  FROM users WHERE id IN (?, ?, ?) AND x = 'a''b'"
+        )
+        == "SELECT * FROM users WHERE id IN (?...) AND x = ?"
+    )
+    assert normalize_statement("SELECT 1 LIMIT 50") == "SELECT ? LIMIT ?"
+
+
+def test_histogram_samples_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency.", ("route",), (0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, route="/")
+    assert histogram.render_samples() == [
+        'latency_seconds_bucket{route="/",le="0.1"} 1',
+        'latency_seconds_bucket{route="/",le="1.0"} 2',
+        'latency_seconds_bucket{route="/",le="+Inf"} 3',
+        'latency_seconds_sum{route="/"} 5.55',
+        'latency_seconds_count{route="/"} 3',
+    ]
+
+
+def test_metrics_endpoint_uses_route_templates():
+    client.get("/users/1/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'http_requests_total{method="GET",route="/users/{id}/",status="200"}'
+        in response.text
+    )
+    assert 'sql_query_duration_seconds_count{engine="read"' in response.text
+    assert response.text.count("# TYPE cache_entries gauge") == 1
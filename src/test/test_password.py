@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+import pytest
+
+from src.services.password import PasswordPool, hash_password
+
+
+def _bcrypt_works() -> bool:
+    try:
+        hash_password("password")
+    except ValueError:
+        return False
+    return True
+
+
+@pytest.fixture(params=["thread", "process"])
+def pool(request):
+    pool = PasswordPool(kind=request.param, size=1)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.skipif(not _bcrypt_works(), reason="bcrypt backend is not usable")
+async def test_hash_and_verify(pool):
+    hashed = await pool.hash("password")
+    assert await pool.verify_and_update("password", hashed) == (True, None)
+    verified, _ = await pool.verify_and_update("wrong", hashed)
+    assert not verified
+    assert pool.stats()["completed"] == 3
+
+
+async def test_queue_depth(pool):
+    calls = [asyncio.ensure_future(pool._run(time.sleep, 0.2)) for _ in range(3)]
+    await asyncio.sleep(0.05)
+    assert pool.stats()["in_flight"] == 3
+    assert pool.stats()["queue_depth"] == 2
+    await asyncio.gather(*calls)
+    assert pool.stats()["queue_depth"] == 0
+    assert pool.stats()["completed"] == 3
+
+
+def test_unknown_kind():
+    with pytest.raises(ValueError):
+        PasswordPool(kind="fork")
@@ -0,0 +1,150 @@
+import itertools
+
+import pytest
+from sqlalchemy.dialects import sqlite
+
+from src.services.sorted import (SORT_COLUMNS, filter_conditions,
+                                 keyset_parameters, parse_sort, users_query)
+
+PAGE_SIZE = 51
+DIALECT = sqlite.dialect()
+
+
+def _compile(statement, parameters):
+    compiled = statement.compile(dialect=DIALECT)
+    values = compiled.construct_params(parameters)
+    return str(compiled), [values[name] for name in compiled.positiontup]
+
+
+FLAGS = ("active", "superuser", "verified")
+SORTS = (None,) + SORT_COLUMNS + tuple(f"-{column}" for column in SORT_COLUMNS)
+
+
+def _query_shape(filter_username, flags, sort_by, with_cursor):
+    filters, parameters = filter_conditions(
+        "anna" if filter_username else None,
+        *(True if flag in flags else None for flag in FLAGS),
+    )
+    sort = parse_sort(sort_by)
+    parameters["limit"] = PAGE_SIZE
+    if with_cursor:
+        keys = ["anna"] * (len(sort) - 1)
+        parameters.update(keyset_parameters(sort, keys, 1))
+    query = users_query(filters, sort, keyset=with_cursor, limit=True)
+    return _compile(query, parameters)
+
+
+def _plan(connection, filter_username, flags, sort_by, with_cursor):
+    sql_query, parameters = _query_shape(filter_username, flags, sort_by, with_cursor)
+    return [
+        row[3]
+        for row in connection.execute(f"EXPLAIN QUERY PLAN {sql_query}", parameters)
+    ]
+
+
+# Формы запроса: (фильтр по имени, фильтры по флагам, sort_by, курсор).
+SHAPES = [
+    (filter_username, (flag,) if flag else (), sort_by, with_cursor)
+    for filter_username, flag, sort_by, with_cursor in itertools.product(
+        [False, True], (None,) + FLAGS, SORTS, [False, True]
+    )
+]
+FLAG_SHAPES = [
+    (False, flags, sort_by, with_cursor)
+    for flags, sort_by, with_cursor in itertools.product(
+        [
+            flags
+            for size in range(2, len(FLAGS) + 1)
+            for flags in itertools.combinations(FLAGS, size)
+        ],
+        SORTS,
+        [False, True],
+    )
+]
+
+
+@pytest.mark.parametrize("filter_username, flags, sort_by, with_cursor", SHAPES)
+def test_users_query_plan(connection, filter_username, flags, sort_by, with_cursor):
+    plan = _plan(connection, filter_username, flags, sort_by, with_cursor)
+
+    # Первая страница без фильтров и сортировки — это обход таблицы по rowid
+    # с LIMIT: он читает ровно одну страницу и индекса не требует.
+    if not (filter_username or flags or sort_by or with_cursor):
+        assert plan == ["SCAN users"]
+        return
+    assert "SCAN users" not in plan, plan
+
+    # Фильтр по имени — это равенство по индексу ix_users_lower_username,
+    # под которым остаются считаные строки; сортировать их во временном
+    # B-дереве дешевле, чем держать ещё по индексу на каждое поле сортировки.
+    if filter_username and any("ix_users_lower_username" in step for step in plan):
+        return
+    assert not any("USE TEMP B-TREE" in step for step in plan), plan
+
+
+@pytest.mark.parametrize("filter_username, flags, sort_by, with_cursor", FLAG_SHAPES)
+def test_users_query_plan_flag_filters(
+    connection, filter_username, flags, sort_by, with_cursor
+):
+    # Ключи по отфильтрованным флагам из сортировки выпадают, поэтому
+    # хватает индексов (флаг, поле), что и для одного фильтра.
+    plan = _plan(connection, filter_username, flags, sort_by, with_cursor)
+    assert not any(step.startswith("SCAN") for step in plan), plan
+    assert not any("USE TEMP B-TREE" in step for step in plan), plan
+
+
+def test_users_indexes_used(connection):
+    """Каждый индекс users нужен хотя бы одной форме запроса."""
+    used = {
+        step.split(" INDEX ")[1].split()[0]
+        for shape in SHAPES + FLAG_SHAPES
+        for step in _plan(connection, *shape)
+        if " INDEX " in step
+    }
+    indexes = {
+        name
+        for name, in connection.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'index' AND tbl_name = 'users' AND sql IS NOT NULL"
+        )
+    }
+    assert indexes == used
+
+
+@pytest.mark.parametrize(
+    "sort_by", ["username", "-email", "is_active,-username", "-is_verified,email,-id"]
+)
+@pytest.mark.parametrize("filter_active", [None, True])
+def test_keyset_pages_match_full_sort(connection, insert_user, sort_by, filter_active):
+    for user_id in range(1, 41):
+        insert_user(
+            connection,
+            user_id,
+            f"user{user_id % 7}",
+            f"u{user_id % 5}@example.com",
+            is_active=user_id % 2,
+            is_verified=user_id % 3 == 0,
+        )
+    filters, filter_parameters = filter_conditions(filter_active=filter_active)
+    sort = parse_sort(sort_by)
+    full_sql, full_parameters = _compile(users_query(filters, sort), filter_parameters)
+    expected = [row[0] for row in connection.execute(full_sql, full_parameters)]
+
+    collected = []
+    keys = None
+    while True:
+        parameters = {"limit": 7, **filter_parameters}
+        if keys is not None:
+            parameters.update(keyset_parameters(sort, keys[:-1], keys[-1]))
+        query = users_query(filters, sort, keyset=keys is not None, limit=True)
+        sql_query, values = _compile(query, parameters)
+        result = connection.execute(sql_query, values)
+        page = result.fetchall()
+        if not page:
+            break
+        columns = [column[0] for column in result.description]
+        collected.extend(row[0] for row in page)
+        last = dict(zip(columns, page[-1]))
+        keys = [last[column] for column, _ in sort]
+    assert collected == expected
+    assert len(expected) == (20 if filter_active else 40)
@@ -0,0 +1,129 @@
+import itertools
+
+import pytest
+
+from src.services.readmodel import ReadModel
+from src.services.sorted import filter_conditions, parse_sort
+
+
+@pytest.fixture
+def connection(connection, insert_user):
+    for user_id, username, active in (
+        (1, "Zed", 1),
+        (2, "anna", 0),
+        (3, "Anna", 1),
+        (4, "bob", 1),
+        (5, "Ёжик", 0),
+    ):
+        insert_user(connection, user_id, username, is_active=active)
+    return connection
+
+
+def _ids(rows):
+    return [row["id"] for row in rows]
+
+
+def test_select_matches_sql_order(connection):
+    model = ReadModel()
+    model.load(connection)
+    assert model.check(connection) == []
+
+    assert _ids(model.select((), {}, parse_sort("username"))) == [3, 1, 2, 4, 5]
+    assert _ids(model.select((), {}, parse_sort("-username"))) == [5, 4, 2, 1, 3]
+    assert _ids(model.select((), {}, parse_sort("username"), None, 2)) == [3, 1]
+    assert _ids(model.select((), {}, parse_sort("username"), (["Zed"], 1), 2)) == [2, 4]
+    assert _ids(model.select((), {}, parse_sort("-username"), (["anna"], 2), None)) == [
+        1,
+        3,
+    ]
+    # Как lower() в SQLite: без учёта регистра только для ASCII.
+    assert _ids(
+        model.select(("username",), {"filter_username": "ANNA"}, parse_sort(None))
+    ) == [2, 3]
+    assert _ids(
+        model.select(("active",), {"filter_active": False}, parse_sort("-id"))
+    ) == [5, 2]
+    assert not model.supports(parse_sort("username,-email"))
+
+
+def _sql_ids(connection, parameters, column, descending):
+    conditions = " AND ".join(
+        f"is_{name[len('filter_'):]} = {int(value)}"
+        for name, value in parameters.items()
+    )
+    direction = " DESC" if descending else ""
+    return [
+        row[0]
+        for row in connection.execute(
+            f"SELECT id FROM users WHERE {conditions or 1} "
+            f"ORDER BY {column}{direction}, id{direction}"
+        )
+    ]
+
+
+def test_select_flag_filters_match_sql(connection, insert_user):
+    for user_id in range(10, 50):
+        insert_user(
+            connection,
+            user_id,
+            f"user{user_id % 7}",
+            is_active=user_id % 2,
+            is_superuser=user_id % 5 == 0,
+            is_verified=user_id % 3 == 0,
+        )
+    model = ReadModel()
+    model.load(connection)
+    # Изменения после загрузки двигают строки и их коды флагов.
+    connection.execute("UPDATE users SET is_superuser = 1 WHERE id IN (11, 12)")
+    connection.execute("UPDATE users SET username = 'aaa', is_active = 0 WHERE id = 13")
+    connection.execute("DELETE FROM users WHERE id IN (15, 20)")
+    model.refresh_from(connection)
+    assert model.check(connection) == []
+
+    for active, superuser, verified in itertools.product((None, True, False), repeat=3):
+        filters, parameters = filter_conditions(None, active, superuser, verified)
+        for sort_by in ("id", "-id", "username", "-is_superuser", "is_verified"):
+            sort = parse_sort(sort_by)
+            column, descending = sort[0]
+            expected = _sql_ids(connection, parameters, column, descending)
+
+            collected = []
+            cursor = None
+            while True:
+                page = model.select(filters, parameters, sort, cursor, 4)
+                if not page:
+                    break
+                collected.extend(_ids(page))
+                cursor = ([page[-1][column]], page[-1]["id"])
+            assert collected == expected, (filters, parameters, sort_by)
+
+
+def test_refresh_from_changes(connection, insert_user):
+    model = ReadModel()
+    model.load(connection)
+    connection.execute("UPDATE users SET username = 'aaron' WHERE id = 4")
+    connection.execute("DELETE FROM users WHERE id = 1")
+    insert_user(connection, 6, "new", "new@example.com", is_superuser=True)
+    model.refresh_from(connection)
+
+    assert model.check(connection) == []
+    assert _ids(model.select((), {}, parse_sort("username"))) == [3, 4, 2, 6, 5]
+    assert (
+        model.version
+        == connection.execute("SELECT version FROM users_version").fetchone()[0]
+    )
+
+
+def test_search(connection):
+    model = ReadModel()
+    model.load(connection)
+    assert _ids(model.search("ANN", include_email=False, limit=10)) == [2, 3]
+    assert _ids(model.search("ann", include_email=False, limit=1)) == [2]
+    assert _ids(model.search("bob4@", include_email=True, limit=10)) == [4]
+    # Как в SQL: LIKE для коротких запросов сворачивает регистр только ASCII,
+    # FTS5 trigram — и кириллицу.
+    assert model.search("ёж", include_email=False, limit=10) == []
+    assert model.search("ёжи", include_email=False, limit=10)[0]["username"] == "Ёжик"
+    connection.execute("UPDATE users SET username = 'zanna' WHERE id = 4")
+    model.refresh_from(connection)
+    assert _ids(model.search("anna", include_email=False, limit=10)) == [2, 3, 4]
@@ -0,0 +1,66 @@
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from src.apps import schemas
+from src.main import app
+from src.services import serialize
+
+client = TestClient(app)
+
+ROWS = [
+    {
+        "id": 1,
+        "username": 'Анна "Ann" \\ O\'Neil',
+        "email": "anna@example.com",
+        "avatar": None,
+        "phone_number": "+7\t900\n \x7f\x00",
+        "is_active": 1,
+        "is_superuser": 0,
+        "is_verified": True,
+    },
+    {
+        "id": 2**40,
+        "username": "🙂 user",
+        "email": "u@example.com",
+        "avatar": "https://example.com/a.png?x=1&y=<2>",
+        "phone_number": None,
+        "is_active": 0,
+        "is_superuser": 1,
+        "is_verified": 0,
+    },
+]
+
+
+def _fastapi_body(content) -> bytes:
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+@pytest.mark.parametrize("serializer", ["orjson", "pydantic"])
+def test_dump_users_matches_fastapi(serializer):
+    expected = _fastapi_body([schemas.UserSchema(**row) for row in ROWS])
+    assert serialize.dump_users(ROWS, serializer) == expected
+    assert serialize.dump_user(ROWS[0], serializer) == _fastapi_body(
+        schemas.UserSchema(**ROWS[0])
+    )
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/users/?sort_by=username",
+        "/users/?limit=2",
+        "/users/1/",
+        "/users/batch?ids=2,1,999999",
+        "/users/search_user?search_query=an",
+    ],
+)
+def test_routes_return_same_bytes_for_every_serializer(monkeypatch, url):
+    bodies = {}
+    for serializer in serialize.SERIALIZERS:
+        monkeypatch.setattr(serialize, "USER_SERIALIZER", serializer)
+        response = client.get(url)
+        assert response.status_code == 200
+        bodies[serializer] = (response.content, response.headers.get("X-Next-Cursor"))
+    assert bodies["orjson"] == bodies["pydantic"] == bodies["model"]
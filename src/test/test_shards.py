@@ -0,0 +1,128 @@
+import sqlite3
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from src.data.reshard import ReshardError, reshard
+from src.db import create_sqlite_engine, shard_database, shard_index
+from src.services import shards
+from src.services.search import search_key, search_query_sql
+from src.services.shards import email_taken, merge_sorted, sort_key
+from src.services.sorted import parse_sort
+
+
+def _insert_users(insert_user, database, users):
+    conn = sqlite3.connect(database, isolation_level=None)
+    for user_id, email in users:
+        insert_user(conn, user_id, email=email)
+    conn.close()
+
+
+def test_shard_database():
+    assert shard_database(0, 1, "db/app.sqlite") == "db/app.sqlite"
+    assert shard_database(2, 4, "db/app.sqlite") == "db/app.2.sqlite"
+    assert [shard_index(user_id, 3) for user_id in (3, 4, 8)] == [0, 1, 2]
+
+
+def test_merge_sorted_matches_single_order():
+    rows = [
+        {"id": 1, "username": "b", "is_active": True},
+        {"id": 2, "username": "a", "is_active": False},
+        {"id": 3, "username": "b", "is_active": False},
+        {"id": 4, "username": "a", "is_active": True},
+        {"id": 5, "username": "c", "is_active": True},
+    ]
+    for sort_by in ("username", "-username", "is_active,-username", "-id"):
+        sort = parse_sort(sort_by)
+        key = sort_key(sort)
+        expected = sorted(rows, key=key)
+        shards = [
+            sorted((r for r in rows if r["id"] % 2 == i), key=key) for i in (0, 1)
+        ]
+        assert merge_sorted(shards, key) == expected
+        assert merge_sorted(shards, key, limit=2) == expected[:2]
+
+
+def _search(database, search_query, ranked):
+    sql_query, parameters = search_query_sql(search_query, True, 3, ranked=ranked)
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    rows = [dict(row) for row in conn.execute(sql_query, parameters)]
+    conn.close()
+    return rows
+
+
+def test_merge_search_across_shards(migrated_database, insert_user):
+    users = [(user_id, f"user{user_id}@example.com") for user_id in range(1, 8)]
+    single = str(migrated_database("single.sqlite"))
+    _insert_users(insert_user, single, users)
+    paths = [
+        str(migrated_database(shard_database(i, 2, "app.sqlite"))) for i in range(2)
+    ]
+    for index, path in enumerate(paths):
+        _insert_users(
+            insert_user, path, [user for user in users if user[0] % 2 == index]
+        )
+
+    # "user" идёт через FTS, "r1" — через LIKE.
+    for search_query in ("user", "example", "r1"):
+        expected = _search(single, search_query, ranked=False)
+        merged = merge_sorted(
+            [_search(path, search_query, ranked=False) for path in paths],
+            search_key(search_query, ranked=False),
+            limit=3,
+        )
+        assert merged == expected
+        assert [row["id"] for row in expected] == sorted(row["id"] for row in expected)
+    assert "rank" in _search(single, "user", ranked=True)[0]
+
+
+def test_reshard(migrated_database, insert_user):
+    database = str(migrated_database("app.sqlite"))
+    for index in range(2):
+        migrated_database(shard_database(index, 2, "app.sqlite"))
+    _insert_users(
+        insert_user,
+        database,
+        [(user_id, f"user{user_id}@example.com") for user_id in range(1, 6)],
+    )
+
+    assert reshard(database, 1, 2) == [2, 3]
+    for index in range(2):
+        shard = sqlite3.connect(shard_database(index, 2, database))
+        ids = [row[0] for row in shard.execute("SELECT id FROM users ORDER BY id")]
+        assert all(user_id % 2 == index for user_id in ids)
+        stats = shard.execute("SELECT SUM(count) FROM users_stats").fetchone()[0]
+        assert stats == len(ids)
+        shard.close()
+
+    with pytest.raises(ReshardError):
+        reshard(database, 1, 2)
+
+
+async def test_email_taken_across_shards(migrated_database, insert_user, monkeypatch):
+    paths = [
+        str(migrated_database(shard_database(i, 2, "app.sqlite"))) for i in range(2)
+    ]
+    _insert_users(insert_user, paths[0], [(2, "a@example.com"), (4, "d@example.com")])
+    _insert_users(insert_user, paths[1], [(3, "b@example.com")])
+
+    read_engines = [create_sqlite_engine(path, readonly=True) for path in paths]
+    write_engine = create_sqlite_engine(paths[0])
+    monkeypatch.setattr(shards, "SHARD_COUNT", 2)
+    monkeypatch.setattr(
+        shards,
+        "shard_read_session_makers",
+        [sessionmaker(e, class_=AsyncSession) for e in read_engines],
+    )
+    try:
+        async with sessionmaker(write_engine, class_=AsyncSession)() as session:
+            async with session.begin():
+                assert await email_taken(session, "B@example.com", 2)
+                assert await email_taken(session, "d@example.com", 2)
+                assert not await email_taken(session, "a@example.com", 2)
+                assert not await email_taken(session, "c@example.com", 2)
+    finally:
+        for engine in read_engines + [write_engine]:
+            await engine.dispose()
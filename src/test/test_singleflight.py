@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from src.services.singleflight import SingleFlight
+
+
+async def test_concurrent_calls_collapse():
+    flight = SingleFlight(timeout=1)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b"[]"
+
+    results = await asyncio.gather(*(flight.do("key", load) for _ in range(5)))
+    assert results == [b"[]"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "collapsed": 4, "timeouts": 0}
+
+    await flight.do("key", load)
+    assert len(calls) == 2
+
+
+async def test_errors_are_shared():
+    flight = SingleFlight(timeout=1)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        *(flight.do("key", fail) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.calls == 1
+
+
+async def test_follower_runs_own_call_after_timeout_or_cancel():
+    flight = SingleFlight(timeout=0.01)
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(1)
+        return "slow"
+
+    async def fast():
+        return "fast"
+
+    leader = asyncio.ensure_future(flight.do("key", slow))
+    await started.wait()
+    assert await flight.do("key", fast) == "fast"
+    assert flight.timeouts == 1
+
+    follower = asyncio.ensure_future(flight.do("key", fast, timeout=1))
+    await asyncio.sleep(0)
+    leader.cancel()
+    assert await follower == "fast"
+    with pytest.raises(asyncio.CancelledError):
+        await leader
@@ -0,0 +1,26 @@
+from src.data.rebuild_stats import diff_stats, rebuild_stats
+
+
+def test_triggers_keep_stats_exact(connection, insert_user):
+    for i in range(1, 50):
+        insert_user(
+            connection,
+            username=f"user{i}",
+            is_active=i % 3 != 0,
+            is_superuser=i % 7 == 0,
+            is_verified=i % 2 == 0,
+        )
+    connection.execute("UPDATE users SET is_verified = NOT is_verified WHERE id < 20")
+    connection.execute("UPDATE users SET username = 'renamed' WHERE id = 30")
+    connection.execute("DELETE FROM users WHERE id % 5 = 0")
+    assert diff_stats(connection) == []
+    total = connection.execute("SELECT SUM(count) FROM users_stats").fetchone()[0]
+    assert total == connection.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+def test_rebuild_stats_fixes_drift(connection, insert_user):
+    insert_user(connection, username="a")
+    connection.execute("UPDATE users_stats SET count = 7")
+    assert len(diff_stats(connection)) == 8
+    assert len(rebuild_stats(connection)) == 8
+    assert diff_stats(connection) == []